@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+
+class GameCatalog:
+    """
+    The game types a server offers, whether this client has a room handler for each and the options to create them.
+    The server's list is cached on disk per server, so the create room menu opens without asking the server again.
+    The cache is used as is until it is older than the ttl or the server reports a different version, then it is
+    revalidated (a 304 if the list hasn't changed). If the server is slow or down the cached list is used anyway
+    """
+
+    cache_folder = "cache"
+
+    def __init__(self, server_interface, ttl=24 * 60 * 60, timeout=2.0):
+        """
+        :param server_interface: The ServerInterface the catalog is for, its server id must be known
+        :param ttl: Seconds the cached list is trusted without asking the server
+        :param timeout: Seconds to wait for the server before falling back to the cached list
+        """
+        self.server = server_interface
+        self.ttl = ttl
+        self.timeout = timeout
+        self.server_games = None  # The server's reply to /get_games, a list of names or a dict of name -> info
+        self.server_version = None  # The server's version when the list was fetched
+        self.etag = None
+        self.fetched = 0.0  # When the server last confirmed the list, as time.time()
+        self.games = None  # type: list[dict] or None # The menu entries, built from server_games when it changes
+        self.stale = False  # True if the server couldn't be reached to revalidate the list
+
+    @property
+    def path(self):
+        return os.path.join(self.cache_folder, f"games_{self.server.server_id}.json")
+
+    def fresh(self):
+        return self.server_games is not None and time.time() - self.fetched < self.ttl \
+            and self.server_version == self.server.server_version
+
+    def build(self):
+        """
+        Works out each game's compatibility and creation options once, compatible games first
+        :return:
+        """
+        games = []
+        for name in self.server_games:
+            handler = self.server.room_handlers.get(name)
+            info = self.server_games[name] if isinstance(self.server_games, dict) else None
+            if handler is not None:
+                creation_args = handler.creation_args
+            else:
+                creation_args = (info or {}).get("creation_args", {})
+            games.append({"type": name, "compatible": handler is not None, "creation_args": creation_args,
+                          "label": name if handler is not None else f"{name}, Incompatible"})
+        games.sort(key=lambda game: game["compatible"], reverse=True)
+        self.games = games
+
+    def load(self):
+        """
+        Loads the cached list from disk if there is one
+        :return:
+        """
+        try:
+            with open(self.path, "r") as file:
+                cached = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.server_games = cached["games"]
+        self.server_version = cached.get("server_version")
+        self.etag = cached.get("etag")
+        self.fetched = cached.get("fetched", 0.0)
+        self.build()
+
+    def save(self):
+        if not os.path.exists(self.cache_folder):
+            os.mkdir(self.cache_folder)
+        with open(self.path, "w") as file:
+            json.dump({"games": self.server_games, "server_version": self.server_version, "etag": self.etag,
+                       "fetched": self.fetched}, file, indent=4)
+
+    async def fetch(self):
+        """
+        Gets the list from the server, or confirms the cached one is still current
+        :return:
+        """
+        # After a server update the list is downloaded again whatever its ETag
+        revalidate = self.etag is not None and self.server_games is not None \
+            and self.server_version == self.server.server_version
+        headers = {"If-None-Match": self.etag} if revalidate else None
+        async with self.server.sessions.transport.get("/get_games", self.server.user_hash, cookie="hash_id",
+                                                      headers=headers) as response:
+            if response.status == 200:
+                self.server_games = await response.json()
+                self.etag = response.headers.get("ETag")
+                self.build()
+            elif response.status != 304:
+                raise Exception(f"Failed to get games, status code: {response.status}")
+        self.server_version = self.server.server_version
+        self.fetched = time.time()
+        self.stale = False
+        self.save()
+
+    async def get(self):
+        """
+        :return: The menu entries, dicts with the game's type, label, compatibility and creation_args
+        """
+        if self.server_games is None:
+            self.load()
+        if self.fresh():
+            return self.games
+        try:
+            await asyncio.wait_for(self.fetch(), self.timeout)
+        except Exception as e:
+            if self.games is None:
+                raise
+            logging.warning(f"Using the cached game list, the server couldn't be reached: {e!r}")
+            self.stale = True
+        return self.games
@@ -0,0 +1,67 @@
+import json
+
+
+class IdentityPool:
+    """
+    Extra users this client has on a server. The server works out which room a request is for from the user hash, and
+    a user is in one room at a time, so a client in several rooms at once needs a user for each room.
+    The users are kept in servers.json and handed out again once they are free, so the server only ever gets as many
+    as the most rooms this client has had open at once
+    """
+
+    def __init__(self, server_interface, kind, suffix, transport):
+        """
+        :param server_interface: The logged in ServerInterface
+        :param kind: The key the users are kept under in the server's entry in servers.json
+        :param suffix: Added to the user's name to name the extra users, such as "watch" for <user>-watch-1
+        :param transport: The transport to create the users with
+        """
+        self.server = server_interface
+        self.kind = kind
+        self.suffix = suffix
+        self.transport = transport
+        self.in_use = set()  # type: set[str] # The hashes handed out and not released yet
+        self.created = 0  # The highest number used in a user's name, reserved before the user is created
+
+    def saved(self):
+        """
+        :return: The list of user hashes saved for the server, updated in place
+        """
+        server = self.server.servers[self.server.server_id]
+        saved = server.get(self.kind)
+        if isinstance(saved, dict):  # Saved by older clients as room id -> user hash
+            saved = list(saved.values())
+        server[self.kind] = saved = saved or []
+        return saved
+
+    async def acquire(self):
+        """
+        Hands out a user no room is using, creating one if they are all in use
+        :return: The user's hash
+        """
+        saved = self.saved()
+        for user_hash in saved:
+            if user_hash not in self.in_use:
+                self.in_use.add(user_hash)
+                return user_hash
+        # Numbered before the request is sent, so users created at the same time never ask for the same name
+        self.created = max(self.created, len(saved)) + 1
+        name = f"{self.server.user_name}-{self.suffix}-{self.created}"
+        # A GET, but each one creates another user, so it mustn't be retried
+        async with self.transport.get(f"/create_user/{name}", retry=False) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to create user {name}, status code: {response.status}")
+            user_hash = (await response.json())["user_id"]
+        saved.append(user_hash)
+        self.in_use.add(user_hash)
+        with open("servers.json", "w") as file:
+            json.dump(self.server.servers, file, indent=4)
+        return user_hash
+
+    def release(self, user_hash):
+        """
+        Frees a user once its room is closed
+        :param user_hash:
+        :return:
+        """
+        self.in_use.discard(user_hash)
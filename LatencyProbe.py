@@ -0,0 +1,107 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+from game_rooms.RoomTransport import RoomTransport
+
+
+class LatencyProbe:
+    """
+    Measures a server's latency from several requests over one kept-alive connection.
+    The connection is opened by a warm up request that isn't timed, so the samples are round trips rather than
+    connection setup, and they are timed with a monotonic clock so clock adjustments can't skew them
+    """
+
+    path = "/get_server_id"  # Cheap for the server to answer
+
+    def __init__(self, host, port, samples=5, interval=0.05, timeout=2.0):
+        """
+        :param host:
+        :param port:
+        :param samples: How many timed requests to send
+        :param interval: Seconds between requests
+        :param timeout: Seconds before a request counts as lost
+        """
+        self.host = host
+        self.port = port
+        self.samples = samples
+        self.interval = interval
+        self.timeout = timeout
+        self.rtts = []  # type: list[float] # Round trips of the requests that were answered, in ms
+        self.lost = 0
+        self.reply = None  # The server's reply to the warm up request
+
+    @property
+    def min(self):
+        return min(self.rtts) if self.rtts else None
+
+    @property
+    def median(self):
+        return statistics.median(self.rtts) if self.rtts else None
+
+    @property
+    def p95(self):
+        if not self.rtts:
+            return None
+        ordered = sorted(self.rtts)
+        return ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+
+    @property
+    def loss(self):
+        return self.lost / self.samples if self.samples else 0.0
+
+    @property
+    def online(self):
+        return bool(self.rtts)
+
+    def rank(self):
+        """
+        :return: A sort key, servers that answer every request come first, then the lowest typical and worst case
+        latency
+        """
+        if not self.online:
+            return 1, 1.0, float("inf"), float("inf")
+        return 0, self.loss, self.median, self.p95
+
+    def summary(self):
+        if not self.online:
+            return "no reply"
+        text = f"{self.median:.1f}ms (min {self.min:.1f}, p95 {self.p95:.1f})"
+        if self.lost:
+            text += f" {self.loss:.0%} loss"
+        return text
+
+    async def run(self):
+        """
+        Sends the warm up request and then the timed samples
+        :return: self
+        """
+        # One connection, kept open between the samples
+        transport = RoomTransport(self.host, self.port, limit=1, timeout=self.timeout)
+        try:
+            try:
+                async with transport.get(self.path, retry=False) as response:
+                    if response.status == 200:
+                        self.reply = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.lost = self.samples  # Couldn't connect, don't wait for every sample to time out too
+                return self
+            for index in range(self.samples):
+                if index:
+                    await asyncio.sleep(self.interval)
+                start = time.perf_counter()
+                try:
+                    async with transport.get(self.path, retry=False) as response:  # A retry would hide a loss
+                        await response.read()
+                        if response.status != 200:
+                            self.lost += 1
+                            continue
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.lost += 1
+                    continue
+                self.rtts.append((time.perf_counter() - start) * 1000)
+        finally:
+            await transport.close()
+        return self
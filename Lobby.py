@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import math
+
+import keypress
+from rich.console import Console
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
+
+from RoomIndex import RoomIndex
+
+
+class Lobby:
+    """
+    The room list, kept up to date while the user browses it.
+    A background task refreshes the server's room list into ServerInterface.rooms, the lobby only reads that model
+    when it draws, so occupancy and joinability change in place without the list being rebuilt or the cursor moving.
+    The list can be searched by name and filtered, and is shown a page at a time. Servers that page their room list
+    search and filter it themselves and only send the page on screen, otherwise the local RoomIndex does it
+    """
+
+    password_filters = [None, False, True]
+    free_slot_filters = [0, 1, 2]
+
+    def __init__(self, server_interface, console: Console, refresh_interval=2.0, multiselect=False,
+                 show_server=False):
+        """
+        :param server_interface: The logged in ServerInterface, or a ServerPool
+        :param console:
+        :param refresh_interval: Seconds between refreshes of the room list
+        :param multiselect: Let the user mark any number of rooms with space instead of joining one
+        :param show_server: Add a column with the "server" each room's info names, for rooms from many servers
+        """
+        self.server = server_interface
+        self.console = console
+        self.refresh_interval = refresh_interval
+        self.multiselect = multiselect
+        self.show_server = show_server
+        self.selected = 0  # Index into the search results, the cursor
+        self.selected_id = None  # The room under the cursor, followed when rooms above it come and go
+        self.marked = []  # Room ids marked in multiselect mode, in the order they were marked
+        self.action = None  # type: tuple or None # (action, room id) once the user has chosen what to do
+        self.last_error = None
+
+        self.index = RoomIndex(server_interface.rooms)
+        self.query = ""
+        self.searching = False  # Keys are typed into the search while True
+        self.special_key = False  # The next key is an arrow key, its code is also a letter
+        self.filters = {"room_type": None, "password": None, "joinable": None, "free_slots": 0}
+
+        self.paged = None  # True if the server searches and pages the room list, None until it has been asked
+        self.page_offset = 0  # Where the page from the server starts
+        self.page_ids = []  # type: list[str] # The rooms on the page from the server
+        self.total = 0  # How many rooms on the server match
+        self.wake = asyncio.Event()  # Set to fetch a page straight away rather than at the next refresh
+
+    def results(self):
+        """
+        :return: The room ids matching the search, from the local index
+        """
+        return self.index.search(self.query, **self.filters)
+
+    def move_cursor(self, results):
+        """
+        Keeps the cursor on the same room if rooms before it were added or removed, and inside the list
+        :param results: Room ids
+        :return:
+        """
+        if self.selected_id is not None and not (self.selected < len(results)
+                                                 and results[self.selected] == self.selected_id):
+            try:
+                self.selected = results.index(self.selected_id)
+            except ValueError:
+                self.selected_id = None  # Gone or filtered out, don't look for it again every frame
+        self.selected = max(0, min(self.selected, len(results) - 1))
+        self.selected_id = results[self.selected] if results else None
+
+    def page(self):
+        """
+        Works out the page under the cursor
+        :return: (the index of the first room on the page, the room ids on it, how many rooms match)
+        """
+        rows = self.visible_rows()
+        if self.paged:
+            self.selected = max(0, min(self.selected, self.total - 1))
+            offset = self.selected // rows * rows
+            if offset != self.page_offset:
+                self.wake.set()  # Show the old page until the new one arrives
+            page_ids = [room_id for room_id in self.page_ids if room_id in self.server.rooms]
+            index = self.selected - self.page_offset
+            self.selected_id = page_ids[index] if 0 <= index < len(page_ids) else None
+            return self.page_offset, page_ids, self.total
+        results = self.results()
+        self.move_cursor(results)
+        offset = self.selected // rows * rows
+        return offset, results[offset:offset + rows], len(results)
+
+    async def fetch_page(self):
+        """
+        Asks the server for the page under the cursor
+        :return: False if the server doesn't page its room list
+        """
+        rows = self.visible_rows()
+        offset = max(0, self.selected) // rows * rows
+        page = await self.server.get_room_page(offset, rows, self.query, **self.filters)
+        if page is None:
+            return False
+        self.page_ids, self.total = page
+        self.page_offset = offset
+        return True
+
+    async def refresh(self):
+        """
+        Refreshes the room list in the background until the lobby closes
+        :return:
+        """
+        while True:
+            self.wake.clear()
+            try:
+                if self.paged is not False:  # Also asks again if the first load failed before it found out
+                    self.paged = await self.fetch_page()
+                else:
+                    await self.server.get_rooms()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"Failed to refresh rooms: {str(e) or type(e).__name__}"
+                logging.error(self.last_error)
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def visible_rows(self):
+        """
+        :return: How many rooms fit on screen
+        """
+        return max(1, self.console.height - 9)
+
+    def describe_filters(self):
+        room_type = self.filters["room_type"] or "Any"
+        password = {None: "Any", False: "No", True: "Yes"}[self.filters["password"]]
+        joinable = "Only" if self.filters["joinable"] else "Any"
+        free_slots = f"{self.filters['free_slots']}+" if self.filters["free_slots"] else "Any"
+        return f"t: type [{room_type}]  p: password [{password}]  j: joinable [{joinable}]  " \
+               f"f: free slots [{free_slots}]"
+
+    def draw(self):
+        offset, page_ids, total = self.page()
+
+        search = Text(no_wrap=True, overflow="ellipsis")
+        search.append("Search: ", style="bold")
+        search.append(self.query)
+        search.append("_" if self.searching else "  (/ to search)", style="blink" if self.searching else "grey50")
+        search.append("   " + self.describe_filters(), style="grey50")
+
+        table = Table(expand=True, show_lines=False)
+        columns = ["#", "Name", "Type", "Users", "Password", "Joinable"] + (["Server"] if self.show_server else [])
+        for column in columns:
+            table.add_column(column)
+        # Only the rooms on the page are drawn, however many rooms match
+        for index, room_id in enumerate(page_ids, start=offset):
+            room = self.server.rooms[room_id]
+            compatible = room["type"] in self.server.room_handlers
+            number = f"{'*' if room_id in self.marked else ' '}{index + 1}" if self.multiselect else str(index + 1)
+            table.add_row(number, room["name"], room["type"] if compatible else f"{room['type']} (Incompatible)",
+                          f"{len(room['users'])}/{room['max_users']}",
+                          "Yes" if room["password_protected"] else "No",
+                          "[green]Yes[/green]" if room["joinable"] else "[red]No[/red]",
+                          *([room["server"]] if self.show_server else []),
+                          style="black on white" if index == self.selected else None)
+        if not page_ids:
+            empty = "No rooms match the search" if self.query or any(self.filters.values()) else \
+                "No rooms yet, press c to create one"
+            table.add_row("", empty, *[""] * (len(columns) - 2))
+
+        rows = self.visible_rows()
+        pages = max(1, math.ceil(total / rows))
+        if self.multiselect:
+            keys = f"Space: mark ({len(self.marked)} marked), Enter: watch"
+        else:
+            keys = "Enter: join, c: create room"
+        subtitle = f"Page {offset // rows + 1}/{pages} | Up/Down: select, Left/Right: page, {keys}, q: back"
+        if self.last_error is not None:
+            subtitle = f"[red]{self.last_error}[/red]"
+        body = Table.grid(expand=True)
+        body.add_row(search)
+        body.add_row(table)
+        counts = f"{total} matching rooms" if self.paged else f"{total} of {len(self.server.rooms)} rooms"
+        return Panel(body, title=f"{self.server.server_name} - {counts}", subtitle=subtitle)
+
+    def search_changed(self):
+        self.selected = 0
+        self.selected_id = None
+        self.wake.set()
+
+    def cycle_filter(self, name, options):
+        self.filters[name] = options[(options.index(self.filters[name]) + 1) % len(options)]
+        self.search_changed()
+
+    def move(self, rows):
+        self.selected += rows
+        self.selected_id = None  # Moved by the user, the cursor follows the index again
+        if self.paged:
+            self.selected = max(0, min(self.selected, self.total - 1))
+
+    async def handle_key(self, key):
+        if key in (b'\xe0', b'\x00'):  # The first half of an arrow key
+            self.special_key = True
+            return
+        if self.special_key:
+            self.special_key = False
+        elif self.searching:
+            match key:
+                case b'\r' | b'\x1b':
+                    self.searching = False
+                case b'\x08' | b'\x7f':
+                    self.query = self.query[:-1]
+                    self.search_changed()
+                case _ if key.isascii() and key.decode().isprintable():
+                    self.query += key.decode()
+                    self.search_changed()
+            return
+        match key:
+            case b'H':
+                self.move(-1)
+            case b'P':
+                self.move(1)
+            case b'K':
+                self.move(-self.visible_rows())
+            case b'M':
+                self.move(self.visible_rows())
+            case b'/':
+                self.searching = True
+            case b't':
+                self.cycle_filter("room_type", [None] + sorted(self.server.room_handlers))
+            case b'p':
+                self.cycle_filter("password", self.password_filters)
+            case b'j':
+                self.filters["joinable"] = None if self.filters["joinable"] else True
+                self.search_changed()
+            case b'f':
+                self.cycle_filter("free_slots", self.free_slot_filters)
+            case b' ' if self.multiselect:
+                self.page()
+                if self.selected_id in self.marked:
+                    self.marked.remove(self.selected_id)
+                elif self.selected_id is not None:
+                    self.marked.append(self.selected_id)
+            case b'\r':
+                self.page()
+                if self.multiselect:
+                    marked = self.marked or ([self.selected_id] if self.selected_id is not None else [])
+                    if marked:
+                        self.action = ("watch", marked)
+                elif self.selected_id is not None:
+                    self.action = ("join", self.selected_id)
+            case b'c' if not self.multiselect:
+                self.action = ("create", None)
+            case b'q':
+                self.action = ("back", None)
+
+    async def run(self):
+        """
+        Shows the lobby until the user picks something to do
+        :return: ("join", room id), ("watch", room ids), ("create", None) or ("back", None)
+        """
+        self.action = None
+        self.marked = []
+        self.wake = asyncio.Event()  # Each run has its own event loop
+        try:
+            if self.paged is None:
+                # Servers that don't page the room list send the whole list instead, so this loads the rooms either way
+                self.paged = await self.fetch_page()
+            elif self.paged:
+                await self.fetch_page()
+            else:
+                await self.server.get_rooms()
+            self.last_error = None
+        except Exception as e:
+            # Shown in the lobby like a failed refresh, the refresher keeps trying
+            self.last_error = f"Failed to load rooms: {str(e) or type(e).__name__}"
+            logging.error(self.last_error)
+        refresher = asyncio.ensure_future(self.refresh())
+        try:
+            with Live(self.draw(), console=self.console, refresh_per_second=14) as live:
+                while self.action is None:
+                    while keypress.kbhit() and self.action is None:  # Every key pressed since the last frame
+                        await self.handle_key(keypress.getch())
+                    live.update(self.draw())
+                    await asyncio.sleep(1 / 14)
+        finally:
+            refresher.cancel()
+        return self.action
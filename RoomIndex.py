@@ -0,0 +1,99 @@
+import bisect
+
+
+class RoomIndex:
+    """
+    Searches and filters a RoomList without going over every room on each keystroke.
+    Names are kept sorted so prefix matches are a binary search, and substring matches are narrowed down from the
+    previous query's matches while the user keeps typing. Results are cached until the query, the filters or the
+    rooms change
+    """
+
+    def __init__(self, rooms):
+        """
+        :param rooms: The RoomList to index
+        """
+        self.rooms = rooms
+        self.names = []  # type: list[tuple[str, str]] # (lowercase name, room id), sorted
+        self.names_revision = None
+        self.match_query = None
+        self.matches = []  # type: list[tuple[str, str]] # Every (name, room id) containing match_query, sorted
+        self.matched_key = None
+        self.matched = []  # type: list[str] # The room ids _match returned for matched_key
+        self.result_key = None
+        self.results = []  # type: list[str] # Room ids of the last search
+
+    def _refresh_names(self):
+        if self.names_revision != self.rooms.revision:
+            self.names = sorted((room["name"].lower(), room_id) for room_id, room in self.rooms.items())
+            self.names_revision = self.rooms.revision
+            self.match_query = None  # The matches may name rooms that are gone
+            self.matched_key = None
+
+    def _match(self, query):
+        """
+        :param query: A lowercase search
+        :return: The room ids whose name starts with the query followed by those that only contain it
+        """
+        self._refresh_names()
+        if self.matched_key == query:
+            return self.matched
+        if not query:
+            self.matches = self.names
+            self.matched = [room_id for _, room_id in self.names]
+        else:
+            if self.match_query is not None and query.startswith(self.match_query):
+                # Typing another character, only the rooms that matched before can still match
+                candidates = self.matches
+            else:
+                candidates = self.names
+            self.matches = [entry for entry in candidates if query in entry[0]]
+            # The names starting with the query are next to each other in the sorted names
+            start = bisect.bisect_left(self.names, (query,))
+            end = start
+            # Walked rather than searched for, no character is sure to sort after every character that can follow
+            while end < len(self.names) and self.names[end][0].startswith(query):
+                end += 1
+            self.matched = [room_id for _, room_id in self.names[start:end]] + \
+                [room_id for name, room_id in self.matches if not name.startswith(query)]
+        self.match_query = query
+        self.matched_key = query
+        return self.matched
+
+    @staticmethod
+    def filter(room_type=None, password=None, joinable=None, free_slots=0):
+        """
+        Makes the checks for the filters, a filter set to None (or 0 free slots) lets every room through
+        :param room_type: The room type to show
+        :param password: True to show only password protected rooms, False to hide them
+        :param joinable: True to show only joinable rooms, False for only rooms that can't be joined
+        :param free_slots: The fewest free slots a room must have
+        :return: Functions taking a room's info that are all True if the room should be shown
+        """
+        checks = []
+        if room_type is not None:
+            checks.append(lambda room: room["type"] == room_type)
+        if password is not None:
+            checks.append(lambda room: room["password_protected"] == password)
+        if joinable is not None:
+            checks.append(lambda room: room["joinable"] == joinable)
+        if free_slots:
+            checks.append(lambda room: room["max_users"] - len(room["users"]) >= free_slots)
+        return checks
+
+    def search(self, query="", **filters):
+        """
+        :param query: Matched against room names, ignoring case
+        :param filters: See filter
+        :return: The ids of the matching rooms, rooms whose name starts with the query first
+        """
+        query = query.lower()
+        key = (self.rooms.revision, self.rooms.updates, query, tuple(sorted(filters.items())))
+        if key != self.result_key:
+            results = self._match(query)
+            rooms = self.rooms.rooms
+            for check in self.filter(**filters):  # One pass per filter, each over the rooms the last one kept
+                results = [room_id for room_id in results if check(rooms[room_id])]
+            self.results = results
+            self.result_key = key
+        return self.results
@@ -0,0 +1,101 @@
+class RoomList:
+    """
+    The client's copy of the server's room list, keyed by room id.
+    It is synced incrementally: servers that version their room list send only the rooms added, updated and removed
+    since the version the client has, so a refresh costs the same however many rooms the server has.
+    Servers without deltas send the whole list, which replaces the copy (dropping rooms that have closed).
+    Room dicts are updated in place, so views holding on to a room always show its latest state
+    """
+
+    def __init__(self):
+        self.rooms = {}  # type: dict[str, dict] # Room id -> room info, in the order the rooms were first seen
+        self.version = None  # The server's room list version this copy is at, None until the server sends one
+        self.etag = None  # The ETag of the last full list, so an unchanged list isn't downloaded again
+        self.revision = 0  # Bumped whenever rooms are added or removed, for views that cache the room order
+        self.updates = 0  # Bumped whenever a room changes, for views that cache anything filtered on room info
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def __contains__(self, room_id):
+        return room_id in self.rooms
+
+    def __iter__(self):
+        return iter(self.rooms)
+
+    def __getitem__(self, room_id):
+        return self.rooms[room_id]
+
+    def get(self, room_id, default=None):
+        return self.rooms.get(room_id, default)
+
+    def values(self):
+        return self.rooms.values()
+
+    def items(self):
+        return self.rooms.items()
+
+    def _upsert(self, room):
+        """
+        :return: True if the room is new
+        """
+        existing = self.rooms.get(room["room_id"])
+        if existing is None:
+            self.rooms[room["room_id"]] = dict(room)
+            return True
+        if any(existing.get(key) != value for key, value in room.items()):
+            existing.update(room)
+            self.updates += 1
+        return False
+
+    def replace(self, rooms, version=None):
+        """
+        Makes the copy match a full room list
+        :param rooms: Every room on the server
+        :param version: The list's version if the server sent one
+        :return:
+        """
+        changed = False
+        current = set()
+        for room in rooms:
+            changed |= self._upsert(room)
+            current.add(room["room_id"])
+        for room_id in [room_id for room_id in self.rooms if room_id not in current]:
+            del self.rooms[room_id]
+            changed = True
+        self.version = version
+        if changed:
+            self.revision += 1
+
+    def apply_delta(self, delta):
+        """
+        Applies the changes since this copy's version
+        :param delta: A dict with the new version and the added and updated rooms and removed room ids
+        :return:
+        """
+        changed = False
+        for room in delta.get("added", []) + delta.get("updated", []):
+            changed |= self._upsert(room)
+        for room_id in delta.get("removed", []):
+            changed |= self.rooms.pop(room_id, None) is not None
+        self.version = delta["version"]
+        if changed:
+            self.revision += 1
+
+    def merge(self, rooms):
+        """
+        Adds or updates some rooms without touching the others, for rooms the server sent a page at a time
+        :param rooms:
+        :return:
+        """
+        if any([self._upsert(room) for room in rooms]):
+            self.revision += 1
+
+    def by_name(self, name):
+        """
+        :return: The first room with the name or None
+        """
+        for room in self.rooms.values():
+            if room["name"] == name:
+                return room
+        return None
@@ -0,0 +1,133 @@
+import json
+import socket
+import struct
+import threading
+import time
+
+
+class ServerDirectory:
+    """
+    The servers heard from on the network, keyed by server id so a server heard many times (or on many interfaces)
+    is listed once. A server that hasn't been heard from for `ttl` seconds is dropped.
+    It is filled from another thread, views compare `version` to know when to look again
+    """
+
+    def __init__(self, ttl=30.0):
+        """
+        :param ttl: Seconds a server stays listed after it was last heard from
+        """
+        self.ttl = ttl
+        self.servers = {}  # type: dict[str, dict] # Server id -> its info as the server announced it
+        self.last_seen = {}  # type: dict[str, float] # Server id -> time.monotonic() it was last heard from
+        self.version = 0  # Bumped whenever a server is added, changes address or expires
+        self.lock = threading.Lock()
+
+    def update(self, info):
+        """
+        Adds or refreshes a server
+        :param info: The server's announcement, with a single host
+        :return:
+        """
+        with self.lock:
+            existing = self.servers.get(info["server_id"])
+            if existing is None or existing["host"] != info["host"] or existing["port"] != info["port"]:
+                self.servers[info["server_id"]] = info
+                self.version += 1
+            self.last_seen[info["server_id"]] = time.monotonic()
+
+    def prune(self):
+        """
+        Drops the servers that haven't been heard from within the ttl
+        :return:
+        """
+        now = time.monotonic()
+        with self.lock:
+            for server_id in [server_id for server_id, seen in self.last_seen.items() if now - seen > self.ttl]:
+                del self.servers[server_id]
+                del self.last_seen[server_id]
+                self.version += 1
+
+    def snapshot(self):
+        """
+        :return: Server id -> info of the servers heard from recently
+        """
+        self.prune()
+        with self.lock:
+            return dict(self.servers)
+
+
+class BeaconListener(threading.Thread):
+    """
+    Listens for the beacons servers send to the discovery multicast groups, keeping a ServerDirectory up to date
+    while the client runs, so a server that starts after the client shows up without another discovery broadcast.
+    Discovery requests from other clients arrive on the same groups and are ignored
+    """
+
+    groups = ['224.0.0.255', '224.0.1.255', '224.0.255.255', '233.255.255.255', '234.255.255.255']
+
+    def __init__(self, directory: ServerDirectory, port=5007):
+        """
+        :param directory: Where the servers heard from are kept
+        :param port: The discovery port
+        """
+        super().__init__(daemon=True)  # Never keeps the client from exiting
+        self.directory = directory
+        self.port = port
+        self.running = True
+        self.sock = None
+
+    def open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        # A server on the same machine is bound to the discovery port too
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', self.port))
+        for group in self.groups:
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY))
+            except OSError:
+                pass  # Not every group can be joined on every network
+        sock.settimeout(1)  # Wake up now and then to see if the listener has been stopped
+        return sock
+
+    @staticmethod
+    def parse(data, sender):
+        """
+        :param data: A datagram from the discovery port
+        :param sender: The address it came from
+        :return: The server's info with the host it was heard from, or None if it isn't a server's announcement
+        """
+        try:
+            info = json.loads(data.decode())
+        except (UnicodeDecodeError, ValueError):
+            return None  # Such as another client's DISCOVER_GAME_SERVER
+        if not isinstance(info, dict) or "server_id" not in info or "port" not in info:
+            return None
+        # Servers list every address they have, use the one the announcement came from
+        if isinstance(info.get("host"), list) or not info.get("host"):
+            info["host"] = sender[0]
+        info.setdefault("name", info["server_id"])
+        info["online"] = True
+        return info
+
+    def run(self):
+        try:
+            self.sock = self.open_socket()
+        except OSError:
+            return  # The port can't be listened on, discovery at startup still works
+        with self.sock:
+            while self.running:
+                try:
+                    data, sender = self.sock.recvfrom(4096)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                info = self.parse(data, sender)
+                if info is not None:
+                    self.directory.update(info)
+
+    def stop(self):
+        self.running = False
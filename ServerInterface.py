@@ -1,6 +1,5 @@
 import struct
 
-import aiohttp
 from pick import pick
 
 import os
@@ -8,6 +7,10 @@ import json
 import asyncio
 
 from rich.console import Console
+
+from GameCatalog import GameCatalog
+from RoomList import RoomList
+from SessionManager import SessionManager
 try:
     from game_rooms.BaseRoom import BaseRoom
     from RoomOptionHandler import RoomOptionHandler
@@ -33,19 +36,29 @@ class ServerInterface:
     At which point it hands off to the room handler.
     """
 
-    def __init__(self, host, port, console):
+    def __init__(self, host, port, console, login=True):
+        """
+        :param host:
+        :param port:
+        :param console:
+        :param login: Log in straight away, asking the user for a name if this server is new. Without it the caller
+        logs in with connect
+        """
         self.console = console
         self.host = host  # The host of the server
         self.port = port  # The port of the server
         self.server_id = None  # The server id
         self.server_name = None  # The name of the server
+        self.server_version = None  # The server's version if it reports one, cached data is dropped when it changes
         self.user_hash = None  # The user hash is used to identify the user
         self.user_name = None  # The user name is used to display the user name
-        self.rooms = {}  # A dictionary of all the rooms on the server
+        self.rooms = RoomList()  # All the rooms on the server, keyed by room id
+        self.catalog = GameCatalog(self)  # The game types the server offers, cached on disk
 
         if not console:
             self.console = Console()
 
+        self.sessions = SessionManager(self, self.console)  # Every room the user has open, all run at once
         self.room_handlers = {}  # A dictionary of all the room handlers
         for room in BaseRoom.__subclasses__():
             if room.playable:
@@ -55,36 +68,110 @@ class ServerInterface:
                 self.console.print(f"Skipping room handler for {room.__name__}")
 
         self.servers = json.load(open("servers.json", "r"))  # Load the servers from the servers.json file
-        asyncio.run(self.get_server_id())  # Get the server id from the server
+        if login:
+            self.login()
+
+    def login(self):
+        """
+        Logs in to the server, creating a user the first time
+        :return:
+        """
+        self.run(self.get_server_id())  # Get the server id from the server
 
         if self.server_id in self.servers:  # If we've already logged in to this server
-            asyncio.run(self.get_user(self.servers[self.server_id]["user_hash"]))  # Just log in with the user hash
+            self.run(self.get_user(self.servers[self.server_id]["user_hash"]))  # Just log in with the user hash
         else:
             username = self.console.input("Please enter a username: ")  # Ask the user for a username
-            asyncio.run(self.create_user(username))     # Create a new user
-            asyncio.run(self.get_user(self.user_hash))  # Log in with the new user hash
+            self.run(self.create_user(username))     # Create a new user
+            self.run(self.get_user(self.user_hash))  # Log in with the new user hash
 
         self.console.print(f"Logged in as {self.user_name}")
-        # Save the login
-        self.servers.update({self.server_id: {"host": self.host, "port": self.port, "user_hash": self.user_hash,
-                                              'name': self.server_name, "online": None, "known": True}})
+        # Save the login, keeping anything else stored for the server such as spectator identities
+        self.servers.setdefault(self.server_id, {}).update({"host": self.host, "port": self.port,
+                                                            "user_hash": self.user_hash, 'name': self.server_name,
+                                                            "online": None, "known": True})
         json.dump(self.servers, open("servers.json", "w"), indent=4)
 
-        asyncio.run(self.get_rooms())  # Get the rooms from the server
+        self.run(self.get_rooms())  # Get the rooms from the server
+        try:
+            self.run(self.catalog.get())  # Usually straight from the cache, so creating a room doesn't wait on it
+        except Exception as e:
+            self.console.print(f"Failed to get the game list: {e}")
+
+    @staticmethod
+    async def prompt(function, *args):
+        """
+        Asks the user something on a thread, so the open rooms keep syncing while the prompt blocks
+        :param function: A blocking prompt such as console.input or pick
+        :param args: Passed on to the prompt
+        :return: What the prompt returns
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: function(*args))
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine in a new event loop like asyncio.run, closing the pooled connections to the server before the
+        loop ends as they can't be used from another loop
+        :param coroutine:
+        :return: What the coroutine returns
+        """
+        async def run_and_close():
+            try:
+                return await coroutine
+            finally:
+                await self.sessions.transport.close()
+        return asyncio.run(run_and_close())
+
+    async def connect(self):
+        """
+        Logs in with the user saved for this server without asking the user anything, so many servers can be logged in
+        to at once. Fails for servers this client hasn't logged in to before
+        :return:
+        """
+        async with self.sessions.transport.get("/get_server_id") as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get server id: {response.status}")
+            reply = await response.json()
+        self.server_id = reply["server_id"]
+        self.server_name = reply["server_name"]
+        self.server_version = reply.get("version")
+        if self.server_id not in self.servers:
+            raise Exception(f"No user saved for {self.server_name}")
+        user_hash = self.servers[self.server_id]["user_hash"]
+        async with self.sessions.transport.get(f"/login/{user_hash}") as response:
+            if response.status != 200:
+                raise Exception(f"Failed to log in: {response.status}")
+            self.user_name = (await response.json())["username"]
+        self.user_hash = user_hash
+        await self.get_rooms()
+
+    def make_room(self, room_type, user_hash, room_name="Unknown", room_id=None):
+        """
+        Creates the handler for a room, sharing the session manager's connection to the server
+        :param room_type: The room's type, the name of its handler class
+        :param user_hash: The user the room was joined as, from sessions.identity()
+        :param room_name: The name to show for the room
+        :param room_id: The room's id if it is known
+        :return:
+        """
+        room = self.room_handlers[room_type](user_hash, self.host, self.port, self.console, room_name,
+                                             self.sessions.transport)
+        room.room_id = room_id
+        return room
 
     async def get_server_id(self):
         """
         Gets the server id from the server
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://{self.host}:{self.port}/get_server_id") as response:
-                if response.status == 200:  # If the server responded with a 200 OK
-                    json = await response.json()
-                    self.server_id = json["server_id"]  # Get the server id from the response
-                    self.server_name = json["server_name"]  # Get the server name from the response
-                    self.console.print(f"Server ID: {self.server_id}\nServer Name: {self.server_name}")
-                else:
-                    self.console.print(f"Failed to get server id: {response.status}")
+        async with self.sessions.transport.get("/get_server_id") as response:
+            if response.status == 200:  # If the server responded with a 200 OK
+                json = await response.json()
+                self.server_id = json["server_id"]  # Get the server id from the response
+                self.server_name = json["server_name"]  # Get the server name from the response
+                self.server_version = json.get("version")
+                self.console.print(f"Server ID: {self.server_id}\nServer Name: {self.server_name}")
+            else:
+                self.console.print(f"Failed to get server id: {response.status}")
 
     async def create_user(self, username="testUser"):
         """
@@ -92,158 +179,207 @@ class ServerInterface:
         :param username: The username of the new user
         :return: The user hash of the new user
         """
-        async with aiohttp.ClientSession() as session:  # Send a get request to the server for a new user hash
-            async with session.get(f"http://{self.host}:{self.port}/create_user/{username}") as response:
-                reply = await response.json()
-                print(reply)
-                cookie = reply["user_id"]  # Get the user id from the response
-                print(cookie)
-                self.user_hash = cookie
-                return cookie
+        # A GET, but each one creates another user, so it mustn't be retried
+        async with self.sessions.transport.get(f"/create_user/{username}", retry=False) as response:
+            reply = await response.json()
+            print(reply)
+            cookie = reply["user_id"]  # Get the user id from the response
+            print(cookie)
+            self.user_hash = cookie
+            return cookie
 
     async def get_user(self, user_hash):
         """
         Gets the username from the server
         :param user_hash: The user hash to get the username for
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://{self.host}:{self.port}/login/{user_hash}") as response:
-                if response.status == 200:
-                    json = await response.json()
-                    self.user_hash = user_hash
-                    self.user_name = json["username"]
-                else:
-                    print(f"Failed to get user: {response.status}")
-                    # Create a new user
-                    username = self.console.input("Please enter a username: ")
-                    hash = await self.create_user(username)
-                    self.user_hash = hash
-                    self.user_name = username
+        async with self.sessions.transport.get(f"/login/{user_hash}") as response:
+            if response.status == 200:
+                json = await response.json()
+                self.user_hash = user_hash
+                self.user_name = json["username"]
+            elif response.status >= 500:
+                # The server is struggling, not unaware of the user, so keep the saved user for the next try
+                raise Exception(f"Failed to log in, the server replied {response.status}")
+            else:
+                print(f"Failed to get user: {response.status}")
+                # The server doesn't know the saved user, create a new one
+                username = self.console.input("Please enter a username: ")
+                hash = await self.create_user(username)
+                self.user_hash = hash
+                self.user_name = username
 
     async def logout(self):
         """
         Sends a logout request to the server to let it know that the user is no longer connected
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"http://{self.host}:{self.port}/logout",
-                                    cookies={"user_hash": self.user_hash}) as response:
-                if response.status == 200:
-                    print("Logged out")
-                else:
-                    print(f"Failed to logout: {response.status}")
+        async with self.sessions.transport.post("/logout", self.user_hash) as response:
+            if response.status == 200:
+                print("Logged out")
+            else:
+                print(f"Failed to logout: {response.status}")
 
     async def get_rooms(self):
         """
-        Gets all the active rooms from the server
+        Brings the room list up to date. The version we have is sent along, servers that version their room list
+        answer with only the rooms added, updated and removed since then. Other servers send the whole list,
+        unless it hasn't changed since the last download (matched by its ETag)
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://{self.host}:{self.port}/get_rooms",
-                                   cookies={"user_hash": self.user_hash}) as response:
-                if response.status == 200:
-                    rooms = await response.json()
-                    rooms = rooms["rooms"]
-                    for room in rooms:
-                        self.rooms[room["name"]] = room
+        params = {"since": self.rooms.version} if self.rooms.version is not None else None
+        headers = {"If-None-Match": self.rooms.etag} if self.rooms.etag is not None else None
+        # Polled, so it goes over the pooled connections the rooms use
+        async with self.sessions.transport.get("/get_rooms", self.user_hash, params=params,
+                                               headers=headers) as response:
+            if response.status == 304:  # Nothing has changed
+                return
+            if response.status == 200:
+                reply = await response.json()
+                if "rooms" in reply:
+                    # A full list, from a server without deltas or because our version was too old for a delta
+                    self.rooms.etag = response.headers.get("ETag")
+                    self.rooms.replace(reply["rooms"], reply.get("version"))
                 else:
-                    print(f"Failed to get rooms: {response.status}")
+                    self.rooms.apply_delta(reply)
+            else:
+                print(f"Failed to get rooms: {response.status}")
+
+    async def get_room_page(self, offset, limit, query="", room_type=None, password=None, joinable=None,
+                            free_slots=0):
+        """
+        Gets one page of the room list, searched and filtered by the server, from servers that page their room list.
+        The rooms on the page are merged into self.rooms
+        :param offset: How many matching rooms to skip
+        :param limit: The most rooms to send
+        :param query: Matched against room names
+        :param room_type: See RoomIndex.passes for the filters
+        :param password:
+        :param joinable:
+        :param free_slots:
+        :return: (the room ids on the page, how many rooms match), or None if the server doesn't page its room list,
+        in which case the whole list it sent instead has been loaded into self.rooms
+        """
+        params = {"offset": offset, "limit": limit}
+        if query:
+            params["search"] = query
+        if room_type is not None:
+            params["type"] = room_type
+        if password is not None:
+            params["password"] = "true" if password else "false"
+        if joinable is not None:
+            params["joinable"] = "true" if joinable else "false"
+        if free_slots:
+            params["free_slots"] = free_slots
+        async with self.sessions.transport.get("/get_rooms", self.user_hash, params=params) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get rooms: {response.status}")
+            reply = await response.json()
+            if "total" not in reply:  # The server ignored the paging and sent every room
+                self.rooms.etag = response.headers.get("ETag")
+                self.rooms.replace(reply["rooms"], reply.get("version"))
+                return None
+            self.rooms.merge(reply["rooms"])
+            return [room["room_id"] for room in reply["rooms"]], reply["total"]
 
     async def get_save_info(self, room_id):
         """
         Gets the save info for a room
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://{self.host}:{self.port}/room/get_saved_info/{room_id}",
-                                   cookies={"user_hash": self.user_hash}) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    print(f"Failed to get save info: {response.status}")
+        async with self.sessions.transport.get(f"/room/get_saved_info/{room_id}", self.user_hash) as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                print(f"Failed to get save info: {response.status}")
 
     async def load_room(self, room_id):
         """
         Loads information about a room from the server
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"http://{self.host}:{self.port}/room/load_game",
-                                    json={"room_id": room_id},
-                                    cookies={"user_hash": self.user_hash}) as response:
-                if response.status == 200:
-                    info = await response.json()
-                    room_type = info["room_type"]
-                    room_id = info["room_id"]
-                    room = self.room_handlers[room_type](self.user_hash, self.host, self.port, self.console)
-                    await room.main()
-                else:
-                    self.console.print(f"Failed to load room {room_id}, status code: {response.status}")
+        user_hash = await self.sessions.identity()
+        async with self.sessions.transport.post("/room/load_game", user_hash,
+                                                json={"room_id": room_id}) as response:
+            if response.status != 200:
+                self.console.print(f"Failed to load room {room_id}, status code: {response.status}")
+                self.sessions.release(user_hash)
+                return
+            info = await response.json()
+        # Opened once the reply is read, so the room doesn't hold on to the connection the request used
+        room_type = info["room_type"]
+        room_id = info["room_id"]
+        if self.sessions.switch_to(room_id):
+            self.sessions.release(user_hash)
+        else:
+            await self.sessions.open(self.make_room(room_type, user_hash, info.get("name", "Unknown"), room_id))
 
     async def get_valid_rooms(self):
         """
-        Gets all the rooms that the user can join
-        """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://{self.host}:{self.port}/get_games",
-                                   cookies={"hash_id": self.user_hash}) as response:
-                if response.status == 200:
-                    valid_rooms = []
-                    server_rooms = await response.json()
-                    for room in server_rooms:
-                        if room not in self.room_handlers:
-                            valid_rooms.append((room, False))
-                        else:
-                            valid_rooms.append((room, True))
-                    # Sort the incompatible rooms to the bottom
-                    valid_rooms.sort(key=lambda x: x[1], reverse=True)
-                    return valid_rooms
-                else:
-                    self.console.print(f"Failed to get valid rooms, status code: {response.status}")
+        Gets all the room types the server offers, from the game catalog
+        :return: (room type, compatible) pairs, the compatible ones first
+        """
+        return [(game["type"], game["compatible"]) for game in await self.catalog.get()]
 
-    async def join_room(self, room_name):
+    async def join_room(self, room_id):
         """
         Attempts to join a room on the server
-        :param room_name: The name of the room to join
+        :param room_id: The id of the room to join
         """
-        if self.rooms[room_name]["password_protected"]:
-            password = self.console.input("Please enter the password: ")
+        if self.sessions.switch_to(room_id):  # Already open, just bring it to the front
+            return
+        if room_id not in self.rooms:
+            await self.get_rooms()
+            if room_id not in self.rooms:
+                self.console.print(f"Room {room_id} doesn't exist anymore")
+                return
+        room_name = self.rooms[room_id]["name"]
+        if self.rooms[room_id]["password_protected"]:
+            password = await self.prompt(self.console.input, "Please enter the password: ")
         else:
             password = None
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"http://{self.host}:{self.port}/join_room",
-                                    json={"room_id": self.rooms[room_name]["room_id"], "password": password},
-                                    cookies={"hash_id": self.user_hash}) as response:
-                if response.status == 200:
-                    self.console.print(f"Joined room {room_name}!")
-                else:
-                    self.console.print(f"Failed to join room {room_name}, status code: {response.status}")
+        user_hash = await self.sessions.identity()
+        async with self.sessions.transport.post("/join_room", user_hash, cookie="hash_id",
+                                                json={"room_id": room_id, "password": password}) as response:
+            if response.status != 200:
+                self.console.print(f"Failed to join room {room_name}, status code: {response.status}")
+                self.sessions.release(user_hash)
+                return
+            self.console.print(f"Joined room {room_name}!")
 
-        # Get the room type and create an instance of it
-        room_type = self.rooms[room_name]["type"]
-        room = self.room_handlers[room_type](self.user_hash, self.host, self.port, self.console, room_name)
-        await room.main()
+        # Get the room type and create an instance of it, it runs alongside any other open rooms
+        room_type = self.rooms[room_id]["type"]
+        await self.sessions.open(self.make_room(room_type, user_hash, room_name, room_id))
 
     async def create_room(self):
         """
         Creates a new room on the server
         """
-        valid_rooms = await self.get_valid_rooms()
+        try:
+            games = await self.catalog.get()
+        except Exception as e:
+            self.console.print(f"Failed to get the game list: {e}")
+            return
+        if self.catalog.stale:
+            self.console.print("[yellow]The server isn't responding, the game list may be out of date[/yellow]")
 
-        room_name = self.console.input("Please enter a room name: ")
+        room_name = await self.prompt(self.console.input, "Please enter a room name: ")
         # Ask if the room should be password protected
         # Ask what type of room it is
-        room_options = [f"{room}, Incompatible" if not compatible else room for room, compatible in valid_rooms]
-        room_type = pick(room_options, "Please choose a room type:", indicator="=>")[0]
+        _, index = await self.prompt(pick, [game["label"] for game in games], "Please choose a room type:", "=>")
+        game = games[index]
+        if not game["compatible"]:
+            self.console.print(f"This client can't play {game['type']} rooms")
+            return
+        room_type = game["type"]
 
-        settings = RoomOptionHandler(self.console, self.room_handlers[room_type].creation_args)
-        settings.query()
+        settings = RoomOptionHandler(self.console, game["creation_args"])
+        await self.prompt(settings.query)
         settings = settings.get_options()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"http://{self.host}:{self.port}/create_room",
-                                    json={"room_name": room_name, "room_type": room_type,
-                                          "room_config": settings},
-                                    cookies={"hash_id": self.user_hash}) as response:
-                if response.status == 200:
-                    self.console.print(f"Room {room_name} created!")
-                    room = self.room_handlers[room_type](self.user_hash, self.host, self.port, self.console, room_name)
-                    await room.main()
-                else:
-                    self.console.print(f"Failed to create room {room_name}, status code: {response.status}")
+        user_hash = await self.sessions.identity()
+        async with self.sessions.transport.post("/create_room", user_hash, cookie="hash_id",
+                                                json={"room_name": room_name, "room_type": room_type,
+                                                      "room_config": settings}) as response:
+            if response.status != 200:
+                self.console.print(f"Failed to create room {room_name}, status code: {response.status}")
+                self.sessions.release(user_hash)
+                return
+            self.console.print(f"Room {room_name} created!")
+        await self.sessions.open(self.make_room(room_type, user_hash, room_name))
@@ -0,0 +1,153 @@
+import asyncio
+
+import keypress
+from rich.console import Console
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+
+from LatencyProbe import LatencyProbe
+from ServerDirectory import ServerDirectory
+
+
+class ServerMenu:
+    """
+    The server picker, ranked by latency. Servers the beacon listener hears from while the menu is open are added
+    and probed, and servers that move to another address are updated, without another discovery broadcast
+    """
+
+    def __init__(self, console: Console, servers, directory: ServerDirectory, auto_connect=False):
+        """
+        :param console:
+        :param servers: Server id -> info, known and discovered, already probed. Servers added by the menu go in here
+        :param directory: The servers heard from by the beacon listener
+        :param auto_connect: Pick the best server without showing the menu, if there is one
+        """
+        self.console = console
+        self.servers = servers
+        self.directory = directory
+        self.auto_connect = auto_connect
+        self.directory_version = None
+        self.heard = set()  # The servers in the directory at the last look
+        self.probes = {}  # type: dict[str, asyncio.Task] # Server id -> its probe while one is running
+        self.selected = 0
+        self.selected_key = None  # (label, action) under the cursor, followed when probes reorder the servers
+        self.action = None  # type: tuple or None # (action, server id) once the user has chosen
+
+    def sync(self):
+        """
+        Adds the servers heard from since the last look at the directory, probing each one
+        :return:
+        """
+        self.directory.prune()
+        if self.directory.version == self.directory_version:
+            return
+        self.directory_version = self.directory.version
+        announced_servers = self.directory.snapshot()
+        for server_id in self.heard - announced_servers.keys():
+            # Servers only found by their beacons are offline once the beacons stop
+            if "known" not in self.servers[server_id]:
+                self.servers[server_id].update(online=False, rank=(1, 1.0, float("inf"), float("inf")))
+        self.heard = set(announced_servers)
+        for server_id, announced in announced_servers.items():
+            info = self.servers.get(server_id)
+            if info is None:
+                info = self.servers[server_id] = dict(announced, latency="probing...", rank=(1, 1.0, 0, 0))
+            elif (info["host"], info["port"]) == (announced["host"], announced["port"]) and info["online"]:
+                continue
+            else:
+                info.update(host=announced["host"], port=announced["port"], latency="probing...")
+            if server_id not in self.probes:
+                self.probes[server_id] = asyncio.ensure_future(self.probe(server_id))
+
+    async def probe(self, server_id):
+        info = self.servers[server_id]
+        try:
+            probe = await LatencyProbe(info["host"], info["port"]).run()
+        finally:
+            del self.probes[server_id]
+        info.update(online=probe.online, latency=probe.summary(), rank=probe.rank())
+
+    def best(self):
+        """
+        :return: The best responding server this client has logged in to, or None
+        """
+        return next((server_id for server_id, info in self.ranked() if info["online"] and "known" in info), None)
+
+    def ranked(self):
+        return sorted(self.servers.items(), key=lambda item: item[1]["rank"])
+
+    def entries(self):
+        """
+        :return: The menu's rows as (label, status, action, server id), servers best first
+        """
+        entries = []
+        for server_id, info in self.ranked():
+            if not info["online"]:
+                status = "[red]OFFLINE[/red]"
+            elif "known" not in info:
+                status = f"[blue]DISCOVERED[/blue] {info['latency']}"
+            else:
+                status = f"[green]ONLINE[/green] {info['latency']}"
+            address = info["host"] if info["host"].startswith("unix:") else f"{info['host']}:{info['port']}"
+            entries.append((f"{info['name']}@{address}", status, "server", server_id))
+        best = self.best()
+        if best is not None:
+            entries.append((f"Connect to the best server ({self.servers[best]['name']})", "", "server", best))
+        entries.append(("All known servers (merged lobby)", "", "all", None))
+        entries.append(("Manually add a server", "", "manual", None))
+        entries.append(("Exit", "", "exit", None))
+        return entries
+
+    def move_cursor(self, entries):
+        keys = [(label, action) for label, _, action, _ in entries]
+        if self.selected_key in keys:
+            self.selected = keys.index(self.selected_key)
+        self.selected = max(0, min(self.selected, len(entries) - 1))
+        self.selected_key = keys[self.selected]
+
+    def draw(self, entries):
+        table = Table(expand=True, show_header=False, box=None)
+        table.add_column("Server")
+        table.add_column("Status")
+        for index, (label, status, _, _) in enumerate(entries):
+            table.add_row(label, status, style="black on white" if index == self.selected else None)
+        listening = f"{len(self.directory.servers)} heard from on the network"
+        return Panel(table, title="Please choose a server", subtitle=f"{listening} | Up/Down: select, Enter: choose")
+
+    def handle_key(self, key, entries):
+        match key:
+            case b'H':
+                self.selected = max(0, self.selected - 1)
+                self.selected_key = None  # Moved by the user
+            case b'P':
+                self.selected = min(len(entries) - 1, self.selected + 1)
+                self.selected_key = None
+            case b'\r':
+                _, _, action, server_id = entries[self.selected]
+                self.action = (action, server_id)
+
+    async def run(self):
+        """
+        Shows the menu until a choice is made
+        :return: ("server", server id), ("all", None), ("manual", None) or ("exit", None)
+        """
+        self.sync()
+        if self.auto_connect and self.best() is not None:
+            return "server", self.best()
+        self.action = None
+        try:
+            entries = self.entries()
+            with Live(self.draw(entries), console=self.console, refresh_per_second=14) as live:
+                while self.action is None:
+                    self.sync()
+                    entries = self.entries()
+                    self.move_cursor(entries)
+                    while keypress.kbhit() and self.action is None:
+                        self.handle_key(keypress.getch(), entries)
+                    live.update(self.draw(entries))
+                    await asyncio.sleep(1 / 14)
+        finally:
+            for probe in self.probes.values():
+                probe.cancel()
+        return self.action
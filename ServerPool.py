@@ -0,0 +1,204 @@
+import asyncio
+import time
+
+from pick import pick
+from rich.console import Console
+
+from Lobby import Lobby
+from RoomList import RoomList
+from ServerInterface import ServerInterface
+from game_rooms.RoomTransport import ServerUnavailable
+
+
+class ServerPool:
+    """
+    Every online server this client has logged in to before, at once, merged into one lobby.
+    Each server keeps its own ServerInterface, so its own login, connection pool and room sessions. Each one refreshes
+    its room list in its own task with a timeout, so a slow or dead server only goes stale in the lobby while the
+    others carry on. The pool stands in for a ServerInterface to the Lobby: its room list holds every server's rooms,
+    keyed "server id/room id" and labelled with the server and its round trip time, and joining a room goes to the
+    server it is on
+    """
+
+    def __init__(self, servers, console: Console, timeout=3.0, refresh_interval=2.0, directory=None):
+        """
+        :param servers: Server id -> info, as in servers.json with "online" filled in by the status check
+        :param console:
+        :param timeout: Seconds a server gets to log in or send its room list
+        :param refresh_interval: Seconds between refreshes of each server's room list
+        :param directory: The ServerDirectory kept by the beacon listener, known servers heard from later are added
+        """
+        self.console = console
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        # Logging in without asking for a user name needs a user saved for the server
+        self.known = {server_id: info for server_id, info in servers.items() if "user_hash" in info}
+        self.servers = {server_id: info for server_id, info in self.known.items() if info.get("online")}
+        self.directory = directory
+        self.directory_version = None
+        self.connecting = {}  # type: dict[str, asyncio.Task] # Server id -> its login while it is logging in
+        self.interfaces = {}  # type: dict[str, ServerInterface] # Server id -> its logged in interface
+        self.status = {}  # type: dict[str, str or None] # Server id -> what is wrong with it, None if nothing
+        self.rtt = {}  # type: dict[str, float] # Server id -> moving average of its room list round trip in ms
+        self.pollers = {}  # type: dict[str, asyncio.Task] # Server id -> the task refreshing its room list
+        self.rooms = RoomList()  # Every server's rooms, keyed "server id/room id"
+        self.room_handlers = {}
+        self.lobby = Lobby(self, console, refresh_interval, show_server=True)
+
+    @property
+    def server_name(self):
+        responding = sum(1 for server_id in self.interfaces if self.status.get(server_id) is None)
+        return f"All servers ({responding}/{len(self.servers)} responding)"
+
+    async def connect(self, server_id):
+        """
+        Logs in to one server, a server that fails or takes too long is left out
+        :param server_id:
+        :return:
+        """
+        info = self.servers[server_id]
+        interface = ServerInterface(info["host"], info["port"], self.console, login=False)
+        try:
+            await asyncio.wait_for(interface.connect(), self.timeout)
+        except Exception as e:
+            self.status[server_id] = f"Failed to log in: {str(e) or type(e).__name__}"
+            await interface.sessions.transport.close()
+            return
+        self.interfaces[server_id] = interface
+        self.room_handlers = interface.room_handlers
+        self.status[server_id] = None
+
+    async def poll(self, server_id):
+        """
+        Refreshes one server's room list until the pool closes
+        :param server_id:
+        :return:
+        """
+        interface = self.interfaces[server_id]
+        while True:
+            breaker = interface.sessions.transport.breaker
+            if breaker.retry_in() > 0:
+                # The server keeps failing, it isn't polled again until its breaker lets a trial request through
+                self.status[server_id] = breaker.status().lower()
+                await asyncio.sleep(min(self.refresh_interval, breaker.retry_in()))
+                continue
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(interface.get_rooms(), self.timeout)
+                rtt = (time.monotonic() - start) * 1000
+                self.rtt[server_id] = self.rtt[server_id] + (rtt - self.rtt[server_id]) * 0.2 \
+                    if server_id in self.rtt else rtt
+                self.status[server_id] = None
+            except asyncio.TimeoutError:
+                self.status[server_id] = "not responding"
+            except ServerUnavailable:
+                self.status[server_id] = breaker.status().lower()
+            except Exception as e:
+                self.status[server_id] = f"error: {e}"
+            await asyncio.sleep(self.refresh_interval)
+
+    def add_announced(self):
+        """
+        Logs in to the known servers the beacon listener has heard from since the pool started
+        :return:
+        """
+        if self.directory is None or self.directory.version == self.directory_version:
+            return
+        self.directory_version = self.directory.version
+        for server_id, announced in self.directory.snapshot().items():
+            if server_id not in self.known or server_id in self.interfaces or server_id in self.connecting:
+                continue
+            self.servers[server_id] = dict(self.known[server_id], host=announced["host"], port=announced["port"])
+            self.connecting[server_id] = asyncio.ensure_future(self.connect(server_id))
+            self.connecting[server_id].add_done_callback(lambda _, server_id=server_id: self.connecting.pop(server_id))
+
+    def label(self, server_id):
+        name = self.interfaces[server_id].server_name
+        if self.status.get(server_id) is not None:
+            return f"{name} ({self.status[server_id]})"
+        if server_id in self.rtt:
+            return f"{name} {self.rtt[server_id]:.0f}ms"
+        return name
+
+    async def get_rooms(self):
+        """
+        Merges the servers' room lists as they are now. The servers refresh in the background, so this never waits on
+        the network
+        :return:
+        """
+        self.add_announced()
+        loop = asyncio.get_running_loop()
+        for server_id in self.interfaces:
+            poller = self.pollers.get(server_id)
+            if poller is None or poller.done() or poller.get_loop() is not loop:
+                self.pollers[server_id] = asyncio.ensure_future(self.poll(server_id))
+
+        rooms = []
+        for server_id, interface in self.interfaces.items():
+            label = self.label(server_id)
+            for room in interface.rooms.values():
+                rooms.append({**room, "room_id": f"{server_id}/{room['room_id']}", "server": label})
+        self.rooms.replace(rooms)
+
+    async def get_room_page(self, *args, **kwargs):
+        """
+        The servers page their lists separately, so the merged list is always searched by the lobby
+        :return: None
+        """
+        await self.get_rooms()
+        return None
+
+    async def join_room(self, room_key):
+        """
+        Joins a room on the server it is on
+        :param room_key: "server id/room id"
+        :return:
+        """
+        server_id, room_id = room_key.split("/", 1)
+        await self.interfaces[server_id].join_room(room_id)
+
+    async def create_room(self):
+        """
+        Asks which server to create the room on and creates it there
+        :return:
+        """
+        server_ids = list(self.interfaces)
+        options = [self.label(server_id) for server_id in server_ids] + ["Back"]
+        # pick blocks until a server is chosen, so it runs on a thread to keep the room lists refreshing
+        option, index = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: pick(options, "Please choose a server for the room:", indicator="=>"))
+        if option != "Back":
+            await self.interfaces[server_ids[index]].create_room()
+
+    async def logout(self):
+        await asyncio.gather(*(interface.logout() for interface in self.interfaces.values()), return_exceptions=True)
+        for interface in self.interfaces.values():
+            await interface.sessions.transport.close()
+
+    async def run(self):
+        """
+        Logs in to every server and shows the merged lobby until the user backs out of it
+        :return:
+        """
+        with self.console.status(f"[bold green]Logging in to {len(self.servers)} servers...[/bold green]"):
+            await asyncio.gather(*(self.connect(server_id) for server_id in self.servers))
+        for server_id, status in self.status.items():
+            if status is not None:
+                self.console.print(f"[red]{self.servers[server_id]['name']}: {status}[/red]")
+        if not self.interfaces:
+            self.console.print("Couldn't log in to any server")
+            return
+        try:
+            while True:
+                action, room_key = await self.lobby.run()
+                if action == "join":
+                    await self.join_room(room_key)
+                elif action == "create":
+                    await self.create_room()
+                else:
+                    return
+        finally:
+            for task in [*self.pollers.values(), *self.connecting.values()]:
+                task.cancel()
+            for interface in self.interfaces.values():
+                await interface.sessions.transport.close()
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import traceback
+
+import keypress
+from rich.console import Console
+from rich.layout import Layout
+from rich.live import Live
+from rich.text import Text
+
+from IdentityPool import IdentityPool
+from Lobby import Lobby
+from game_rooms.RoomTransport import RoomTransport
+
+
+class RoomSession:
+    """
+    A room the client has joined, it keeps ticking (and syncing with the server) whether or not it is on screen
+    """
+
+    def __init__(self, room):
+        self.room = room
+        self.task = None  # type: asyncio.Task or None
+        self.seen_version = room.state_version  # The room's state version when it was last on screen
+
+    @property
+    def unseen(self):
+        """
+        True if the room has changed since it was last on screen
+        """
+        return self.room.state_version != self.seen_version
+
+
+class SessionManager:
+    """
+    Runs every room the client is in at once. Each room ticks in its own task, so rooms in the background keep
+    polling the server, while the room in the foreground is drawn and gets the keyboard.
+    Switching rooms only changes which room is drawn, nothing is rejoined or downloaded again.
+    The server knows which room a request is for from the user hash, so each open room is in it as a different user:
+    the user's own for the first room, and one of the extra users kept for this server for each room after that
+    """
+
+    def __init__(self, server_interface, console: Console):
+        self.server = server_interface
+        self.console = console
+        self.transport = RoomTransport(server_interface.host, server_interface.port)  # Shared by every room
+        self.identities = IdentityPool(server_interface, "players", "room", self.transport)
+        self.sessions = []  # type: list[RoomSession]
+        self.foreground = 0  # Index of the session on screen
+        self.running = False
+
+        self.layout = Layout()
+        self.layout.split_column(
+            Layout(name="tabs", size=1),
+            Layout(name="room"),
+        )
+
+    @staticmethod
+    async def run_room(session):
+        """
+        Ticks a room until its session is closed
+        :param session:
+        :return:
+        """
+        room = session.room
+        await room.get_board(force=True)
+        session.seen_version = room.state_version  # The first download isn't news
+        loops = 0
+        while True:
+            try:
+                await room.tick(loops)
+            except Exception as e:
+                logging.error(f"Error updating {room.room_name}: {e} {traceback.format_exc()}")
+            loops += 1
+            await asyncio.sleep(1 / room.frame_rate)
+
+    async def identity(self):
+        """
+        Gets a user to join a room as, one no open room is in
+        :return: The user's hash, the user's own if it is free
+        """
+        if all(session.room.user_hash != self.server.user_hash for session in self.sessions):
+            return self.server.user_hash
+        return await self.identities.acquire()
+
+    def release(self, user_hash):
+        """
+        Frees a user from identity() that didn't end up in a room
+        :param user_hash:
+        :return:
+        """
+        self.identities.release(user_hash)
+
+    def start(self, session):
+        session.task = asyncio.ensure_future(self.run_room(session))
+
+    async def open(self, room):
+        """
+        Adds a room and brings it to the front. If the sessions aren't running yet this runs them until the user quits
+        :param room: A room handler created with this manager's transport
+        :return:
+        """
+        session = RoomSession(room)
+        self.sessions.append(session)
+        self.foreground = len(self.sessions) - 1
+        if self.running:
+            self.start(session)
+        else:
+            await self.run()
+
+    def switch_to(self, room_id):
+        """
+        Brings an open room to the front
+        :param room_id:
+        :return: True if the room was open
+        """
+        for index, session in enumerate(self.sessions):
+            if room_id is not None and session.room.room_id == room_id:
+                self.foreground = index
+                return True
+        return False
+
+    async def close_session(self, index):
+        session = self.sessions.pop(index)
+        if session.task is not None:
+            session.task.cancel()
+        await session.room.close()
+        self.identities.release(session.room.user_hash)
+        self.foreground = max(0, min(self.foreground, len(self.sessions) - 1))
+
+    async def join_another(self, live):
+        """
+        Lets the user join or create another room, the open rooms keep syncing while the room list is up
+        :param live: The Live display, stopped while the room list is shown
+        :return:
+        """
+        live.stop()
+        try:
+            action, room_id = await Lobby(self.server, self.console).run()
+            if action == "join":
+                await self.server.join_room(room_id)
+            elif action == "create":
+                await self.server.create_room()
+        finally:
+            live.start()
+
+    def draw_tabs(self):
+        tabs = Text(no_wrap=True, overflow="ellipsis")
+        for index, session in enumerate(self.sessions):
+            if index == self.foreground:
+                style = "black on white"
+            elif session.unseen:
+                style = "bold yellow"
+            else:
+                style = "white"
+            tabs.append(f" {index + 1}:{session.room.room_name}{' *' if session.unseen else ''} ", style=style)
+            tabs.append(" ")
+        if self.transport.breaker.status() is not None:
+            tabs.append(f"{self.transport.breaker.status()} ", style="bold yellow")
+        tabs.append("Tab: next room, n: join a room, x: leave room, q: quit", style="grey50")
+        return tabs
+
+    def draw_ui(self):
+        session = self.sessions[self.foreground]
+        session.seen_version = session.room.state_version
+        self.layout["tabs"].update(self.draw_tabs())
+        self.layout["room"].update(session.room.draw_ui())
+        return self.layout
+
+    async def handle_key(self, key, live):
+        match key:
+            case b'\t':
+                self.foreground = (self.foreground + 1) % len(self.sessions)
+            case b'n':
+                await self.join_another(live)
+            case b'x':
+                await self.close_session(self.foreground)
+            case b'q':
+                self.running = False
+            case _ if key.isdigit() and 0 < int(key) <= len(self.sessions):
+                self.foreground = int(key) - 1
+            case _:
+                await self.sessions[self.foreground].room.handle_key(key)
+
+    async def run(self):
+        """
+        Shows the foreground room and reads the keyboard until the user quits or leaves every room
+        :return:
+        """
+        self.running = True
+        for session in self.sessions:
+            self.start(session)
+        try:
+            with Live(self.draw_ui(), console=self.console, refresh_per_second=14) as live:
+                while self.running and self.sessions:
+                    if keypress.kbhit():
+                        await self.handle_key(keypress.getch(), live)
+                    if self.sessions:
+                        live.update(self.draw_ui())
+                    await asyncio.sleep(1 / 14)
+        finally:
+            self.running = False
+            while self.sessions:
+                await self.close_session(0)
+            await self.transport.close()
@@ -0,0 +1,247 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+
+import aiohttp
+import keypress
+from rich.console import Console
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+
+from IdentityPool import IdentityPool
+from game_rooms.RoomTransport import RoomTransport
+
+
+class SpectatorDashboard:
+    """
+    Watches many rooms at once as a spectator, tiling a compact view of every room on one screen.
+    All the rooms share one transport (so one pool of connections) and one scheduler that polls them a few at a time,
+    spread over the poll interval so the server sees a steady trickle of requests rather than bursts
+    """
+
+    tile_width = 34  # Characters per tile, enough for a chess board with its player names
+    tile_height = 16  # Lines per tile
+
+    def __init__(self, server_interface, room_ids, console: Console, concurrency=8, poll_interval=2.0):
+        """
+        :param server_interface: The logged in ServerInterface, its room list must be loaded
+        :param room_ids: The ids of the rooms to watch
+        :param console:
+        :param concurrency: The most polls in flight at once, also the size of the connection pool
+        :param poll_interval: Seconds between polls of the same room
+        """
+        self.server = server_interface
+        self.room_ids = room_ids
+        self.console = console
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.transport = RoomTransport(server_interface.host, server_interface.port, limit=concurrency)
+        # The server works out which room a request is for from the user hash, so each watched room needs its own
+        # user. They are kept in servers.json and reused, watching again never creates more than are needed at once
+        self.identities = IdentityPool(server_interface, "spectators", "watch", self.transport)
+        self.rooms = []  # Room handlers in the order the rooms were picked
+        self.joined = set()  # Hashes of the users in a room, each leaves its room when the dashboard closes
+        self.loaded = set()  # Indexes of the rooms whose full state has been downloaded
+        self.errors = {}  # Room name -> why it isn't being watched
+        self.page = 0
+        self.running = True
+        self.polls = 0
+        self.poll_latency = 0.0  # Moving average of a poll's duration in seconds
+
+    async def join(self, room_id):
+        """
+        Joins a room as a spectator and creates its room handler on the shared transport. The server only tells rooms
+        apart by the user in them, so a room can't be watched without joining it. A server that doesn't know the
+        spectator flag seats the user as a player if a seat is free, so the join is checked and backed out of then
+        :param room_id:
+        :return: The room handler or None if the room can't be watched
+        """
+        room = self.server.rooms[room_id]
+        room_name = room["name"]
+        handler = self.server.room_handlers.get(room["type"])
+        if handler is None:
+            self.errors[room_name] = f"{room['type']} rooms aren't supported"
+            return None
+        if room["password_protected"]:
+            self.errors[room_name] = "Password protected"
+            return None
+        user_hash = None
+        try:
+            user_hash = await self.identities.acquire()
+            # Logs the user back in if it left a room by logging out the last time it was used
+            async with self.transport.get(f"/login/{user_hash}") as response:
+                if response.status != 200:
+                    self.errors[room_name] = f"Failed to log in, status code: {response.status}"
+                    self.identities.release(user_hash)
+                    return None
+                username = (await response.json())["username"]
+            async with self.transport.post("/join_room", user_hash, cookie="hash_id",
+                                           json={"room_id": room["room_id"], "password": None,
+                                                 "spectator": True}) as response:
+                if response.status != 200:
+                    self.errors[room_name] = f"Failed to join, status code: {response.status}"
+                    self.identities.release(user_hash)
+                    return None
+                try:
+                    reply = await response.json(content_type=None)
+                except ValueError:
+                    reply = None
+            self.joined.add(user_hash)
+            if not await self.is_spectator(user_hash, username, reply):
+                self.errors[room_name] = "The server gave a player's seat instead of a spectator's, left the room"
+                await self.leave(user_hash)
+                return None
+        except Exception as e:
+            self.errors[room_name] = f"Failed to join: {str(e) or type(e).__name__}"
+            if user_hash is not None:
+                await self.leave(user_hash)
+            return None
+        room_handler = handler(user_hash, self.server.host, self.server.port, self.console, room_name, self.transport)
+        room_handler.room_id = room_id
+        room_handler.username = username
+        room_handler.bell_enabled = False
+        return room_handler
+
+    async def is_spectator(self, user_hash, username, reply):
+        """
+        Checks that a join made the user a spectator, from the join's reply if it says so, otherwise from the room's
+        player list
+        :param user_hash:
+        :param username: The user's name, as the player list names the players
+        :param reply: The join's json reply or None
+        :return: False if the user is a player or it can't be told
+        """
+        if isinstance(reply, dict) and "spectator" in reply:
+            return bool(reply["spectator"])
+        async with self.transport.get("/room/has_changed", user_hash) as response:
+            if response.status != 200:
+                return False
+            update = (await response.json() or {}).get("frequent_update")
+        if update is None:
+            return False
+        return all(player["username"] != username for player in update["players"])
+
+    async def leave(self, user_hash):
+        """
+        Leaves the room a user joined and frees the user. The server has no request to leave a room, logging the
+        user out is what takes it out of the room
+        :param user_hash:
+        :return:
+        """
+        try:
+            if user_hash in self.joined:
+                async with self.transport.post("/logout", user_hash) as response:
+                    if response.status != 200:
+                        logging.error(f"Failed to leave a watched room, status code: {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Failed to leave a watched room: {str(e) or type(e).__name__}")
+        finally:
+            self.joined.discard(user_hash)
+            self.identities.release(user_hash)
+
+    async def schedule(self):
+        """
+        The one scheduler for every room, starts each room's poll once it is due with at most `concurrency` polls in
+        flight. The first polls are staggered over the poll interval so the rooms never all poll at once
+        :return:
+        """
+        now = time.monotonic()
+        step = self.poll_interval / max(1, len(self.rooms))
+        due = [(now + index * step, index) for index in range(len(self.rooms))]  # Heap of (due time, room index)
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+
+        async def poll(index):
+            start = time.monotonic()
+            try:
+                await self.rooms[index].get_board(force=index not in self.loaded)
+                self.loaded.add(index)
+            finally:
+                slots.release()
+                self.polls += 1
+                self.poll_latency += (time.monotonic() - start - self.poll_latency) * 0.1
+                heapq.heappush(due, (time.monotonic() + self.poll_interval, index))
+
+        try:
+            while self.running:
+                if not due:  # Every room is being polled
+                    await asyncio.sleep(0.05)
+                    continue
+                delay = due[0][0] - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                _, index = heapq.heappop(due)
+                await slots.acquire()
+                task = asyncio.ensure_future(poll(index))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    def draw(self):
+        """
+        Tiles the rooms on the current page into a grid
+        :return:
+        """
+        columns = max(1, self.console.width // self.tile_width)
+        rows = max(1, (self.console.height - 4) // self.tile_height)
+        per_page = columns * rows
+        pages = max(1, math.ceil(len(self.rooms) / per_page))
+        self.page = min(self.page, pages - 1)
+
+        grid = Table.grid(expand=True)
+        for _ in range(columns):
+            grid.add_column(ratio=1)
+        # Only the rooms on screen are drawn
+        visible = self.rooms[self.page * per_page:(self.page + 1) * per_page]
+        for start in range(0, len(visible), columns):
+            row = [room.compact_view() for room in visible[start:start + columns]]
+            grid.add_row(*row, *[""] * (columns - len(row)))
+        if self.errors:
+            grid.add_row("\n".join(f"[red]{name}: {error}[/red]" for name, error in self.errors.items()))
+
+        return Panel(grid, title=f"{self.server.server_name} - Watching {len(self.rooms)} rooms",
+                     subtitle=f"Page {self.page + 1}/{pages} | {self.polls} polls, "
+                              f"{self.poll_latency * 1000:.0f}ms avg | Left/Right: page, q: quit")
+
+    async def keyboard_thread(self):
+        if keypress.kbhit():
+            key = keypress.getch()
+            match key:
+                case b'K':
+                    self.page = max(0, self.page - 1)
+                case b'M':
+                    self.page += 1  # Clamped to the last page when drawn
+                case b'q':
+                    self.running = False
+
+    async def run(self):
+        """
+        Joins the rooms and shows the dashboard until q is pressed
+        :return:
+        """
+        scheduler = None
+        try:
+            with self.console.status(f"[bold green]Joining {len(self.room_ids)} rooms...[/bold green]"):
+                rooms = await asyncio.gather(*(self.join(room_id) for room_id in self.room_ids))
+            self.rooms = [room for room in rooms if room is not None]
+            scheduler = asyncio.ensure_future(self.schedule())
+            loops = 0
+            with Live(self.draw(), console=self.console, refresh_per_second=4) as live:
+                while self.running:
+                    await self.keyboard_thread()
+                    if loops % 3 == 0:  # Redraw a few times a second, keys are still read every frame
+                        live.update(self.draw())
+                    loops += 1
+                    await asyncio.sleep(1 / 14)
+        finally:
+            self.running = False
+            if scheduler is not None:
+                scheduler.cancel()
+            await asyncio.gather(*(self.leave(user_hash) for user_hash in list(self.joined)))
+            await self.transport.close()
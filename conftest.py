@@ -0,0 +1,51 @@
+# Lets the tests import the client's modules from the repository root however pytest is started
+import contextlib
+import io
+
+import pytest
+from aiohttp import web
+from rich.console import Console
+
+from game_rooms.Chess import Chess
+from game_rooms.RoomTransport import RoomTransport
+
+
+@pytest.fixture
+def chess_room():
+    """
+    A Chess room that is never connected to a server
+    """
+    room = Chess("test", "localhost", 0, Console(file=io.StringIO()))
+    yield room
+    room.analysis.shutdown()
+    room.book.close()
+
+
+@pytest.fixture
+def serve():
+    """
+    Runs a local server for a test, use as `async with serve(routes) as transport:` inside the test's event loop
+    """
+
+    @contextlib.asynccontextmanager
+    async def serve(routes, **transport_args):
+        """
+        :param routes: aiohttp route definitions, such as web.get("/get_rooms", handler)
+        :param transport_args: Passed on to the RoomTransport
+        :return: A RoomTransport connected to the server
+        """
+        app = web.Application()
+        app.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]  # Picked by the OS
+        transport = RoomTransport("127.0.0.1", port, **transport_args)
+        try:
+            yield transport
+        finally:
+            await transport.close()
+            await runner.cleanup()
+
+    return serve
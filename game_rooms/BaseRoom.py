@@ -1,12 +1,35 @@
 from rich.console import Console
 
+from game_rooms.RoomTransport import RoomTransport
+
+
+class ClientRecord:
+    """
+    A player or spectator in a room, kept between updates and updated in place
+    """
+    __slots__ = ("username", "online")
+
+    def __init__(self, username, online):
+        self.username = username
+        self.online = online
+
+    def net_update(self, username, online):
+        self.username = username
+        self.online = online
+
+    def status_str(self):
+        return "[green]Online[/green]" if self.online else "[red]Offline[/red]"
+
 
 class BaseRoom:
     playable = False
 
     creation_args = {}
 
-    def __init__(self, user_hash, server_url, server_port, console: Console, room_name="Unknown"):
+    frame_rate = 14  # Frames per second the session manager ticks the room at
+
+    def __init__(self, user_hash, server_url, server_port, console: Console, room_name="Unknown",
+                 transport: RoomTransport = None):
         self.console = console
         self.room_name = room_name
         self.user_hash = user_hash
@@ -14,6 +37,101 @@ class BaseRoom:
         self.server_port = server_port
         self.players = []
         self.spectators = []
+        # Rooms watched together share one transport, a room on its own gets a transport of its own
+        self.owns_transport = transport is None
+        self.transport = transport if transport is not None else RoomTransport(server_url, server_port)
+        self.bell_enabled = True  # Rings the console bell when the room changes, off when many rooms are shown
+        self.room_id = None  # The room's id if it is known, the server itself tells rooms apart by the user hash
+        self.state_version = 0  # Bumped every time a changed state is downloaded
+        self.network_error = None  # Why the last poll of the server failed, None once one succeeds
+        self.username = None  # This room's user name, the server only names the players, it never says which is us
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends a request to the server as this room's user, use as `async with self.request(...) as resp:`
+        :param method: The HTTP method
+        :param path: The path on the server, starting with a /
+        :param kwargs: Passed on to aiohttp, such as json
+        :return:
+        """
+        return self.transport.request(method, path, self.user_hash, **kwargs)
+
+    async def fetch_username(self):
+        """
+        Looks up this room's user name once, the room's user may be one of the extra users rather than the logged in one
+        :return:
+        """
+        if self.username is not None:
+            return
+        async with self.transport.get(f"/login/{self.user_hash}") as resp:
+            if resp.status == 200:
+                self.username = (await resp.json())["username"]
+
+    def connection_status(self):
+        """
+        :return: Why the room may be out of date, or None while the server is answering
+        """
+        return self.transport.breaker.status() or self.network_error
+
+    def bell(self):
+        if self.bell_enabled:
+            self.console.bell()
 
-    async def main(self):
+    def state_changed(self):
+        """
+        Records that the server sent a new state and rings the bell
+        :return:
+        """
+        self.state_version += 1
+        self.bell()
+
+    @staticmethod
+    def sync_records(records, data):
+        """
+        Updates a list of ClientRecords in place from the server's list of clients
+        :param records: The list of ClientRecords to update
+        :param data: The client dicts from the server
+        :return:
+        """
+        del records[len(data):]
+        for index, client in enumerate(data):
+            if index < len(records):
+                records[index].net_update(client["username"], client["online"])
+            else:
+                records.append(ClientRecord(client["username"], client["online"]))
+
+    async def get_board(self, force=False):
+        """
+        Fetches the room's state from the server, only downloading the full state if it has changed or force is set
+        """
+        raise NotImplementedError
+
+    def compact_view(self):
+        """
+        A small summary of the room for showing many rooms at once
+        :return: A rich renderable
+        """
+        raise NotImplementedError
+
+    def draw_ui(self):
+        """
+        :return: The room's full screen view
+        """
         raise NotImplementedError
+
+    async def tick(self, loops):
+        """
+        Does the room's work for one frame other than drawing and reading keys, such as polling the server.
+        Rooms running in the background keep ticking, so this mustn't depend on the room being shown
+        :param loops: The number of frames so far
+        :return:
+        """
+        if loops % self.frame_rate == 0:
+            await self.get_board()
+
+    async def handle_key(self, key):
+        raise NotImplementedError
+
+    async def close(self):
+        if self.owns_transport:
+            await self.transport.close()
@@ -1,16 +1,18 @@
 import asyncio
-import keypress
-import traceback
+import math
 
 import aiohttp
 
 from game_rooms.BaseRoom import BaseRoom
+from game_rooms.BattleshipBoard import BoardModel, ship_bits
+from game_rooms.BattleshipTargeting import TargetingEngine
+from game_rooms.RoomTransport import ServerUnavailable
 
-from rich.console import Console
+from rich.console import Console, Group
 from rich.layout import Layout
-from rich.live import Live
 from rich.panel import Panel
 from rich.table import Table
+from rich.text import Text
 
 
 class BattleShip(BaseRoom):
@@ -31,10 +33,11 @@ class BattleShip(BaseRoom):
     }
 
     class Ship:
+        __slots__ = ("size", "health", "x", "y", "direction", "sunk", "placed")
 
         def __init__(self, size, sunk, x=None, y=None, direction=None, placed=False):
             self.size = size
-            self.health = [True for _ in range(size)]
+            self.health = 0 if sunk else (1 << size) - 1  # One bit per segment, set while the segment is intact
             self.x = x
             self.y = y
             self.direction = direction
@@ -53,6 +56,10 @@ class BattleShip(BaseRoom):
             return False
 
         def net_update(self, size, sunk, placed, x=None, y=None, direction=None):
+            if sunk:
+                self.health = 0
+            elif size != self.size or self.sunk:
+                self.health = (1 << size) - 1
             self.size = size
             self.sunk = sunk
             self.placed = placed
@@ -60,6 +67,9 @@ class BattleShip(BaseRoom):
             self.y = y
             self.direction = direction
 
+        def health_str(self):
+            return f"{self.health.bit_count()}/{self.size}"
+
         def state_str(self):
             if self.placed:
                 if self.sunk:
@@ -86,13 +96,15 @@ class BattleShip(BaseRoom):
             else:
                 self.direction = "horizontal"
 
-    def __init__(self, user_hash, server_url, server_port, console: Console, room_name="Unknown"):
-        super().__init__(user_hash, server_url, server_port, console, room_name)
+    def __init__(self, user_hash, server_url, server_port, console: Console, room_name="Unknown", transport=None):
+        super().__init__(user_hash, server_url, server_port, console, room_name, transport)
 
         self.player_board = []
         self.player_ships = []
         self.opponent_board = []
         self.opponent_ships = []
+        self.player_model = BoardModel()
+        self.opponent_model = BoardModel()
 
         self.board_size = 10
 
@@ -107,6 +119,17 @@ class BattleShip(BaseRoom):
         self.attack_queued = False
 
         self.placing_ship = None  # The ship that is being placed
+        self.pending_placements = {}  # type: dict[int, tuple] # Ship index -> (x, y, direction) placed locally
+        self.placement_error = None
+        self.move_error = None  # Why the last shot didn't go through
+
+        self.targeting = TargetingEngine()
+        self.show_hint = False
+        self.bot_enabled = False  # Fires the suggested target automatically
+        self.bot_waiting = True  # Set on every state change so the bot fires at most once per state
+        self.suggested_target = None
+
+        self.show_minimap = True  # Shown under boards too big to fit on screen
 
         self.layout = Layout()
         self.layout.split_row(
@@ -128,123 +151,254 @@ class BattleShip(BaseRoom):
             Layout(name="player_info"),
         )
 
-    async def get_board(self, force):
+    async def get_board(self, force=False):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://{self.server_url}:{self.server_port}/room/has_changed",
-                                       cookies={"user_hash": self.user_hash}) as resp:
-                    if resp.status == 200:
-                        json = await resp.json()
-                        if json is None:
-                            raise Exception("Server returned null")
-                        if "frequent_update" in json:
-                            self.players = json["frequent_update"]["players"]
-                            self.spectators = json["frequent_update"]["spectators"]
-                            if force:
-                                self.player_ships = []
-                                self.opponent_ships = []
-                        if json["changed"] or force:
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(f"http://{self.server_url}:{self.server_port}/room/get_state",
-                                                       cookies={"user_hash": self.user_hash}) as resp:
-                                    if resp.status == 200:
-                                        json = await resp.json()
-                                        if json is None:
-                                            raise Exception("Server returned null")
-                                        self.player_board = json["board"]
-                                        self.opponent_board = json["enemy_board"]
-                                        self.state = json["state"]
-                                        self.current_player = json["current_player"]
-                                        self.place_ships = json[
-                                            "allow_place_ships"] if "allow_place_ships" in json else False
-                                        if not self.player_ships:
-                                            self.player_ships = \
-                                                [self.Ship(**ship) for ship in self.player_board["ships"]]
-                                        else:
-                                            for i, ship in enumerate(self.player_ships):
-                                                ship.net_update(**self.player_board["ships"][i])
-                                        if not self.opponent_ships:
-                                            self.opponent_ships = \
-                                                [self.Ship(**ship) for ship in self.opponent_board["ships"]]
-                                        else:
-                                            for i, ship in enumerate(self.opponent_ships):
-                                                ship.net_update(**self.opponent_board["ships"][i])
-                                        self.board_size = json["board_size"]
-                                        self.console.bell()
-        except Exception as e:
-            self.console.print(f"Board Update Error: {e}\n{traceback.format_exc()}")
+            await self.fetch_username()  # The server only says whose turn it is by name
+            async with self.request("GET", "/room/has_changed") as resp:
+                if resp.status == 200:
+                    json = await resp.json()
+                    if json is None:
+                        raise ValueError("Server returned null")
+                    if "frequent_update" in json:
+                        self.sync_records(self.players, json["frequent_update"]["players"])
+                        self.sync_records(self.spectators, json["frequent_update"]["spectators"])
+                    if json["changed"] or force:
+                        async with self.request("GET", "/room/get_state") as resp:
+                            if resp.status == 200:
+                                json = await resp.json()
+                                if json is None:
+                                    raise ValueError("Server returned null")
+                                self.player_board = json["board"]
+                                self.opponent_board = json["enemy_board"]
+                                self.player_model.update(self.player_board)
+                                self.opponent_model.update(self.opponent_board)
+                                self.state = json["state"]
+                                self.current_player = json["current_player"]
+                                self.place_ships = json[
+                                    "allow_place_ships"] if "allow_place_ships" in json else False
+                                self.sync_ships(self.player_ships, self.player_board["ships"], skip=self.placing_ship)
+                                for index, (x, y, direction) in self.pending_placements.items():
+                                    # Not sent yet, keep the local placement over the server's copy
+                                    self.player_ships[index].net_update(self.player_ships[index].size,
+                                                                        False, True, x, y, direction)
+                                self.sync_ships(self.opponent_ships, self.opponent_board["ships"])
+                                self.player_model.set_ships(self.player_ships)
+                                for index, ship in enumerate(self.player_ships):
+                                    ship.health = self.player_model.health_mask(index)
+                                self.opponent_model.set_ships(self.opponent_ships)
+                                for index, ship in enumerate(self.opponent_ships):
+                                    # Only known once the server shows where the ship is
+                                    if ship.x is not None and ship.y is not None:
+                                        ship.health = self.opponent_model.health_mask(index)
+                                self.board_size = json["board_size"]
+                                self.update_suggestion()
+                                self.bot_waiting = True
+                                self.state_changed()
+        except ServerUnavailable:
+            pass  # Polling is paused until the server is back, the room shows that it is reconnecting
+        except ValueError as e:  # The server answered, but not with a state that could be read
+            self.network_error = f"Bad reply from the server: {e}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.network_error = f"Lost contact with the server: {str(e) or type(e).__name__}"
+        else:
+            self.network_error = None
+
+    def sync_ships(self, ships, data, skip=None):
+        """
+        Updates the Ship objects in place from the server's ship list, only creating new ones if the fleet grows
+        :param ships: The list of Ship objects to update
+        :param data: The ship dicts from the server
+        :param skip: The ship being placed, the server doesn't have it yet so it keeps following the cursor
+        :return:
+        """
+        del ships[len(data):]
+        for index, ship in enumerate(data):
+            if index < len(ships):
+                if ships[index] is not skip:
+                    ships[index].net_update(**ship)
+            else:
+                ships.append(self.Ship(**ship))
 
     async def send_move(self):
         try:
-            async with aiohttp.ClientSession() as session:
-                if self.queued_attack:
-                    move = {"x": self.queued_attack[0], "y": self.queued_attack[1]}
-                if self.placing_ship:
-                    move = {
-                        "placed_ships": [
-                            self.placing_ship.place_msg()
-                        ]
-                    }
-                async with session.post(f"http://{self.server_url}:{self.server_port}/room/make_move",
-                                        cookies={"user_hash": self.user_hash},
-                                        json={"move": move}) as resp:
-                    if resp.status == 200:
-                        json = await resp.json()
-                        if json is None:
-                            raise Exception("Server returned null")
-                        if json["success"]:
-                            self.queued_attack = None
-                            self.attack_queued = False
-                            self.placing_ship = None
-                        else:
-                            self.console.print(f"Move Error: {json['error']}")
-        except Exception as e:
-            self.console.print(f"Move Error: {e}\n{traceback.format_exc()}")
-
-    def make_board_table(self, board, ships, show_cursor=False):
-        table = Table(show_header=False, show_lines=True)
-        # Make an empty table with the right size
-        for _ in range(len(board)):
-            table.add_column()
-        # Fill the table with the board
-        column_num = 0
-        for board_row in board["board"]:
-            row = []
-            row_num = 0
-            for tile in board_row:
-                if [ship.on_tile(column_num, row_num) for ship in ships].count(True) > 0:
-                    if tile == 1:
-                        row.append("[red bold]■[/red bold]")
+            if self.queued_attack:
+                move = {"x": self.queued_attack[0], "y": self.queued_attack[1]}
+            async with self.request("POST", "/room/make_move", json={"move": move}) as resp:
+                if resp.status == 200:
+                    json = await resp.json()
+                    if json is None:
+                        raise ValueError("Server returned null")
+                    if json["success"]:
+                        self.queued_attack = None
+                        self.attack_queued = False
+                        self.move_error = None
                     else:
-                        row.append("[white bold]■[/white bold]")
+                        self.move_error = f"Move rejected: {json['error']}"
                 else:
-                    if show_cursor and column_num == self.cursor[0] and row_num == self.cursor[1]:
-                        if tile == 1:
-                            row.append("[red]*[/red]")
-                        elif tile == 2:
-                            row.append("[blue]*[/blue]")
-                        else:
-                            row.append("[white]*[/white]")
+                    self.move_error = f"Move rejected: {resp.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # Moves aren't resent automatically, the shot stays queued for the player to fire again
+            self.move_error = f"Error sending the move: {str(e) or type(e).__name__}"
+
+    def occupancy(self):
+        """
+        Builds the occupancy bitboard of every placed ship except the one being placed
+        :return:
+        """
+        occupied = 0
+        for ship in self.player_ships:
+            if ship.placed and ship is not self.placing_ship:
+                bits = ship_bits(ship.x, ship.y, ship.size, ship.direction, self.board_size)
+                if bits is not None:
+                    occupied |= bits
+        return occupied
+
+    def placement_valid(self, ship):
+        """
+        Checks that a ship is fully on the board and doesn't overlap any placed ship
+        :param ship:
+        :return:
+        """
+        bits = ship_bits(ship.x, ship.y, ship.size, ship.direction, self.board_size)
+        return bits is not None and not bits & self.occupancy()
+
+    def next_unplaced_ship(self):
+        for ship in self.player_ships:
+            if not ship.placed:
+                return ship
+        return None
+
+    def place_ship(self):
+        """
+        Places the current ship locally if it fits, the whole fleet is sent in one request once every ship is placed
+        :return: True if the fleet is ready to be sent
+        """
+        ship = self.placing_ship
+        if ship is None:
+            return False
+        if not self.placement_valid(ship):
+            self.placement_error = f"{self.ship_types[ship.size]} doesn't fit there"
+            return False
+        self.placement_error = None
+        ship.placed = True
+        self.pending_placements[self.player_ships.index(ship)] = (ship.x, ship.y, ship.direction)
+        self.placing_ship = self.next_unplaced_ship()
+        if self.placing_ship is not None:
+            self.placing_ship.x, self.placing_ship.y = self.cursor
+        return self.placing_ship is None
+
+    def undo_placement(self):
+        """
+        Picks the last locally placed ship back up, ships the server already has can't be moved
+        :return:
+        """
+        if not self.pending_placements:
+            return
+        index = list(self.pending_placements)[-1]
+        del self.pending_placements[index]
+        if self.placing_ship is not None:
+            self.placing_ship.x = self.placing_ship.y = None
+        self.placing_ship = self.player_ships[index]
+        self.placing_ship.placed = False
+        self.placing_ship.x, self.placing_ship.y = self.cursor
+
+    async def send_placements(self):
+        """
+        Sends every locally placed ship to the server in a single move
+        :return:
+        """
+        ships = [self.player_ships[index] for index in self.pending_placements]
+        try:
+            async with self.request("POST", "/room/make_move",
+                                    json={"move": {"placed_ships": [ship.place_msg() for ship in ships]}}) as resp:
+                if resp.status == 200:
+                    json = await resp.json()
+                    if json is None:
+                        raise ValueError("Server returned null")
+                    if json["success"]:
+                        self.pending_placements.clear()
                     else:
-                        if tile == 1:
-                            row.append("[red]X[/red]")
-                        elif tile == 2:
-                            row.append("[white]O[/white]")
-                        else:
-                            row.append(" ")
-                row_num += 1
-            column_num += 1
+                        self.placement_error = f"Server rejected the fleet: {json['error']}"
+                else:
+                    self.placement_error = f"Server rejected the fleet: {resp.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.placement_error = f"Error sending the fleet: {str(e) or type(e).__name__}"
+
+    def update_suggestion(self):
+        """
+        Asks the targeting engine for the next shot if the hint or bot is enabled
+        :return:
+        """
+        if (self.show_hint or self.bot_enabled) and not self.place_ships and self.opponent_model.size:
+            self.suggested_target = self.targeting.choose(self.opponent_model.tiles, self.opponent_ships)
+        else:
+            self.suggested_target = None
+
+    def my_turn(self):
+        return self.current_player is not None and self.current_player["username"] == self.username
+
+    async def bot_turn(self):
+        """
+        Fires at the suggested target once per state change while it is this player's turn
+        :return:
+        """
+        if not self.bot_enabled or not self.bot_waiting or self.place_ships or self.suggested_target is None:
+            return
+        if not self.my_turn():
+            return  # The state changes again once the opponent has fired, and the bot is woken up then
+        self.bot_waiting = False
+        self.queued_attack = list(self.suggested_target)
+        self.attack_queued = True
+        await self.send_move()
+
+    def viewport_size(self):
+        """
+        Works out how many tiles of a board fit in its panel, boards larger than this are scrolled with the cursor
+        :return: (rows, columns)
+        """
+        width, height = self.console.size
+        # Each board gets a third of the width and two thirds of the height, cells take 4 characters by 2 lines
+        columns = max(3, (width // 3 - 4) // 4)
+        rows = max(3, (height * 2 // 3 - 4) // 2)
+        return rows, columns
+
+    def make_board_table(self, model, ships, show_cursor=False):
+        rows, columns = self.viewport_size()
+        if self.show_minimap and model.size > max(rows, columns):
+            block = math.ceil(model.size / columns)
+            rows -= math.ceil(math.ceil(model.size / block) / 2)  # Make room for the minimap's lines
+        window = model.viewport(self.cursor, max(rows, 3), columns)
+        table = Table(show_header=False, show_lines=True)
+        # Make an empty table with the size of the visible window, only those tiles are rendered
+        for _ in range(window[3] - window[2]):
+            table.add_column()
+        # Fill the table with the board
+        model.set_ships(ships, skip=self.placing_ship)
+        hint = self.suggested_target if show_cursor and self.show_hint else None
+        preview = None
+        if model is self.player_model and self.place_ships and self.placing_ship is not None:
+            ship = self.placing_ship
+            preview = (ship.x, ship.y, ship.size, ship.direction, self.placement_valid(ship))
+        for row in model.render_rows(self.cursor if show_cursor else None, hint, preview, window):
             table.add_row(*row)
-        return table
-
-    def ship_info_panel(self, board, player):
+        if window == (0, model.size, 0, model.size):
+            return table
+        table.caption = f"Rows {window[0]}-{window[1] - 1}, Columns {window[2]}-{window[3] - 1} of {model.size}"
+        if not self.show_minimap:
+            return table
+        return Group(table, model.minimap(columns, window))
+
+    def ship_info_panel(self, ships, player):
         table = Table(show_header=False, show_lines=True)
         table.add_column("Ship")
         table.add_column("Size")
+        table.add_column("Health")
         table.add_column("State")
-        ships = [self.Ship(**ship) for ship in board["ships"]]
         for ship in ships:
-            table.add_row(self.ship_types[ship.size], str(ship.size), ship.state_str())
+            # The hits on an opponent's ship can't be counted until the server shows where it is
+            hidden = ships is self.opponent_ships and not ship.sunk and (ship.x is None or ship.y is None)
+            table.add_row(self.ship_types[ship.size], str(ship.size), "?" if hidden else ship.health_str(),
+                          ship.state_str())
         return Panel(table, title=f"{player} Ships")
 
     def draw_player_table(self):
@@ -253,99 +407,117 @@ class BattleShip(BaseRoom):
         player_table.add_column("Username", justify="left")
         player_table.add_column("Status", justify="left")
         for player in self.players:
-            player_table.add_row(f"{player['username']}",
-                                 f"{'[green]Online[/green]' if player['online'] else '[red]Offline[/red]'}")
+            player_table.add_row(player.username, player.status_str())
         spectator_table.add_column("Username", justify="left")
         spectator_table.add_column("Status", justify="left")
         for spectator in self.spectators:
-            spectator_table.add_row(f"{spectator['username']}",
-                                    f"{'[green]Online[/green]' if spectator['online'] else '[red]Offline[/red]'}")
+            spectator_table.add_row(spectator.username, spectator.status_str())
         return player_table, spectator_table
 
     def render_center_info(self):
         text = [f"Room: {self.room_name}", f"State: {self.state}",
                 f"Current Player: {self.current_player['username'] if self.current_player else 'None'}",
-                f"Queued Attack: {self.queued_attack}"]
+                f"Queued Attack: {self.queued_attack}",
+                f"Suggested Target: {self.suggested_target if self.show_hint else 'Off'}"
+                f"{' (bot firing)' if self.bot_enabled else ''}",
+                f"Your Shots: {self.opponent_model.hit_count} hits, {self.opponent_model.miss_count} misses",
+                f"Your Fleet: {self.player_model.remaining_tiles} tiles afloat"]
+        if self.place_ships:
+            text.append(f"Placed: {sum(ship.placed for ship in self.player_ships)}/{len(self.player_ships)}"
+                        f"{' (not sent)' if self.pending_placements and self.placing_ship is None else ''}")
+        if self.placement_error:
+            text.append(f"[red]{self.placement_error}[/red]")
+        if self.move_error:
+            text.append(f"[red]{self.move_error}[/red]")
+        if self.connection_status() is not None:
+            text.append(f"[bold yellow]{self.connection_status()}[/bold yellow]")
         return "\n".join(text)
 
     def draw_ui(self):
         self.layout["player_board"]["board"].update(
-            Panel(self.make_board_table(self.player_board, self.player_ships), title="Your Board"))
+            Panel(self.make_board_table(self.player_model, self.player_ships), title="Your Board"))
         self.layout["opponent_board"]["board"].update(
-            Panel(self.make_board_table(self.opponent_board, self.opponent_ships, not self.place_ships),
+            Panel(self.make_board_table(self.opponent_model, self.opponent_ships, not self.place_ships),
                   title="Opponent Board"))
         self.layout["center_info"]["top_info"].update(Panel(self.render_center_info(), title="Info"))
         self.layout["center_info"]["players_info"].update(Panel(self.draw_player_table()[0], title="Players"))
         self.layout["center_info"]["spectators_info"].update(Panel(self.draw_player_table()[1], title="Spectators"))
-        self.layout["opponent_board"]["opponent_info"].update(self.ship_info_panel(self.opponent_board, "Opponent"))
-        self.layout["player_board"]["player_info"].update(self.ship_info_panel(self.player_board, "Your"))
+        self.layout["opponent_board"]["opponent_info"].update(self.ship_info_panel(self.opponent_ships, "Opponent"))
+        self.layout["player_board"]["player_info"].update(self.ship_info_panel(self.player_ships, "Your"))
 
         return self.layout
 
-    async def keyboard_thread(self):
-        if keypress.kbhit():
-            key = keypress.getch()
-            # print(key)
-            match key:
-                case b'H':
-                    self.cursor[0] -= 1 if self.cursor[0] > 0 else 0
-                case b'P':
-                    self.cursor[0] += 1 if self.cursor[0] < self.board_size - 1 else 0
-                case b'K':
-                    self.cursor[1] -= 1 if self.cursor[1] > 0 else 0
-                case b'M':
-                    self.cursor[1] += 1 if self.cursor[1] < self.board_size - 1 else 0
-                case b'e':
-                    if self.place_ships:
-                        if self.placing_ship:
-                            self.placing_ship.rotate()
-                case b'r':
-                    await self.get_board(force=True)
-                case b' ':
-                    if self.place_ships:
-                        # Get the first ship that is not placed
-                        if self.placing_ship is not None:
-                            self.placing_ship.placed = True
-                            await self.send_move()
-                            self.placing_ship = None
-                    else:
-                        if not self.attack_queued:
-                            self.queued_attack = self.cursor
-                            self.attack_queued = True
-                        else:
-                            self.queued_attack = None
-                            self.attack_queued = False
-                case b'\r':
-                    if self.attack_queued:
-                        await self.send_move()
-                case b'q':
-                    self.running = False
-                    self.console.print("Quitting...")
-
-            if self.placing_ship:
-                self.placing_ship.x = self.cursor[0]
-                self.placing_ship.y = self.cursor[1]
-
-    async def update(self):
-        loops = 0
-
-        with Live(self.draw_ui(), refresh_per_second=14) as live:
-            while True:
-                if loops % 14 == 0:
-                    await self.get_board(False)
-                    loops = 0
-                await self.keyboard_thread()
-                live.update(self.draw_ui())
-                loops += 1
-
+    def compact_view(self):
+        """
+        Draws both boards as minimaps with the game state, small enough to tile many rooms on one screen
+        :return:
+        """
+        boards = Table.grid(padding=(0, 2))
+        boards.add_column()
+        boards.add_column()
+        self.player_model.set_ships(self.player_ships)
+        self.opponent_model.set_ships(self.opponent_ships)
+        boards.add_row(self.player_model.minimap(10), self.opponent_model.minimap(10))
+        current = self.current_player["username"] if self.current_player else "None"
+        text = Text(" vs ".join(player.username for player in self.players) or "No players", overflow="ellipsis",
+                    no_wrap=True)
+        turn = Text(f"Turn: {current}\nAfloat: {self.player_model.remaining_tiles} | "
+                    f"{self.opponent_model.remaining_tiles}")
+        return Panel(Group(text, boards, turn), title=self.room_name, subtitle=self.connection_status() or self.state,
+                     subtitle_align="right")
+
+    async def handle_key(self, key):
+        # print(key)
+        match key:
+            case b'H':
+                self.cursor[0] -= 1 if self.cursor[0] > 0 else 0
+            case b'P':
+                self.cursor[0] += 1 if self.cursor[0] < self.board_size - 1 else 0
+            case b'K':
+                self.cursor[1] -= 1 if self.cursor[1] > 0 else 0
+            case b'M':
+                self.cursor[1] += 1 if self.cursor[1] < self.board_size - 1 else 0
+            case b'e':
                 if self.place_ships:
-                    for ship in self.player_ships:
-                        if not ship.placed:
-                            self.placing_ship = ship
-                            break
-
-                await asyncio.sleep(1 / 14)
-
-    async def main(self):
-        await self.get_board(True)
-        await self.update()
+                    if self.placing_ship:
+                        self.placing_ship.rotate()
+            case b'r':
+                await self.get_board(force=True)
+            case b't':
+                self.show_hint = not self.show_hint
+                self.update_suggestion()
+            case b'b':
+                self.bot_enabled = not self.bot_enabled
+                self.update_suggestion()
+            case b'm':
+                self.show_minimap = not self.show_minimap
+            case b'u':
+                if self.place_ships:
+                    self.undo_placement()
+            case b' ':
+                if self.place_ships:
+                    # Space on a fully placed fleet resends it if the server didn't take it
+                    if self.place_ship() or (self.placing_ship is None and self.pending_placements):
+                        await self.send_placements()
+                else:
+                    if not self.attack_queued:
+                        self.queued_attack = self.cursor
+                        self.attack_queued = True
+                    else:
+                        self.queued_attack = None
+                        self.attack_queued = False
+            case b'\r':
+                if self.attack_queued:
+                    await self.send_move()
+
+        if self.placing_ship:
+            self.placing_ship.x = self.cursor[0]
+            self.placing_ship.y = self.cursor[1]
+
+    async def tick(self, loops):
+        await super().tick(loops)
+        await self.bot_turn()
+        if self.place_ships and self.placing_ship is None:
+            self.placing_ship = self.next_unplaced_ship()
+            if self.placing_ship is not None:
+                self.placing_ship.x, self.placing_ship.y = self.cursor
@@ -0,0 +1,273 @@
+import math
+
+import numpy as np
+from rich.text import Text
+
+# Tile states as sent by the server
+EMPTY, HIT, MISS = 0, 1, 2
+
+NO_SHIP = -1
+
+# Render codes are the tile state, plus 3 if a ship covers the tile or 6 if the cursor is over an uncovered tile.
+# HINT_CODE marks the targeting engine's suggestion
+GLYPH_MARKUP = [
+    " ", "[red]X[/red]", "[white]O[/white]",  # Open water
+    "[white bold]■[/white bold]", "[red bold]■[/red bold]", "[white bold]■[/white bold]",  # Ship
+    "[white]*[/white]", "[red]*[/red]", "[blue]*[/blue]",  # Cursor
+    "[yellow bold]?[/yellow bold]",  # Hint
+    "[green bold]■[/green bold]", "[red bold]■[/red bold]",  # Placement preview, valid and invalid
+]
+HINT_CODE = 9
+PREVIEW_VALID_CODE, PREVIEW_INVALID_CODE = 10, 11
+GLYPHS = np.empty(len(GLYPH_MARKUP), dtype=object)  # Filled in place, numpy would try to unpack the Text objects
+GLYPHS[:] = [Text.from_markup(markup) for markup in GLYPH_MARKUP]
+
+# Minimap blocks show the most important thing inside them: a hit, then a ship, then a miss
+MINIMAP_STYLES = {"hit": "red", "ship": "white", "miss": "blue", "empty": "grey35"}
+MINIMAP_CHARS = {"hit": "X", "ship": "■", "miss": "O", "empty": "·"}
+
+
+def ship_bits(x, y, size, direction, board_size):
+    """
+    Packs the tiles a ship would cover into an occupancy bitboard, tile [x, y] is bit x * board_size + y
+    :return: The bits, None if any part of the ship would be off the board
+    """
+    if x is None or y is None or x < 0 or y < 0:
+        return None
+    if direction == "horizontal":
+        if x + size > board_size or y >= board_size:
+            return None
+        step = board_size
+    else:
+        if y + size > board_size or x >= board_size:
+            return None
+        step = 1
+    # size bits spaced step apart, the sum of the geometric series 2^(i * step)
+    spaced_bits = ((1 << (size * step)) - 1) // ((1 << step) - 1)
+    return spaced_bits << (x * board_size + y)
+
+
+class BoardModel:
+    """
+    Array backed copy of one player's board.
+    Arrays are indexed [x, y] the same way as the server's nested board lists, x being the outer list.
+    All arrays are reused between updates and frames, they are only reallocated when the board size changes
+    """
+    __slots__ = ("size", "tiles", "ship_ids", "hit_mask", "ship_mask", "codes", "ship_sizes", "ship_positions",
+                 "ship_signature", "version", "minimap_cache")
+
+    def __init__(self, size=0):
+        self.size = 0
+        self.tiles = None  # type: np.ndarray # uint8 tile states
+        self.ship_ids = None  # type: np.ndarray # int16 index of the ship on each tile, NO_SHIP if there is none
+        self.hit_mask = None  # type: np.ndarray # bool
+        self.ship_mask = None  # type: np.ndarray # bool, True where a ship covers the tile
+        self.codes = None  # type: np.ndarray # uint8 render codes
+        self.ship_sizes = np.zeros(0, dtype=np.int16)
+        self.ship_positions = []  # (x, y, direction) of each ship, None for ships without a position
+        self.ship_signature = None  # The ship positions last marked, set_ships skips the work if they are unchanged
+        self.version = 0  # Bumped whenever the tiles or ships change
+        self.minimap_cache = None  # type: tuple or None # (version, block size, viewport, Text)
+        self.resize(size)
+
+    def resize(self, size):
+        self.size = size
+        self.tiles = np.zeros((size, size), dtype=np.uint8)
+        self.ship_ids = np.full((size, size), NO_SHIP, dtype=np.int16)
+        self.hit_mask = np.zeros((size, size), dtype=bool)
+        self.ship_mask = np.zeros((size, size), dtype=bool)
+        self.codes = np.zeros((size, size), dtype=np.uint8)
+        self.ship_signature = None
+
+    def update(self, board):
+        """
+        Loads the tile states from the server's board
+        :param board: The board dict from the server's state
+        :return:
+        """
+        tiles = np.asarray(board["board"], dtype=np.uint8)
+        if tiles.ndim != 2:
+            tiles = tiles.reshape(0, 0)
+        if tiles.shape != self.tiles.shape:
+            self.resize(tiles.shape[0])
+        self.tiles[...] = tiles
+        np.equal(self.tiles, HIT, out=self.hit_mask)
+        self.version += 1
+
+    def set_ships(self, ships, skip=None):
+        """
+        Marks the tiles covered by each ship, ships without a position are skipped
+        :param ships: Ship objects or dicts with size, x, y and direction
+        :param skip: A ship to leave off the board, such as the one being placed
+        :return:
+        """
+        signature = tuple((ship["size"], ship.get("x"), ship.get("y"), ship.get("direction")) if isinstance(ship, dict)
+                          else (ship.size, ship.x, ship.y, ship.direction, ship is skip) for ship in ships)
+        if signature == self.ship_signature:
+            return
+        self.ship_signature = signature
+        self.version += 1
+        self.ship_ids.fill(NO_SHIP)
+        if len(self.ship_sizes) != len(ships):
+            self.ship_sizes = np.zeros(len(ships), dtype=np.int16)
+            self.ship_positions = [None] * len(ships)
+        for index, ship in enumerate(ships):
+            if isinstance(ship, dict):
+                size, x, y, direction = ship["size"], ship.get("x"), ship.get("y"), ship.get("direction")
+            else:
+                size, x, y, direction = ship.size, ship.x, ship.y, ship.direction
+            self.ship_sizes[index] = size
+            if x is None or y is None or ship is skip:
+                self.ship_positions[index] = None
+                continue
+            self.ship_positions[index] = (x, y, direction)
+            if direction == "horizontal":
+                self.ship_ids[x:x + size, y] = index
+            else:
+                self.ship_ids[x, y:y + size] = index
+        np.not_equal(self.ship_ids, NO_SHIP, out=self.ship_mask)
+
+    def health_mask(self, index):
+        """
+        Packs which segments of a ship are still intact into an int
+        :param index: The ship's index in the list passed to set_ships
+        :return: Bit i is set while segment i hasn't been hit
+        """
+        size = int(self.ship_sizes[index])
+        health = (1 << size) - 1
+        if self.ship_positions[index] is None:
+            return health
+        x, y, direction = self.ship_positions[index]
+        segments = self.hit_mask[x:x + size, y] if direction == "horizontal" else self.hit_mask[x, y:y + size]
+        for segment in np.flatnonzero(segments):
+            health &= ~(1 << int(segment))
+        return health
+
+    @property
+    def hit_count(self):
+        return int(np.count_nonzero(self.hit_mask))
+
+    @property
+    def miss_count(self):
+        return int(np.count_nonzero(self.tiles == MISS))
+
+    def ship_hits(self):
+        """
+        :return: The number of hit tiles of each ship
+        """
+        return np.bincount(self.ship_ids[self.hit_mask & self.ship_mask],
+                           minlength=len(self.ship_sizes))[:len(self.ship_sizes)]
+
+    def sunk_ships(self):
+        """
+        :return: A bool array, True for every ship whose tiles have all been hit
+        """
+        return self.ship_hits() >= self.ship_sizes
+
+    @property
+    def remaining_tiles(self):
+        """
+        The number of ship tiles that haven't been hit yet
+        """
+        return int(self.ship_sizes.sum() - self.ship_hits().sum())
+
+    @staticmethod
+    def _paint(codes, window, x, y, length, direction, code):
+        """
+        Paints a line of tiles onto a window of render codes, clipping whatever falls outside of it
+        """
+        x0, x1, y0, y1 = window
+        if direction == "horizontal":
+            if y0 <= y < y1:
+                start, end = max(x, x0), min(x + length, x1)
+                if start < end:
+                    codes[start - x0:end - x0, y - y0] = code
+        else:
+            if x0 <= x < x1:
+                start, end = max(y, y0), min(y + length, y1)
+                if start < end:
+                    codes[x - x0, start - y0:end - y0] = code
+
+    def render_codes(self, cursor=None, hint=None, preview=None, window=None):
+        """
+        :param cursor: The [x, y] cursor position or None to hide the cursor
+        :param hint: The (x, y) of a suggested shot or None, the cursor is drawn over it
+        :param preview: (x, y, size, direction, valid) of a ship being placed or None
+        :param window: (x start, x end, y start, y end) of the part of the board to render, the whole board if None
+        :return: An array of indexes into GLYPHS covering the window
+        """
+        window = window if window is not None else (0, self.size, 0, self.size)
+        x0, x1, y0, y1 = window
+        codes = self.codes[x0:x1, y0:y1]  # A view, only the visible tiles are touched
+        np.multiply(self.ship_mask[x0:x1, y0:y1], 3, out=codes, casting="unsafe")
+        codes += self.tiles[x0:x1, y0:y1]
+        if hint is not None and x0 <= hint[0] < x1 and y0 <= hint[1] < y1:
+            if codes[hint[0] - x0, hint[1] - y0] == EMPTY:
+                codes[hint[0] - x0, hint[1] - y0] = HINT_CODE
+        if preview is not None and preview[0] is not None and preview[1] is not None:
+            x, y, size, direction, valid = preview
+            self._paint(codes, window, x, y, size, direction, PREVIEW_VALID_CODE if valid else PREVIEW_INVALID_CODE)
+            return codes
+        if cursor is not None and x0 <= cursor[0] < x1 and y0 <= cursor[1] < y1:
+            x, y = cursor[0] - x0, cursor[1] - y0
+            if codes[x, y] < 3 or codes[x, y] == HINT_CODE:
+                codes[x, y] %= 3
+                codes[x, y] += 6
+        return codes
+
+    def render_rows(self, cursor=None, hint=None, preview=None, window=None):
+        """
+        Builds the styled cells of the board, one list per table row
+        :param cursor: The [x, y] cursor position or None to hide the cursor
+        :param hint: The (x, y) of a suggested shot or None
+        :param preview: (x, y, size, direction, valid) of a ship being placed or None
+        :param window: (x start, x end, y start, y end) of the part of the board to render, the whole board if None
+        :return:
+        """
+        return GLYPHS[self.render_codes(cursor, hint, preview, window)].tolist()
+
+    def viewport(self, cursor, rows, columns):
+        """
+        Finds the window of the board to show, centred on the cursor and kept inside the board
+        :param cursor: The [x, y] cursor position
+        :param rows: How many board rows (x) fit on screen
+        :param columns: How many board columns (y) fit on screen
+        :return: (x start, x end, y start, y end)
+        """
+        rows, columns = min(rows, self.size), min(columns, self.size)
+        x0 = min(max(cursor[0] - rows // 2, 0), self.size - rows)
+        y0 = min(max(cursor[1] - columns // 2, 0), self.size - columns)
+        return x0, x0 + rows, y0, y0 + columns
+
+    def minimap(self, max_cells, window=None):
+        """
+        Downsamples the whole board into at most max_cells by max_cells blocks, highlighting the blocks in the window
+        :param max_cells: The most blocks along each side
+        :param window: The viewport to highlight or None
+        :return: A Text with one line per row of blocks
+        """
+        block = max(1, math.ceil(self.size / max_cells))
+        if self.minimap_cache is not None and self.minimap_cache[:3] == (self.version, block, window):
+            return self.minimap_cache[3]
+        blocks = math.ceil(self.size / block)
+        padding = blocks * block - self.size
+
+        def reduce(mask):
+            padded = np.pad(mask, ((0, padding), (0, padding)))
+            return padded.reshape(blocks, block, blocks, block).any(axis=(1, 3))
+
+        hits, ships, misses = reduce(self.hit_mask), reduce(self.ship_mask), reduce(self.tiles == MISS)
+        kinds = np.where(hits, "hit", np.where(ships, "ship", np.where(misses, "miss", "empty")))
+        in_view = np.zeros((blocks, blocks), dtype=bool)
+        if window is not None:
+            x0, x1, y0, y1 = window
+            in_view[x0 // block:math.ceil(x1 / block), y0 // block:math.ceil(y1 / block)] = True
+        text = Text()
+        for row, view_row in zip(kinds.tolist(), in_view.tolist()):
+            for kind, visible in zip(row, view_row):
+                style = MINIMAP_STYLES[kind] + (" on grey23" if visible else "")
+                text.append(MINIMAP_CHARS[kind], style=style)
+            text.append("\n")
+        text.rstrip()
+        self.minimap_cache = (self.version, block, window, text)
+        return text
@@ -0,0 +1,96 @@
+import numpy as np
+
+from game_rooms.BattleshipBoard import HIT, MISS, EMPTY
+
+
+def _window_sums(values, length, axis):
+    """
+    Sums every run of `length` tiles along an axis
+    :return: An array with one entry per possible start of a run
+    """
+    padded = np.cumsum(np.insert(values, 0, 0, axis=axis), axis=axis, dtype=np.int64)
+    end = padded.shape[axis]
+    return np.take(padded, np.arange(length, end), axis=axis) - np.take(padded, np.arange(0, end - length), axis=axis)
+
+
+def _spread(weights, length, axis):
+    """
+    Adds the weight of every placement start to each of the `length` tiles the placement covers
+    """
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (length - 1, length - 1)
+    return _window_sums(np.pad(weights, pad), length, axis)
+
+
+class TargetingEngine:
+    """
+    Picks shots from a probability density of where the remaining ships can still be.
+    Every placement of every afloat ship that avoids misses and sunk ships is counted for the tiles it covers,
+    placements that line up with unresolved hits are weighted far above the rest so hits get finished off
+    """
+
+    hit_weight = 40  # How much more a placement counts for each unresolved hit it covers
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def resolve(tiles, ships):
+        """
+        Splits the board into tiles no ship can still occupy and hits that don't belong to a sunk ship yet
+        :param tiles: The uint8 tile states of the opponent's board
+        :param ships: The opponent's ships, sunk ships with a known position are cleared from the board
+        :return: (blocked, unresolved hits, sizes of the ships still afloat)
+        """
+        blocked = tiles == MISS
+        hits = tiles == HIT
+        sizes = []
+        for ship in ships:
+            if not ship.sunk:
+                sizes.append(ship.size)
+            elif ship.x is not None and ship.y is not None:
+                if ship.direction == "horizontal":
+                    blocked[ship.x:ship.x + ship.size, ship.y] = True
+                    hits[ship.x:ship.x + ship.size, ship.y] = False
+                else:
+                    blocked[ship.x, ship.y:ship.y + ship.size] = True
+                    hits[ship.x, ship.y:ship.y + ship.size] = False
+        return blocked, hits, sizes
+
+    def probability_map(self, tiles, ships):
+        """
+        :param tiles: The uint8 tile states of the opponent's board
+        :param ships: The opponent's ships
+        :return: A float array with the chance of each unshot tile holding a ship, 0 for tiles already shot
+        """
+        blocked, hits, sizes = self.resolve(tiles, ships)
+        density = np.zeros(tiles.shape, dtype=np.float64)
+        blocked = blocked.astype(np.int32)
+        hits = hits.astype(np.int32)
+        for size in sizes:
+            if size > tiles.shape[0]:
+                continue
+            for axis in (0, 1):
+                free = _window_sums(blocked, size, axis) == 0
+                covered_hits = _window_sums(hits, size, axis)
+                weights = free * np.where(covered_hits > 0, covered_hits * self.hit_weight, 1)
+                density += _spread(weights, size, axis)
+        density[tiles != EMPTY] = 0
+        total = density.sum()
+        return density / total if total > 0 else density
+
+    def choose(self, tiles, ships):
+        """
+        Picks the most likely tile, ties are broken at random
+        :return: The (x, y) to fire at, None if every tile has been shot
+        """
+        density = self.probability_map(tiles, ships)
+        best = density.max()
+        if best <= 0:
+            candidates = np.argwhere(tiles == EMPTY)
+        else:
+            candidates = np.argwhere(density >= best * (1 - 1e-9))
+        if len(candidates) == 0:
+            return None
+        x, y = candidates[self.rng.integers(len(candidates))]
+        return int(x), int(y)
@@ -1,27 +1,29 @@
 import datetime
+import json
+import math
 import os
-# Import the correct terminal keypress module
-import keypress
 import threading
 import time
-import traceback
 
-import aiohttp
 import asyncio
 import logging
+import aiohttp
 import chess
+import chess.polyglot
 import chess.variant
 
 from rich.console import Console
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.table import Table
-from rich.live import Live
 
 from aiohttp import web
 from rich.text import Text
 
 from game_rooms.BaseRoom import BaseRoom
+from game_rooms.ChessAnalysis import AnalysisEngine
+from game_rooms.ChessBook import OpeningBook
+from game_rooms.RoomTransport import ServerUnavailable
 
 
 def bool_to_color(value):
@@ -33,10 +35,77 @@ def bool_to_color(value):
         return None
 
 
+def players_by_color(names, username, color):
+    """
+    Works out which player is White and which is Black. The server doesn't list the players by color, so it can only
+    be told from this user's name and color
+    :param names: The players' user names
+    :param username: This user's name
+    :param color: This user's color, None if not playing
+    :return: (white, black), None for a player that isn't known
+    """
+    if color is None or username not in names:
+        return None, None
+    opponent = next((name for name in names if name != username), None)
+    return (username, opponent) if color == chess.WHITE else (opponent, username)
+
+
+class InterpolatedClock:
+    """
+    Counts the server's move timers down locally between updates so the clocks tick smoothly
+    """
+
+    snap_threshold = 1.0  # Seconds of drift above which the clock jumps straight to the server's value
+    slew_time = 2.0  # Seconds over which smaller drifts are blended out
+
+    def __init__(self):
+        self.base = [0.0, 0.0]  # The timer values of the last server update
+        self.anchor = time.monotonic()  # The local time the last server update was received
+        self.correction = [0.0, 0.0]  # Drift that is still being blended out, decays to nothing over slew_time
+        self.running = None  # The index of the timer that is counting down, None if both are stopped
+
+    def _correction_at(self, index, now):
+        remaining = 1 - (now - self.anchor) / self.slew_time
+        return self.correction[index] * remaining if remaining > 0 else 0.0
+
+    def value(self, index, now=None):
+        """
+        Gets the current estimate of a timer
+        :param index: 0 for white, 1 for black
+        :param now: The monotonic time to estimate the timer at, defaults to now
+        :return: The remaining time in seconds
+        """
+        now = time.monotonic() if now is None else now
+        value = self.base[index] + self._correction_at(index, now)
+        if self.running == index:
+            value -= now - self.anchor
+        return max(value, 0.0)
+
+    def sync(self, server_timers, running):
+        """
+        Re-anchors the clock to the timers sent by the server
+        :param server_timers: The move timers from the server in seconds
+        :param running: The index of the timer that is counting down, None if both are stopped
+        """
+        now = time.monotonic()
+        for index, server_value in enumerate(server_timers):
+            drift = self.value(index, now) - server_value
+            # Only blend the clock that kept running, everything else (increments, turn changes) is applied as is
+            if index == running == self.running and abs(drift) < self.snap_threshold:
+                self.correction[index] = drift
+            else:
+                self.correction[index] = 0.0
+        self.base = [float(server_value) for server_value in server_timers]
+        self.anchor = now
+        self.running = running
+
+
 class Chess(BaseRoom):
 
     playable = True
 
+    poll_interval = 2  # Seconds between has_changed polls, the clocks are interpolated locally in between
+
     fully_qualified_piece_names = {
         "P": "White Pawn",
         "N": "White Knight",
@@ -53,6 +122,20 @@ class Chess(BaseRoom):
         None: "Empty"
     }
 
+    # The board class and constructor options used for each variant name the server sends
+    variant_boards = {
+        "Standard": (chess.Board, {}),
+        "Board": (chess.Board, {}),
+        "Chess960": (chess.Board, {"chess960": True}),
+        "Crazyhouse": (chess.variant.CrazyhouseBoard, {}),
+        "Three Check": (chess.variant.ThreeCheckBoard, {}),
+        "King of the Hill": (chess.variant.KingOfTheHillBoard, {}),
+        "Antichess": (chess.variant.AntichessBoard, {}),
+        "Atomic": (chess.variant.AtomicBoard, {}),
+        "Horde": (chess.variant.HordeBoard, {}),
+        "Racing Kings": (chess.variant.RacingKingsBoard, {}),
+    }
+
     # Arguments that the server needs when creating a new game
     creation_args = {
         "timers_enabled": {"name": "Timers Enabled", "type": "bool", "default": False, "cords": [0, 0]},
@@ -65,12 +148,15 @@ class Chess(BaseRoom):
         "allow_spectators": {"name": "Allow Spectators", "type": "bool", "default": True, "cords": [1, 2]},
     }
 
-    def __init__(self, user_hash, server_url, server_port, console: Console, room_name="Unknown"):
-        super().__init__(user_hash, server_url, server_port, console, room_name)
+    def __init__(self, user_hash, server_url, server_port, console: Console, room_name="Unknown", transport=None):
+        super().__init__(user_hash, server_url, server_port, console, room_name, transport)
         self.player_color = None
         self.board = chess.Board()
-        self.move_queued = False
-        self.queued_move = None
+        self.pending_move = None  # type: chess.Move or None # Applied locally, waiting on the server to confirm
+        self.send_task = None  # type: asyncio.Task or None
+        self.premoves = []  # type: list[chess.Move] # Queued during the opponent's turn
+        self.move_error = None  # Why the last move or premove entered wasn't played, shown in the game info
+        self.resync_requested = False
         self.cursor = [0, 0]
         self.board_relative_cursor = [0, 0]
         self.piece_selected = False
@@ -87,6 +173,17 @@ class Chess(BaseRoom):
 
         self.timers_enabled = False
         self.move_timers = [0, 0]  # type: list[int] # In seconds
+        self.clock = InterpolatedClock()
+
+        self.analysis = AnalysisEngine()
+        self.hints_enabled = False
+        self.book = OpeningBook()
+
+        self.cell_cache = {}  # type: dict[tuple, Text] # Styled board cells keyed by (piece symbol, cursor state)
+        self.board_render_key = None
+        self.board_render = None  # type: Table or None # The last rendered board, reused while its key is unchanged
+        self.compact_board_key = None
+        self.compact_board = None  # type: Text or None # The board as shown on the spectator dashboard
 
         self.layout = Layout()
         self.layout.split_column(
@@ -117,55 +214,65 @@ class Chess(BaseRoom):
 
     def switch_board_variant(self, server_variant):
         """
-        If the server variant is different from the current board variant, instantiate a new board of the correct variant
-        :return:
+        If the server variant is different from the current variant, instantiate a new board of the correct variant.
+        The existing board (and its move stack) is kept while the variant stays the same
+        :return: True if a new board was created
         """
-        if type(self.board).__name__ != server_variant:
-            self.variant = server_variant
-            match server_variant:
-                case "Board":
-                    self.board = chess.Board()
-                case "Chess960":
-                    self.board = chess.Board(chess960=True)
-                case "Crazyhouse":
-                    self.board = chess.variant.CrazyhouseBoard()
-                case "Three Check":
-                    self.board = chess.variant.ThreeCheckBoard()
-                case "King of the Hill":
-                    self.board = chess.variant.KingOfTheHillBoard()
-                case "Antichess":
-                    self.board = chess.variant.AntichessBoard()
-                case "Atomic":
-                    self.board = chess.variant.AtomicBoard()
-                case "Horde":
-                    self.board = chess.variant.HordeBoard()
-                case "Racing Kings":
-                    self.board = chess.variant.RacingKingsBoard()
-                case _:
-                    self.board = chess.Board()
+        if server_variant == self.variant:
+            return False
+        board_class, options = self.variant_boards.get(server_variant, (chess.Board, {}))
+        self.variant = server_variant
+        self.board = board_class(**options)
+        self.premoves.clear()
+        return True
 
     async def send_save_request(self):
         """
         Sends a save request to the server
         :return:
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"http://{self.server_url}:{self.server_port}/room/save_game",
-                                    cookies={"user_hash": self.user_hash}) as resp:
-                if resp.status == 200:
-                    json = await resp.json()
-                    if "room_id" in json:
-                        # Check if a save folder exists
-                        if not os.path.exists("saves"):
-                            os.mkdir("saves")
-                        # Check if a save file exists
-                        with open(f"saves/{self.start_time.strftime('%Y-%m-%d_%H-%M-%S')}.room", "w") as file:
-                            file.write(json["room_id"])
-                        self.console.print("Game saved successfully!")
-                    else:
-                        self.console.print("Failed to save game!")
+        async with self.request("POST", "/room/save_game") as resp:
+            if resp.status == 200:
+                json = await resp.json()
+                if "room_id" in json:
+                    # Check if a save folder exists
+                    if not os.path.exists("saves"):
+                        os.mkdir("saves")
+                    # Check if a save file exists
+                    save_name = f"saves/{self.start_time.strftime('%Y-%m-%d_%H-%M-%S')}"
+                    with open(f"{save_name}.room", "w") as file:
+                        file.write(json["room_id"])
+                    self.save_state_cache(f"{save_name}.state", json["room_id"])
+                    self.console.print("Game saved successfully!")
                 else:
                     self.console.print("Failed to save game!")
+            else:
+                self.console.print("Failed to save game!")
+
+    def save_state_cache(self, path, room_id):
+        """
+        Writes the game as seen by this client next to its save file, so saved games can be exported and analysed
+        without the server (see tools/pgn_export.py)
+        :param path: The file to write
+        :param room_id: The room id the server saved the game under
+        :return:
+        """
+        root = self.board.root()
+        state = {
+            "room_id": room_id,
+            "room_name": self.room_name,
+            "variant": self.variant,
+            "fen": root.fen(),
+            "moves": [move.uci() for move in self.board.move_stack],
+            "players": [player["username"] for player in self.players],  # In the order the server lists them
+            "username": self.username,  # With your_color, tells which of the players is White
+            "your_color": self.color_to_str(self.player_color),
+            "state": self.board_state,
+            "result": self.board.result(),
+            "date": self.start_time.isoformat(),
+        }
+        with open(path, "w") as file:
+            json.dump(state, file, indent=4)
 
     async def get_board(self, force=False):
         """
@@ -173,61 +280,189 @@ class Chess(BaseRoom):
         :return:
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://{self.server_url}:{self.server_port}/room/has_changed",
-                                       cookies={"user_hash": self.user_hash}) as resp:
-                    if resp.status == 200:
-                        json = await resp.json()
-                        if json is None:
-                            raise Exception("Server returned null")
-                        if "frequent_update" in json:
-                            self.players = json["frequent_update"]["players"]
-                            self.spectators = json["frequent_update"]["spectators"]
-                            self.move_timers = json["frequent_update"]["move_timers"]
-                        if json["changed"] or force:
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(f"http://{self.server_url}:{self.server_port}/room/get_state",
-                                                       cookies={"user_hash": self.user_hash}) as resp:
-                                    if resp.status == 200:
-                                        json = await resp.json()
-                                        self.switch_board_variant(json["variant"])  # Switch the board variant if needed
-                                        board_epd = json["board"]
-                                        current_color = bool_to_color(json["current_player"])
-                                        self.player_color = bool_to_color(json["your_color"])
-                                        # Update the board state
-                                        self.board.set_epd(board_epd)
-                                        self.board.turn = current_color
-                                        self.board_state = json["state"]
-                                        self.last_move = json["last_move"]
-                                        self.timers_enabled = json["timers_enabled"]
-                                        self.taken_pieces = json["taken_pieces"]
-                                        # Play the console bell sound when the board changes
-                                        self.console.bell()
-                                    else:
-                                        logging.error(f"Error getting board state: {resp.status}: {await resp.text()}")
-                    else:
-                        logging.error(f"Error getting board state: {resp.status}: {await resp.text()}")
+            await self.fetch_username()  # Needed to tell which player is White
+            async with self.request("GET", "/room/has_changed") as resp:
+                if resp.status == 200:
+                    json = await resp.json()
+                    if json is None:
+                        raise ValueError("Server returned null")
+                    timers_updated = "frequent_update" in json
+                    if timers_updated:
+                        self.players = json["frequent_update"]["players"]
+                        self.spectators = json["frequent_update"]["spectators"]
+                        self.move_timers = json["frequent_update"]["move_timers"]
+                    if json["changed"] or force:
+                        async with self.request("GET", "/room/get_state") as resp:
+                            if resp.status == 200 and self.send_task is not None \
+                                    and not self.send_task.done():
+                                # A move is still in flight, reconcile once the server has answered it
+                                self.resync_requested = True
+                            elif resp.status == 200:
+                                json = await resp.json()
+                                self.switch_board_variant(json["variant"])  # Switch the board variant if needed
+                                board_epd = json["board"]
+                                current_color = bool_to_color(json["current_player"])
+                                self.player_color = bool_to_color(json["your_color"])
+                                # Update the board state, this confirms or rolls back any optimistic move
+                                self.apply_server_position(board_epd, current_color, json["last_move"])
+                                self.pending_move = None
+                                self.fire_premove()
+                                self.board_state = json["state"]
+                                self.last_move = json["last_move"]
+                                self.timers_enabled = json["timers_enabled"]
+                                self.taken_pieces = json["taken_pieces"]
+                                # Play the console bell sound when the board changes
+                                self.state_changed()
+                            else:
+                                logging.error(f"Error getting board state: {resp.status}: {await resp.text()}")
+                    if timers_updated:
+                        # Synced after the board so the clock knows whose turn it is now
+                        self.clock.sync(self.move_timers, self.running_timer())
+                else:
+                    logging.error(f"Error getting board state: {resp.status}: {await resp.text()}")
+
+        except ServerUnavailable:
+            self.resync_requested = True  # Polling is paused, the whole state is reloaded once the server is back
+        except ValueError as e:  # The server answered, but not with a state that could be read
+            self.network_error = f"Bad reply from the server: {e}"
+            logging.error(f"Error getting board state: {e}")
+            self.resync_requested = True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.network_error = f"Lost contact with the server: {str(e) or type(e).__name__}"
+            logging.error(f"Error getting board state: {str(e) or type(e).__name__}")
+            self.resync_requested = True  # The change may have been missed
+        else:
+            self.network_error = None
 
-        except Exception as e:
-            logging.error(f"Error getting board state: {e} {traceback.format_exc()}")
+    @staticmethod
+    def position_key(epd):
+        """
+        Gets the fields of an EPD that describe the position (placement, turn, castling and en passant)
+        :param epd: The EPD string
+        :return:
+        """
+        return epd.split(" ")[:4]
+
+    def parse_server_move(self, last_move):
+        """
+        Parses the server's last move against the current board
+        :param last_move: The move in UCI (or SAN) notation
+        :return: The move if it is legal in the current position, otherwise None
+        """
+        if not last_move:
+            return None
+        try:
+            return self.board.parse_uci(last_move)
+        except ValueError:
+            try:
+                return self.board.parse_san(last_move)
+            except ValueError:
+                return None
+
+    def apply_server_position(self, board_epd, current_color, last_move):
+        """
+        Brings the local board in line with the server's position. If the server's last move leads from the current
+        position it is pushed onto the board so the move stack is kept, otherwise the whole position is reloaded
+        :param board_epd: The server's position
+        :param current_color: The color whose turn it is
+        :param last_move: The last move the server applied
+        :return: True if the position had to be reloaded
+        """
+        server_key = self.position_key(board_epd)
+        if self.position_key(self.board.epd()) == server_key and self.board.turn == current_color:
+            return False  # Already up to date, for example after our own move
+        move = self.parse_server_move(last_move)
+        if move is not None:
+            self.board.push(move)
+            if self.position_key(self.board.epd()) == server_key and self.board.turn == current_color:
+                return False
+            self.board.pop()  # The move didn't lead to the server's position, fall back to a full reload
+        self.board.set_epd(board_epd)
+        self.board.turn = current_color
+        return True
 
     async def send_move(self, move: chess.Move):
         """
         Sends a move to the server
         :param move:
-        :return:
+        :return: True if the server accepted the move
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"http://{self.server_url}:{self.server_port}/room/make_move",
-                                        cookies={"user_hash": self.user_hash},
-                                        json={"move": move.uci()}) as resp:
-                    if resp.status != 200:
-                        logging.error(f"Error sending move: {resp.status}")
-                        # Reset the board state
-                        self.board.move_stack.pop()
+            async with self.request("POST", "/room/make_move", json={"move": move.uci()}) as resp:
+                if resp.status != 200:
+                    logging.error(f"Error sending move: {resp.status}")
+                    self.rollback_move(move)
+                    return False
+            if self.pending_move == move:
+                self.pending_move = None  # Confirmed, a premove can follow without waiting for the next poll
+            self.fire_premove()
+            return True
         except Exception as e:
             logging.error(f"Error sending move: {e}")
+            self.rollback_move(move)
+            return False
+
+    def submit_move(self, move: chess.Move):
+        """
+        Applies a move locally straight away and sends it to the server in the background
+        :param move: A legal move in the current position
+        :return:
+        """
+        self.board.push(move)
+        self.pending_move = move
+        self.send_task = asyncio.create_task(self.send_move(move))
+
+    def rollback_move(self, move: chess.Move):
+        """
+        Undoes a move the server didn't accept and asks for the server's position
+        :param move: The move that was rejected
+        :return:
+        """
+        if self.pending_move == move:
+            if self.board.move_stack and self.board.peek() == move:
+                self.board.pop()
+            self.pending_move = None
+        self.premoves.clear()  # Premoves were planned on top of the rejected move
+        self.resync_requested = True
+
+    def fire_premove(self):
+        """
+        Plays the first queued premove once it's the player's turn, dropping all of them if it isn't legal
+        :return:
+        """
+        if not self.premoves or self.pending_move is not None or self.board.turn != self.player_color:
+            return
+        move = self.premoves.pop(0)
+        if move in self.board.legal_moves:
+            self.submit_move(move)
+        else:
+            logging.info(f"Premove {move} is no longer legal, clearing premoves")
+            self.premoves.clear()
+
+    def premove_board(self):
+        """
+        Builds the position premoves are planned in, the player to move with every queued premove applied
+        :return:
+        """
+        board = self.board.copy(stack=False)
+        for premove in self.premoves:
+            board.turn = self.player_color
+            board.push(premove)
+        board.turn = self.player_color
+        return board
+
+    def is_premove_candidate(self, board, move: chess.Move):
+        """
+        Checks if a move could become legal once the opponent has moved
+        :param board: The board from premove_board
+        :param move:
+        :return:
+        """
+        piece = board.piece_at(move.from_square)
+        if piece is None or piece.color != self.player_color:
+            return False
+        # Attacked squares cover captures of pieces that aren't there yet, pseudo legal moves cover pushes and castling
+        return move.to_square in board.attacks(move.from_square) or move in board.pseudo_legal_moves
 
     def color_to_str(self, color):
         if color == chess.WHITE:
@@ -237,16 +472,18 @@ class Chess(BaseRoom):
         else:
             return "Not playing"
 
-    def is_promotion(self, move: chess.Move):
+    def is_promotion(self, move: chess.Move, board=None):
         """
         Checks if a move is of a pawn promotion
         :param move:
+        :param board: The board to check the move on, defaults to the current board
         :return:
         """
-        piece = self.board.piece_at(move.from_square)
+        board = self.board if board is None else board
+        piece = board.piece_at(move.from_square)
         if piece is not None:
             if piece.piece_type == chess.PAWN:
-                if self.board.turn == chess.WHITE:
+                if piece.color == chess.WHITE:
                     if move.to_square in chess.SquareSet(chess.BB_RANK_8) and move.from_square in chess.SquareSet(
                             chess.BB_RANK_7):
                         return True
@@ -268,12 +505,19 @@ class Chess(BaseRoom):
 
     def valid_cursor_selection(self):
         """
-        Checks if the cursor is over a valid piece
+        Checks if the cursor is over a valid piece, during the opponent's turn this checks for a valid premove
         :return:
         """
-        if self.board.turn != self.player_color:
+        if self.player_color is None:
             return False
         square = chess.square(self.cursor[1], self.cursor[0])
+        if self.board.turn != self.player_color or self.pending_move is not None:
+            board = self.premove_board()
+            if not self.piece_selected:
+                piece = board.piece_at(square)
+                return piece is not None and piece.color == self.player_color
+            return self.is_premove_candidate(board, chess.Move(chess.square(self.piece_origin[1],
+                                                                            self.piece_origin[0]), square))
         piece = self.board.piece_at(square)
         if not self.piece_selected:  # If no piece is selected, check if the cursor is over a valid piece
             if piece is not None:  # Check if the cursor is over a piece
@@ -287,22 +531,39 @@ class Chess(BaseRoom):
             if move in self.board.legal_moves:
                 return True
 
+    def running_timer(self):
+        """
+        Gets which timer should currently be counting down
+        :return: 0 for white, 1 for black or None if neither timer is running
+        """
+        if not self.timers_enabled or self.board.is_game_over():
+            return None
+        return 0 if self.board.turn == chess.WHITE else 1
+
+    @staticmethod
+    def format_timer(seconds):
+        """
+        Formats a timer value, showing tenths of a second once the timer is under 10 seconds
+        :param seconds: The remaining time in seconds
+        :return:
+        """
+        if seconds < 10:
+            return f"{datetime.timedelta(seconds=int(seconds))}.{int(seconds * 10) % 10}"
+        return f"{datetime.timedelta(seconds=math.ceil(seconds))}"
+
     def draw_timers(self):
         """
         Draws the timers
         :return:
         """
         if self.timers_enabled:
-            self.timer_layout["white_timer"].update(Panel(Text(f"{datetime.timedelta(seconds=self.move_timers[0])}",
-                                                               justify="center"),
-                                                          style="white" if self.move_timers[0] > 30 else "orange_red1"
-                                                          if self.move_timers[0] > 0 else "red",
-                                                          title="White", subtitle_align="center"))
-            self.timer_layout["black_timer"].update(Panel(Text(f"{datetime.timedelta(seconds=self.move_timers[1])}",
-                                                               justify="center"),
-                                                          style="white" if self.move_timers[1] > 30 else "orange_red1"
-                                                          if self.move_timers[1] > 0 else "red",
-                                                          title="Black", subtitle_align="center"))
+            now = time.monotonic()
+            for index, (name, color) in enumerate([("white_timer", "White"), ("black_timer", "Black")]):
+                remaining = self.clock.value(index, now)
+                self.timer_layout[name].update(Panel(Text(self.format_timer(remaining), justify="center"),
+                                                     style="white" if remaining > 30 else "orange_red1"
+                                                     if remaining > 0 else "red",
+                                                     title=color, subtitle_align="center"))
         else:
             self.timer_layout["white_timer"].update(Panel(Text(f"N/A", justify="center"),
                                                           style="white", title="White",
@@ -325,14 +586,45 @@ class Chess(BaseRoom):
             chess_piece = chess.Piece.from_symbol(piece)
             taken_white_pieces.append(self.piece_character(chess_piece))
 
-        text = f"Room Name: {self.room_name}\n" \
+        text = ""
+        if self.connection_status() is not None:
+            text += f"[bold yellow]{self.connection_status()}[/bold yellow]\n"
+        text += f"Room Name: {self.room_name}\n" \
                f"Variant: {self.variant}\n" \
                f"Game State: {self.board_state}\n" \
                f"Taken White Pieces: {len(taken_white_pieces)}\n{''.join(taken_white_pieces)}\n" \
                f"Taken Black Pieces: {len(taken_black_pieces)}\n{''.join(taken_black_pieces)}\n"
+        book = self.book.lookup(self.board)
+        if book is not None:
+            if book["name"] is not None:
+                text += f"Opening: {book['eco']} {book['name']}\n"
+            if book["moves"]:
+                text += "Book: " + ", ".join(f"{san} ({share:.0%})" for san, share in book["moves"][:4]) + "\n"
+        if self.hints_enabled:
+            text += f"Hint: {self.hint_text()}\n"
+        if self.move_error:
+            text += f"[red]{self.move_error}[/red]\n"
         game_info = Panel(text, style="white", title="Game Info", subtitle_align="center")
         return game_info
 
+    def hint_text(self):
+        """
+        Describes the analysis of the current position
+        :return:
+        """
+        result = self.analysis.result
+        if result is None:
+            return "Analysing..."
+        if result["mate"] is not None:
+            # Positive mates are for the side to move
+            mating = self.board.turn if result["mate"] > 0 else not self.board.turn
+            evaluation = f"{self.color_to_str(mating)} mates in {abs(result['mate'])}"
+        else:
+            # Scores are from the side to move, show them from white's side like most analysis boards
+            score = result["score"] if self.board.turn == chess.WHITE else -result["score"]
+            evaluation = f"{score / 100:+.2f}"
+        return f"{result['san']} ({evaluation}, depth {result['depth']}, {result['nps'] // 1000}k nps)"
+
     def draw_ui(self):
         # Draw the ui using the Layout object
         board = self.draw_board()
@@ -341,9 +633,11 @@ class Chess(BaseRoom):
         board_table.add_row(f"It's [bold]{self.color_to_str(self.board.turn)}[/bold]'s turn,"
                             f" you are [bold]{self.color_to_str(self.player_color)}[/bold]")
         board_table.add_row(board)
-        if self.move_queued:
-            board_table.add_row(f"[green]Move queued: {self.queued_move}[/green]")
-        elif self.piece_selected:
+        if self.pending_move is not None:
+            board_table.add_row(f"[green]Sending move: {self.pending_move}[/green]")
+        if self.premoves:
+            board_table.add_row(f"[cyan]Premoves: {' '.join(str(move) for move in self.premoves)}[/cyan]")
+        if self.piece_selected:
             board_table.add_row(f"[yellow]Selected piece: {self.selected_piece}[/yellow]")
         else:
             over_piece = self.board.piece_at(chess.square(self.cursor[1], self.cursor[0]))
@@ -387,119 +681,160 @@ class Chess(BaseRoom):
                                     f"{'[green]Online[/green]' if spectator['online'] else '[red]Offline[/red]'}")
         return player_table, spectator_table
 
+    def board_cell(self, piece, cursor_state):
+        """
+        Gets the styled cell for a square, building it the first time the combination is seen
+        :param piece: The chess.Piece on the square or None
+        :param cursor_state: None if the cursor isn't on the square, otherwise "valid" or "invalid"
+        :return:
+        """
+        key = (piece.symbol() if piece is not None else None, cursor_state)
+        cell = self.cell_cache.get(key)
+        if cell is None:
+            if piece is not None:
+                if cursor_state == "valid":
+                    markup = f"[black on grey19]{self.piece_character(piece)}[/black on grey19]"
+                elif cursor_state == "invalid":
+                    markup = f"[black on red]{self.piece_character(piece)}[/black on red]"
+                else:
+                    markup = f"[grey19]{self.piece_character(piece)}[/grey19]"
+            else:
+                if cursor_state == "valid":
+                    markup = "[green]*[/green]"
+                elif cursor_state == "invalid":
+                    markup = "*"
+                else:
+                    markup = " "
+            cell = self.cell_cache[key] = Text.from_markup(markup)
+        return cell
+
     def draw_board(self):
         """
-        Draws the board to the console
+        Draws the board to the console, reusing the previous table while nothing that affects it has changed
         :return:
         """
+        key = (chess.polyglot.zobrist_hash(self.board), self.variant, tuple(self.cursor), self.piece_selected,
+               tuple(self.piece_origin) if self.piece_selected else None, self.player_color, self.pending_move,
+               tuple(self.premoves))
+        if key == self.board_render_key:
+            return self.board_render
 
         board_table = Table(show_header=False, show_lines=True, border_style="orange4")
         # Set the background color of the table to brown
 
+        pieces = self.board.piece_map()
+        cursor_square = chess.square(self.cursor[1], self.cursor[0])
+        cursor_state = "valid" if self.valid_cursor_selection() else "invalid"
         for i in range(8):
             row = []
             for j in range(8):
-                if self.board.piece_at(chess.square(j, i)) is not None:
-                    piece = self.board.piece_at(chess.square(j, i))
-                    if self.cursor[0] == i and self.cursor[1] == j:
-                        if self.valid_cursor_selection():
-                            row.append(f"[black on grey19]{self.piece_character(piece)}[/black on grey19]")
-                        else:
-                            row.append(f"[black on red]{self.piece_character(piece)}[/black on red]")
-                    else:
-                        row.append(f"[grey19]{self.piece_character(piece)}[/grey19]")
-                else:
-                    if self.cursor[0] == i and self.cursor[1] == j:
-                        if self.valid_cursor_selection():
-                            row.append(f"[green]*[/green]")
-                        else:
-                            row.append(f"*")
-
-                    else:
-                        row.append(" ")
+                square = chess.square(j, i)
+                row.append(self.board_cell(pieces.get(square), cursor_state if square == cursor_square else None))
             board_table.add_row(*row)
-        return board_table
-
-    async def keyboard_thread(self):
-        if keypress.kbhit():
-            key = keypress.getch()
-            # print(key)
-            match key:
-                case b'H':
-                    self.cursor[0] -= 1 if self.cursor[0] > 0 else 0
-                case b'P':
-                    self.cursor[0] += 1 if self.cursor[0] < 7 else 0
-                case b'K':
-                    self.cursor[1] -= 1 if self.cursor[1] > 0 else 0
-                case b'M':
-                    self.cursor[1] += 1 if self.cursor[1] < 7 else 0
-                case b'r':
-                    await self.get_board(force=True)
-                case b's':
-                    await self.send_save_request()
-                case b' ':
-                    if self.move_queued:
-                        self.move_queued = False
-                        self.queued_move = None
-                    else:
-                        if self.piece_selected:
-                            # Check if the move is valid
-                            move = chess.Move(chess.square(self.piece_origin[1], self.piece_origin[0]),
-                                              chess.square(self.cursor[1], self.cursor[0]))
-                            if move in self.board.legal_moves:
-                                # Move the piece
-                                self.board.push(move)
-                                self.move_queued = True
-                                self.queued_move = move
-                                self.piece_selected = False
-                                self.selected_piece = None
-                            elif self.is_promotion(move):
-                                move.promotion = chess.QUEEN
-                                self.board.push(move)
-                                self.move_queued = True
-                                self.queued_move = move
-                                self.piece_selected = False
-                                self.selected_piece = None
-                            else:
-                                print(f"Invalid move: {move}")
-                                self.piece_selected = False
-                                self.selected_piece = None
-                        else:
-                            self.piece_selected = True
-                            self.selected_piece = self.board.piece_at(chess.square(self.cursor[1], self.cursor[0]))
-                            self.piece_origin = self.cursor.copy()
-                case b'\r':
-                    if self.move_queued:
-                        # Remember to flip the move back to the server's perspective if the player is white
-                        await self.send_move(self.queued_move)
-                        self.move_queued = False
-                        self.queued_move = None
-                case b'q':
-                    exit(0)
-
-    async def update(self):
-        """
-        Uses Live to update the displayed board
-        :return:
-        """
-        loops = 0
-        await self.get_board()
 
-        with Live(self.draw_ui(), refresh_per_second=14) as live:
-            while True:
-                live.update(self.draw_ui())
-                if loops % 14 == 0:
-                    await self.get_board()
-                    loops = 0
-                loops += 1
-                # Read the keyboard input to move the cursor
-                await self.keyboard_thread()
-                # Wait 1/14th of a second
-                await asyncio.sleep(1 / 14)
+        self.board_render_key = key
+        self.board_render = board_table
+        return board_table
 
-    async def main(self):
+    def compact_view(self):
         """
-        Main loop
+        Draws the board as text with the players, turn and clocks, small enough to tile many rooms on one screen
         :return:
         """
-        await self.update()
+        key = (chess.polyglot.zobrist_hash(self.board), self.variant)
+        if key != self.compact_board_key:
+            board = Text()
+            for rank in range(7, -1, -1):
+                for file in range(8):
+                    piece = self.board.piece_at(chess.square(file, rank))
+                    if piece is not None:
+                        board.append_text(Text.from_markup(self.piece_character(piece)))
+                        board.append(" ")
+                    else:
+                        board.append("· ", style="grey35")
+                if rank:
+                    board.append("\n")
+            self.compact_board_key = key
+            self.compact_board = board
+
+        names = [player["username"] for player in self.players]
+        white, black = players_by_color(names, self.username, self.player_color)
+        if white is None and black is None:  # Watching, who has which color isn't known
+            players = " vs ".join(names) or "No players"
+        else:
+            players = f"{white or '?'} vs {black or '?'}"
+        text = Text(f"{players}\n", overflow="ellipsis", no_wrap=True)
+        text.append_text(self.compact_board)
+        text.append(f"\n{self.color_to_str(self.board.turn)} to move, last {self.last_move or '-'}")
+        if self.timers_enabled:
+            now = time.monotonic()
+            white_time, black_time = self.clock.value(0, now), self.clock.value(1, now)
+            text.append(f"\n{self.format_timer(white_time)} | {self.format_timer(black_time)}")
+        return Panel(text, title=self.room_name, subtitle=self.connection_status() or self.board_state,
+                     subtitle_align="right")
+
+    async def handle_key(self, key):
+        # print(key)
+        match key:
+            case b'H':
+                self.cursor[0] -= 1 if self.cursor[0] > 0 else 0
+            case b'P':
+                self.cursor[0] += 1 if self.cursor[0] < 7 else 0
+            case b'K':
+                self.cursor[1] -= 1 if self.cursor[1] > 0 else 0
+            case b'M':
+                self.cursor[1] += 1 if self.cursor[1] < 7 else 0
+            case b'r':
+                await self.get_board(force=True)
+            case b's':
+                await self.send_save_request()
+            case b'c':
+                self.premoves.clear()
+            case b'h':
+                self.hints_enabled = not self.hints_enabled
+                if not self.hints_enabled:
+                    self.analysis.shutdown()
+            case b' ':
+                if self.piece_selected:
+                    move = chess.Move(chess.square(self.piece_origin[1], self.piece_origin[0]),
+                                      chess.square(self.cursor[1], self.cursor[0]))
+                    if self.board.turn == self.player_color and self.pending_move is None:
+                        # Check if the move is valid
+                        if self.is_promotion(move):
+                            move.promotion = chess.QUEEN
+                        if move in self.board.legal_moves:
+                            self.move_error = None
+                            self.submit_move(move)
+                        else:
+                            self.move_error = f"Invalid move: {move}"
+                    else:
+                        board = self.premove_board()
+                        if self.is_premove_candidate(board, move):
+                            if self.is_promotion(move, board):
+                                move.promotion = chess.QUEEN
+                            self.move_error = None
+                            self.premoves.append(move)
+                        else:
+                            self.move_error = f"Invalid premove: {move}"
+                    self.piece_selected = False
+                    self.selected_piece = None
+                else:
+                    self.piece_selected = True
+                    self.selected_piece = self.board.piece_at(chess.square(self.cursor[1], self.cursor[0]))
+                    self.piece_origin = self.cursor.copy()
+
+    async def tick(self, loops):
+        if self.resync_requested and (self.send_task is None or self.send_task.done()):
+            self.resync_requested = False
+            await self.get_board(force=True)
+        elif loops % (self.frame_rate * self.poll_interval) == 0:
+            await self.get_board()
+        if self.hints_enabled:
+            # Restarts the search in the background whenever the position changes
+            self.analysis.analyse(self.board)
+            self.analysis.poll()
+
+    async def close(self):
+        self.analysis.shutdown()
+        self.book.close()
+        await super().close()
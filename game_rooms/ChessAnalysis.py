@@ -0,0 +1,353 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.variant
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000  # Scores above this are mates, the distance is encoded in the difference
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+
+# How close each square is to the centre of the board, 0 on the edge and 3 on the four centre squares
+CENTRALITY = [3 - int(max(abs(chess.square_file(square) - 3.5), abs(chess.square_rank(square) - 3.5)))
+              for square in chess.SQUARES]
+
+# Transposition table entry flags
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+
+class SearchAborted(Exception):
+    pass
+
+
+def evaluate(board):
+    """
+    Static evaluation of a position
+    :param board: Any python-chess board, variants are scored by their own win condition
+    :return: The score in centipawns from the perspective of the side to move
+    """
+    score = 0
+    for color, sign in ((chess.WHITE, 1), (chess.BLACK, -1)):
+        material = 0
+        for piece_type, value in PIECE_VALUES.items():
+            material += chess.popcount(board.pieces_mask(piece_type, color)) * value
+        positional = 0
+        for square in board.pieces(chess.KNIGHT, color) | board.pieces(chess.BISHOP, color):
+            positional += CENTRALITY[square] * 10
+        for square in board.pieces(chess.PAWN, color):
+            rank = chess.square_rank(square)
+            positional += (rank if color == chess.WHITE else 7 - rank) * 5 + CENTRALITY[square] * 3
+
+        if isinstance(board, chess.variant.AntichessBoard):
+            material = -material  # Losing pieces is the goal
+        elif isinstance(board, chess.variant.CrazyhouseBoard):
+            for piece_type, value in PIECE_VALUES.items():
+                material += board.pockets[color].count(piece_type) * value
+        elif isinstance(board, chess.variant.ThreeCheckBoard):
+            positional += (3 - board.remaining_checks[color]) * 150  # The checks this side has given
+        if isinstance(board, chess.variant.KingOfTheHillBoard):
+            king = board.king(color)
+            if king is not None:
+                positional += CENTRALITY[king] * 60
+        elif isinstance(board, chess.variant.RacingKingsBoard):
+            king = board.king(color)
+            if king is not None:
+                positional += chess.square_rank(king) * 80
+        score += sign * (material + positional)
+    return score if board.turn == chess.WHITE else -score
+
+
+def terminal_score(board, ply):
+    """
+    Scores a position that has no legal moves or has ended through its variant's rules
+    :param board:
+    :param ply: The distance from the root, so shorter mates are preferred
+    :return:
+    """
+    if board.is_variant_win():
+        return MATE_SCORE - ply
+    if board.is_variant_loss() or board.is_check():
+        return -MATE_SCORE + ply
+    return 0
+
+
+class Searcher:
+    """
+    Iterative deepening alpha-beta search with a transposition table, quiescence search and move ordering
+    (hash move, MVV-LVA captures and killer moves)
+    """
+
+    check_interval = 1024  # Nodes between time and cancellation checks
+
+    def __init__(self, board, time_budget, cancelled=None, max_depth=64):
+        self.board = board.copy(stack=False)
+        self.time_budget = time_budget
+        self.cancelled = cancelled  # Called periodically, the search stops once it returns True
+        self.max_depth = max_depth
+        self.deadline = 0
+        self.nodes = 0
+        self.table = {}  # type: dict[tuple, tuple] # key -> (depth, score, flag, best move)
+        self.killers = {}  # type: dict[int, list[chess.Move]]
+
+    def _key(self):
+        # The same key python-chess uses for repetition detection, variants include their pockets and check counts
+        return self.board._transposition_key()
+
+    def _check_limits(self):
+        if time.monotonic() >= self.deadline or (self.cancelled is not None and self.cancelled()):
+            raise SearchAborted()
+
+    def _order_moves(self, moves, hash_move, ply):
+        killers = self.killers.get(ply, ())
+
+        def priority(move):
+            if move == hash_move:
+                return 1000000
+            if self.board.is_capture(move):
+                victim = self.board.piece_type_at(move.to_square) or chess.PAWN  # En passant has no piece on the square
+                attacker = self.board.piece_type_at(move.from_square) or chess.PAWN  # Crazyhouse drops
+                return 10000 + PIECE_VALUES[victim] * 10 - PIECE_VALUES[attacker] // 10
+            if move.promotion:
+                return 9000 + PIECE_VALUES[move.promotion]
+            if move in killers:
+                return 8000
+            return 0
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def _store_killer(self, move, ply):
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+    def quiescence(self, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % self.check_interval == 0:
+            self._check_limits()
+        if self.board.is_variant_end():
+            return terminal_score(self.board, ply)
+        stand_pat = evaluate(self.board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        for move in self._order_moves(list(self.board.generate_legal_captures()), None, ply):
+            self.board.push(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            self.board.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % self.check_interval == 0:
+            self._check_limits()
+        if ply > 0 and (self.board.is_variant_end() or self.board.halfmove_clock >= 100):
+            return terminal_score(self.board, ply) if self.board.is_variant_end() else 0
+
+        key = self._key()
+        entry = self.table.get(key)
+        hash_move = None
+        if entry is not None:
+            entry_depth, entry_score, flag, hash_move = entry
+            if ply > 0 and entry_depth >= depth:
+                # Mate scores are stored relative to the node, convert back to the distance from the root
+                if entry_score > MATE_THRESHOLD:
+                    entry_score -= ply
+                elif entry_score < -MATE_THRESHOLD:
+                    entry_score += ply
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if flag == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        moves = list(self.board.legal_moves)
+        if not moves:
+            return terminal_score(self.board, ply)
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = None
+        for move in self._order_moves(moves, hash_move, ply):
+            quiet = not self.board.is_capture(move)
+            self.board.push(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            self.board.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if quiet:
+                    self._store_killer(move, ply)
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        stored_score = best_score
+        if stored_score > MATE_THRESHOLD:
+            stored_score += ply
+        elif stored_score < -MATE_THRESHOLD:
+            stored_score -= ply
+        self.table[key] = (depth, stored_score, flag, best_move)
+        return best_score
+
+    def principal_variation(self, max_length):
+        """
+        Follows the best moves stored in the transposition table from the root
+        :param max_length:
+        :return: A list of moves
+        """
+        board = self.board.copy(stack=False)
+        variation = []
+        while len(variation) < max_length:
+            entry = self.table.get(board._transposition_key())
+            if entry is None or entry[3] is None or not board.is_legal(entry[3]):
+                break
+            variation.append(entry[3])
+            board.push(entry[3])
+        return variation
+
+    def search(self):
+        """
+        Searches the position until the time budget runs out, the maximum depth is reached or the search is cancelled
+        :return: A dict describing the deepest completed search, None if not even depth 1 finished
+        """
+        start = time.monotonic()
+        self.deadline = start + self.time_budget
+        result = None
+        if not any(self.board.legal_moves) or self.board.is_variant_end():
+            return result
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score = self.negamax(depth, -MATE_SCORE - 1, MATE_SCORE + 1, 0)
+            except SearchAborted:
+                break
+            variation = self.principal_variation(depth)
+            if not variation:
+                break
+            elapsed = max(time.monotonic() - start, 1e-9)
+            mate = None
+            if abs(score) > MATE_THRESHOLD:
+                plies = MATE_SCORE - abs(score)
+                mate = (plies + 1) // 2 if score > 0 else -((plies + 1) // 2)
+            result = {
+                "move": variation[0].uci(),
+                "san": self.board.san(variation[0]),
+                "pv": [move.uci() for move in variation],
+                "score": score,
+                "mate": mate,
+                "depth": depth,
+                "nodes": self.nodes,
+                "time": elapsed,
+                "nps": int(self.nodes / elapsed),
+            }
+            if mate is not None:
+                break
+        return result
+
+
+_generation = None  # Shared with the parent process through the pool initializer
+
+
+def _init_worker(generation):
+    global _generation
+    _generation = generation
+
+
+def analyse_position(board, generation, time_budget):
+    """
+    Runs a search inside a worker process, giving up as soon as the parent moves on to a newer position
+    :param board: The board to analyse
+    :param generation: The parent's position counter when this search was requested
+    :param time_budget: Seconds the search may take
+    :return:
+    """
+    searcher = Searcher(board, time_budget, cancelled=lambda: _generation.value != generation)
+    result = searcher.search()
+    if result is not None:
+        result["generation"] = generation
+    return result
+
+
+class AnalysisEngine:
+    """
+    Analyses positions in a separate process so a search never blocks the room's update loop
+    """
+
+    def __init__(self, time_budget=3.0):
+        self.time_budget = time_budget
+        # Both made on the first request, rooms that are never analysed (like the dashboard's tiles) don't pay for them
+        self.generation = None  # Counts positions, shared with the search process so it can stop a stale search
+        self.executor = None  # type: ProcessPoolExecutor or None
+        self.future = None
+        self.position = None
+        self.result = None
+
+    def analyse(self, board):
+        """
+        Starts analysing a position, cancelling the running search if the position has changed.
+        Does nothing if the position is already being (or has been) analysed
+        :param board:
+        :return:
+        """
+        position = (type(board).__name__, board.fen())
+        if position == self.position:
+            return
+        self.position = position
+        self.result = None
+        if self.generation is None:
+            self.generation = multiprocessing.Value("i", 0)
+        with self.generation.get_lock():
+            self.generation.value += 1
+            generation = self.generation.value
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                                initargs=(self.generation,))
+        self.future = self.executor.submit(analyse_position, board.copy(stack=False), generation,
+                                           self.time_budget)
+
+    def poll(self):
+        """
+        Collects the result of the current search once it has finished
+        :return: The latest result for the current position or None
+        """
+        if self.future is not None and self.future.done():
+            future, self.future = self.future, None
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            if result is not None and result["generation"] == self.generation.value:
+                self.result = result
+        return self.result
+
+    def shutdown(self):
+        if self.generation is not None:
+            with self.generation.get_lock():
+                self.generation.value += 1  # Stops the running search
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.future = None
+        self.position = None
+        self.result = None
@@ -0,0 +1,157 @@
+import csv
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import chess
+import chess.polyglot
+
+
+class OpeningBook:
+    """
+    Looks up book moves and opening names for standard chess positions.
+    Polyglot books (*.bin) in the book folder are memory mapped and binary searched on the position's Zobrist hash,
+    so even very large books are never read into memory. Opening names are read from tab separated files (*.tsv)
+    with eco, name and pgn columns, the same layout as the lichess chess-openings files
+    """
+
+    max_cached_positions = 4096
+
+    def __init__(self, book_dir="books"):
+        self.book_dir = book_dir
+        self.book_paths = []
+        self.name_paths = []
+        if os.path.isdir(book_dir):
+            for file in sorted(os.listdir(book_dir)):
+                if file.endswith(".bin"):
+                    self.book_paths.append(os.path.join(book_dir, file))
+                elif file.endswith(".tsv"):
+                    self.name_paths.append(os.path.join(book_dir, file))
+        self.readers = None  # type: list[chess.polyglot.MemoryMappedReader] or None # Opened on the first lookup
+        self.names = None  # type: dict[int, tuple[str, str]] or None # Zobrist hash -> (eco, name)
+        self.names_lock = threading.Lock()  # Loaded by whichever of the UI and book threads needs the names first
+        self.cache = {}  # type: dict[int, dict] # Zobrist hash -> lookup result
+        self.pending = {}  # Zobrist hash -> future of a lookup that hasn't finished yet
+        # Started on the first lookup, so rooms only shown as tiles on the spectator dashboard never start one
+        self.executor = None  # type: ThreadPoolExecutor or None
+
+    @property
+    def available(self):
+        return bool(self.book_paths or self.name_paths)
+
+    def _open_books(self):
+        self.readers = []
+        for path in self.book_paths:
+            try:
+                self.readers.append(chess.polyglot.open_reader(path))
+            except (OSError, ValueError) as e:
+                logging.error(f"Error opening book {path}: {e}")
+
+    def _load_names(self):
+        """
+        Loads the opening names the first time they are needed
+        :return: Zobrist hash -> (eco, name)
+        """
+        with self.names_lock:
+            if self.names is None:
+                self.names = self._read_names()
+        return self.names
+
+    def _read_names(self):
+        names = {}
+        for path in self.name_paths:
+            try:
+                with open(path, "r", encoding="utf-8", newline="") as file:
+                    for row in csv.DictReader(file, delimiter="\t"):
+                        board = chess.Board()
+                        try:
+                            for token in row["pgn"].split():
+                                if not token[0].isdigit():  # Skip the move numbers
+                                    board.push_san(token)
+                        except ValueError:
+                            continue
+                        names[chess.polyglot.zobrist_hash(board)] = (row["eco"], row["name"])
+            except (OSError, KeyError) as e:
+                logging.error(f"Error reading opening names from {path}: {e}")
+        return names
+
+    def _lookup(self, board, key):
+        """
+        Runs on the book thread
+        :param board: A copy of the board to look up
+        :param key: The board's Zobrist hash
+        :return:
+        """
+        if self.readers is None:
+            self._open_books()
+        weights = {}
+        for reader in self.readers:
+            for entry in reader.find_all(board):
+                weights[entry.move] = weights.get(entry.move, 0) + entry.weight
+        total = sum(weights.values())
+        # Should a book only have weightless entries for a position, the moves are shared out evenly
+        moves = [(board.san(move), weight / total if total else 1 / len(weights))
+                 for move, weight in sorted(weights.items(), key=lambda item: item[1], reverse=True)]
+        eco, name = self._load_names().get(key, (None, None))
+        return {"moves": moves, "eco": eco, "name": name}
+
+    def opening_name(self, board):
+        """
+        Looks up the name of a position straight away, for use outside of the render loop
+        :param board:
+        :return: (eco, name), both None if the position has no name
+        """
+        return self._load_names().get(chess.polyglot.zobrist_hash(board), (None, None))
+
+    def lookup(self, board):
+        """
+        Gets the book moves and opening name of a position without blocking, the first call for a position
+        starts the lookup and returns None until it has finished
+        :param board:
+        :return: A dict with the book moves as (san, share) pairs and the position's eco code and name, or None
+        """
+        if not self.available or type(board) is not chess.Board:  # Books only cover standard chess
+            return None
+        key = chess.polyglot.zobrist_hash(board)
+        self._collect(key)
+        if key in self.cache:
+            return self.cache[key]
+        if key not in self.pending:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            self.pending[key] = self.executor.submit(self._lookup, board.copy(stack=False), key)
+        return None
+
+    def _collect(self, key):
+        """
+        Moves every finished lookup into the cache and cancels the lookups of positions that have been left before
+        they started, so positions that are passed through quickly don't queue up or stay pending forever
+        :param key: The Zobrist hash of the position being looked up, its lookup is kept
+        :return:
+        """
+        for pending_key, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[pending_key]
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Error looking up book moves: {e}")
+                    result = {"moves": [], "eco": None, "name": None}
+                if len(self.cache) >= self.max_cached_positions:
+                    self.cache.clear()
+                self.cache[pending_key] = result
+            elif pending_key != key and future.cancel():
+                del self.pending[pending_key]
+
+    def close(self):
+        if self.executor is not None:
+            # Waits for a lookup that is already running, it would read from the readers closed below
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        for reader in self.readers or []:
+            reader.close()
+        self.readers = None
+        self.pending.clear()
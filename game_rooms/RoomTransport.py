@@ -0,0 +1,273 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+
+class ServerUnavailable(aiohttp.ClientConnectionError):
+    """
+    Raised instead of sending a request while the server's circuit breaker is open
+    """
+
+    def __init__(self, retry_in):
+        super().__init__(f"Reconnecting to the server, next try in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a server that keeps failing. After `threshold` requests in a row fail, retries included,
+    the breaker opens and requests fail straight away, until a cooldown has passed and a single trial request is let
+    through. Each failed trial doubles the cooldown, with jitter so the clients of a struggling server don't all come
+    back at once.
+    Only a server that doesn't answer, or answers 502, 503 or 504, counts as failing, any other reply shows it is up
+    """
+
+    def __init__(self, threshold=3, cooldown=1.0, max_cooldown=30.0):
+        """
+        :param threshold: Failed requests in a row that open the breaker
+        :param cooldown: Seconds the breaker first stays open for
+        :param max_cooldown: The longest the cooldown grows to
+        """
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown  # Doubles with every failed trial
+        self.failures = 0  # Failures in a row
+        self.retry_at = None  # type: float or None # time.monotonic() the next trial may be sent, None while closed
+        self.trial = False  # True while the trial request is in flight
+
+    @property
+    def open(self):
+        return self.retry_at is not None
+
+    def retry_in(self):
+        return max(0.0, self.retry_at - time.monotonic()) if self.open else 0.0
+
+    def allow(self):
+        """
+        :return: True if a request may be sent now
+        """
+        if not self.open:
+            return True
+        if self.trial or self.retry_in() > 0:
+            return False
+        self.trial = True
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.retry_at = None
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        if self.open:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)  # The trial failed
+        elif self.failures < self.threshold:
+            return
+        self.retry_at = time.monotonic() + self.cooldown * random.uniform(0.5, 1.5)
+        self.trial = False
+
+    def release(self):
+        """
+        Lets another trial through if the trial request was abandoned before the server answered
+        :return:
+        """
+        self.trial = False
+
+    def status(self):
+        """
+        :return: What to show the user while the breaker is open, None while it is closed
+        """
+        if not self.open:
+            return None
+        return "Reconnecting..." if self.trial else f"Reconnecting, next try in {self.retry_in():.0f}s"
+
+
+class PendingRequest:
+    """
+    A request the transport is sending, use as `async with` to get the response
+    """
+
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+        self.response = None  # type: aiohttp.ClientResponse or None
+
+    async def __aenter__(self):
+        self.response = await self.coroutine
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        self.response.release()
+
+
+class RoomTransport:
+    """
+    A pool of keep-alive connections to one server.
+    Every room given the same transport shares its connections, instead of opening a session (and a new connection)
+    for every request. The user hash is sent with each request, so clients logged in as different users can share it.
+    A server on the same machine can be reached over a Unix domain socket instead of TCP, by giving "unix:" and the
+    socket's path as the host.
+    Failed requests are retried with exponential backoff and jitter, within the request's timeout. Only requests that
+    are safe to repeat are retried, a request that may have reached the server, such as a move, is never sent twice
+    unless the caller says it can be. Every request to the server goes through one CircuitBreaker, so once the server
+    stops answering the rooms stop polling it until it is back
+    """
+
+    idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    retry_statuses = {502, 503, 504}  # Replies from a server (or a proxy in front of it) that is struggling
+
+    def __init__(self, host, port, limit=16, timeout=10, attempts=3, attempt_timeout=4, backoff=0.2, max_backoff=2.0):
+        """
+        :param host: The server's host, or "unix:/path/to/socket" for a Unix domain socket
+        :param port: The server's port, not used for Unix domain sockets
+        :param limit: The most connections open to the server at once, requests past this wait for a free connection
+        :param timeout: Seconds before a request is abandoned, retries included
+        :param attempts: The most times a request is sent
+        :param attempt_timeout: Seconds before one try of a request that can be retried is given up on
+        :param backoff: Seconds the first retry waits for at most, doubling for each retry after it
+        :param max_backoff: The longest wait between tries
+        """
+        self.host = host
+        self.port = port
+        self.limit = limit
+        self.timeout = timeout
+        self.attempts = attempts
+        self.attempt_timeout = attempt_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker()
+        self._session = None  # type: aiohttp.ClientSession or None # Opened on the first request
+        self._loop = None  # The event loop the session was opened on
+        self._closing = set()  # Tasks closing sessions left behind on other event loops
+
+    @property
+    def unix_path(self):
+        """
+        The path of the server's Unix domain socket, or None for a server reached over TCP
+        """
+        return self.host[len("unix:"):] if str(self.host).startswith("unix:") else None
+
+    @property
+    def base_url(self):
+        if self.unix_path is not None:
+            return "http://localhost"  # Only used for the Host header, the connector opens the socket
+        return f"http://{self.host}:{self.port}"
+
+    def make_connector(self):
+        if self.unix_path is not None:
+            return aiohttp.UnixConnector(path=self.unix_path, limit=self.limit, keepalive_timeout=30)
+        return aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=30)
+
+    @property
+    def session(self):
+        loop = asyncio.get_running_loop()
+        # A session can't outlive its event loop, a transport used from another asyncio.run gets a new one
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None:
+                # Closed in the background, the request doesn't wait for the old session
+                task = asyncio.ensure_future(self._close_session(self._session, self._loop))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            # Cookies are sent per request, the jar would otherwise mix up the hashes of different users
+            self._session = aiohttp.ClientSession(
+                connector=self.make_connector(),
+                cookie_jar=aiohttp.DummyCookieJar(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+        return self._session
+
+    def request(self, method, path, user_hash=None, cookie="user_hash", retry=None, **kwargs):
+        """
+        Sends a request to the server, use as `async with transport.request(...) as resp:`
+        :param method: The HTTP method
+        :param path: The path on the server, starting with a /
+        :param user_hash: The hash of the user sending the request or None
+        :param cookie: The name of the cookie the endpoint reads the user hash from
+        :param retry: Whether the request may be sent again if it fails, by default only idempotent methods are, along
+        with any request that couldn't connect as it never reached the server. False means it is only ever sent once
+        :param kwargs: Passed on to aiohttp, such as json
+        :return:
+        """
+        retry_connect = retry is not False
+        if retry is None:
+            retry = method.upper() in self.idempotent_methods
+        cookies = {cookie: user_hash} if user_hash is not None else None
+        return PendingRequest(self.send(method, f"{self.base_url}{path}", retry, retry_connect, cookies=cookies,
+                                        **kwargs))
+
+    async def send(self, method, url, retry, retry_connect=True, **kwargs):
+        """
+        Sends a request, retrying it while that is safe and there is time left
+        :return: The response, a 5xx is returned once the retries run out
+        :raises ServerUnavailable: If the circuit breaker is open
+        :raises aiohttp.ClientError: Or asyncio.TimeoutError, if the last try failed
+        """
+        deadline = time.monotonic() + self.timeout
+        for attempt in range(1, self.attempts + 1):
+            if not self.breaker.allow():
+                raise ServerUnavailable(self.breaker.retry_in())
+            trial = self.breaker.open  # Let through while open, so this is the breaker's one trial request
+            remaining = deadline - time.monotonic()
+            # Retrying is only worth it if one lost request can't use up the whole timeout
+            timeout = min(remaining, self.attempt_timeout) if retry else remaining
+            response = error = None
+            reached_server = True
+            try:
+                response = await self.session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                                      **kwargs)
+            except aiohttp.ClientConnectorError as e:
+                error = e
+                reached_server = False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            except BaseException:
+                if trial:
+                    self.breaker.release()  # Cancelled, the server's health is still unknown
+                raise
+            if response is not None and response.status not in self.retry_statuses:
+                self.breaker.success()
+                return response
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+            # The breaker's trial request is only sent once, if it fails the breaker waits longer
+            if attempt == self.attempts or self.breaker.open or (not retry and (reached_server or not retry_connect)) \
+                    or time.monotonic() + delay >= deadline:
+                self.breaker.failure()
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.release()
+            await asyncio.sleep(delay)
+
+    def get(self, path, user_hash=None, **kwargs):
+        return self.request("GET", path, user_hash, **kwargs)
+
+    def post(self, path, user_hash=None, **kwargs):
+        return self.request("POST", path, user_hash, **kwargs)
+
+    @staticmethod
+    async def _close_session(session, loop):
+        """
+        Closes a session on the event loop it was opened on, the only loop its connections can be closed from
+        :param session:
+        :param loop: The event loop the session was opened on
+        :return:
+        """
+        if session.closed:
+            return
+        if loop is asyncio.get_running_loop() or loop.is_closed():
+            await session.close()  # On a closed loop this only marks the session and its connector closed
+        elif loop.is_running():  # In another thread
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+        else:  # Stopped, such as after an earlier run_until_complete, so it is run once more in a thread to close it
+            await asyncio.to_thread(loop.run_until_complete, session.close())
+
+    async def close(self):
+        session, self._session = self._session, None
+        if session is not None:
+            await self._close_session(session, self._loop)
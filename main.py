@@ -11,13 +11,18 @@ from rich.console import Console
 
 from pick import pick
 
-import aiohttp
 import asyncio
 import json
 import socket
 import netifaces
 
+from LatencyProbe import LatencyProbe
+from Lobby import Lobby
+from ServerDirectory import ServerDirectory, BeaconListener
 from ServerInterface import ServerInterface
+from ServerMenu import ServerMenu
+from ServerPool import ServerPool
+from SpectatorDashboard import SpectatorDashboard
 
 
 def get_interfaces():
@@ -39,15 +44,25 @@ def get_interfaces():
 
 class Main:
 
-    def __init__(self):
+    def __init__(self, auto_connect=False):
+        """
+        :param auto_connect: Connect to the best responding server this client has logged in to without asking
+        """
         self.console = Console()
         self.ping_queue = asyncio.Queue()
 
         if not os.path.exists("servers.json"):
             json.dump({}, open("servers.json", "w"))
 
+        # Servers that start later are heard from by their beacons, kept in the directory while the client runs
+        self.directory = ServerDirectory()
+        self.beacon_listener = BeaconListener(self.directory)
+        self.beacon_listener.start()
+
         with self.console.status("[bold green]Preforming multicast discovery...[/bold green]") as status:
             discovered_servers = self.multicast_discovery(console_status=status)
+            for info in discovered_servers.values():
+                self.directory.update(info)
             loaded_servers = json.load(open("servers.json", "r"))
 
             # Merge the two dictionaries, if there are any duplicates, the loaded servers will be used unless
@@ -90,43 +105,37 @@ class Main:
                             f"- {info['name'].ljust(longest_name)}@{info['host']}:{info['port']}")
                     elif "known" not in info:
                         self.console.print(
-                            f"[blue ][DISCOVERED] {info['response_time']:.2f}ms[/blue ]".ljust(45) +
+                            f"[blue ][DISCOVERED] {info['latency']}[/blue ]".ljust(45) +
                             f"- {info['name'].ljust(longest_name)}@{info['host']}:{info['port']}")
                     else:
                         self.console.print(
-                            f"[green][ONLINE] {info['response_time']:.2f}ms[/green]".ljust(45) +
+                            f"[green][ONLINE] {info['latency']}[/green]".ljust(45) +
                             f"- {info['name'].ljust(longest_name)}@{info['host']}:{info['port']}")
                 if len(still_pinging) == 0:
                     finished = True
 
         time.sleep(1)
 
-        title = "Please choose a server: "
-        options = []
-        for server, info in self.servers.items():
-            if not info["online"]:
-                options.append(f"{info['name'].ljust(longest_name)}@{info['host']}:{info['port']}".
-                               ljust(45) + " - OFFLINE")
-            elif "known" not in info:
-                options.append(f"{info['name'].ljust(longest_name)}@{info['host']}:{info['port']}".ljust(
-                    45) + f" - DISCOVERED {info['response_time']:.2f}ms")
-            else:
-                options.append(f"{info['name'].ljust(longest_name)}@{info['host']}:{info['port']}".ljust(
-                    45) + f" - ONLINE {info['response_time']:.2f}ms")
-
-        options.append("Manually add a server")
-        options.append("Exit")
-        option, index = pick(options, title, indicator="=>")
-
-        if option == "Manually add a server":
-            host = self.console.input("Please enter the host: ")
-            port = self.console.input("Please enter the port: ")
-        elif option == "Exit":
-            sys.exit(0)
-        else:
-            # Determine selection from index
-            host = self.servers[list(self.servers.keys())[index]]["host"]
-            port = self.servers[list(self.servers.keys())[index]]["port"]
+        # Best first: servers answering every probe, then by median and p95 latency. The menu keeps adding servers
+        # heard from by the beacon listener
+        menu = ServerMenu(self.console, self.servers, self.directory, auto_connect)
+        action, server_id = asyncio.run(menu.run())
+
+        self.server_interface = None
+        self.server_pool = None
+        match action:
+            case "all":
+                self.server_pool = ServerPool(self.servers, self.console, directory=self.directory)
+                return
+            case "manual":
+                host = self.console.input("Please enter the host (or unix:/path/to/socket): ")
+                # A server on this machine can be reached through its Unix socket, which has no port
+                port = None if host.startswith("unix:") else self.console.input("Please enter the port: ")
+            case "exit":
+                sys.exit(0)
+            case _:
+                host = self.servers[server_id]["host"]
+                port = self.servers[server_id]["port"]
 
         # Look for user.txt in the same directory as this file.
         # If it doesn't exist, connect to the server and create a new user.
@@ -144,39 +153,17 @@ class Main:
 
     @staticmethod
     async def check_server_status_thread(server_id, info, queue):
+        probe = LatencyProbe(info["host"], info["port"])
         try:
-            host, port = info["host"], info["port"]
-            async with aiohttp.ClientSession() as session:
-                start_time = time.time()
-                async with session.get(f"http://{host}:{port}/get_server_id", timeout=5) as response:
-                    info["response_time"] = (time.time() - start_time) * 1000
-                    if response.status == 200:
-                        # Update the values of the server
-                        info["online"] = True
-                        queue.put_nowait((server_id, info))
-                    else:
-                        info["online"] = False
-                        queue.put_nowait((server_id, info))
+            await probe.run()
+            info["online"] = probe.online
+            info["response_time"] = probe.median
         except Exception as e:
+            info["online"] = False
             info["error"] = e
-            queue.put_nowait((server_id, info))
-
-    def build_name_list(self):
-        names = []
-        # Get the longest name so we can format the list nicely
-        if len(self.server_interface.rooms) > 0:
-            longest_name = max([len(room) for room in self.server_interface.rooms])
-        else:
-            longest_name = 0
-        option_num = 1
-        for room in self.server_interface.rooms.values():
-            # self.console.print(room)
-            name = room["name"].ljust(longest_name)
-            names.append(f"{option_num}# '{name}'({room['type']}) - {len(room['users'])}/{room['max_users']} users | "
-                         f"Password: {'Yes' if room['password_protected'] else 'No'} |"
-                         f" Joinable: {'Yes' if room['joinable'] else 'No'}")
-            option_num += 1
-        return names
+        info["latency"] = probe.summary()
+        info["rank"] = probe.rank()  # The server menu is sorted by this
+        queue.put_nowait((server_id, info))
 
     def load_save_files(self):
         """
@@ -184,6 +171,8 @@ class Main:
         :return:
         """
         save_files = []
+        if not os.path.isdir("saves"):  # Nothing has been saved yet
+            return save_files
         for file in os.listdir("saves"):
             if file.endswith(".room"):
                 save_files.append(os.path.join("saves", file))
@@ -193,62 +182,79 @@ class Main:
         # Create a header that will be displayed at the top of the screen and persist
         self.console.clear()
         time.sleep(1)
-        options = ["Load Existing Rooms", "Load Saved Game", "Exit"]
-        option, index = pick(options, "Please pick an option", indicator="=>")
-
-        if option == "Load Saved Game":
-            self.load_saved_game()
-        elif option == "Load Existing Rooms":
-            self.load_existing_rooms()
-        elif option == "Exit":
+        if self.server_pool is not None:
+            asyncio.run(self.server_pool.run())
             self.console.print("Goodbye!")
             sys.exit()
+        options = ["Load Existing Rooms", "Load Saved Game", "Spectate Rooms", "Exit"]
+        # Each menu returns here when the user backs out of it
+        while True:
+            option, index = pick(options, "Please pick an option", indicator="=>")
+
+            if option == "Load Saved Game":
+                self.load_saved_game()
+            elif option == "Load Existing Rooms":
+                self.load_existing_rooms()
+            elif option == "Spectate Rooms":
+                self.spectate_rooms()
+            elif option == "Exit":
+                self.console.print("Goodbye!")
+                sys.exit()
 
     def load_saved_game(self):
         # For each save file query the server for the save info
         save_files = self.load_save_files()
-        info_json = {}
+        saves = []  # (room id, save info) of the saves the server still has
         for file in save_files:
             with open(file, "r") as f:
-                room_id = f.read()
-            info_json[room_id] = asyncio.run(self.server_interface.get_save_info(room_id))
+                room_id = f.read().strip()
+            info = self.server_interface.run(self.server_interface.get_save_info(room_id))
+            if info is not None:
+                saves.append((room_id, info))
         # Display the save files
         save_names = []
         save_names.extend([f"{info['name']}({info['room_type']}) - {len(info['users'])}/{info['max_users']} users | "
                            f"Password: {'Yes' if info['password_protected'] else 'No'} | Joinable: {'Yes' if info['joinable'] else 'No'}"
-                           for info in info_json.values() if info is not None])
+                           for _, info in saves])
         save_names.append("Back")
         option, index = pick(save_names, "Please choose a room: ", indicator="=>")
-        if option == "Back":
-            self.main()
-        else:
-            # Get the room by the index
-            room_id = list(info_json.keys())[index - 1]
-            self.console.print(f"Joining room {room_id}...")
-            asyncio.run(self.server_interface.join_room(room_id))
+        if option != "Back":
+            room_id = saves[index][0]
+            self.server_interface.run(self.server_interface.get_rooms())
+            if room_id in self.server_interface.rooms:  # Someone has loaded it already, so it is joined like any room
+                self.console.print(f"Joining room {room_id}...")
+                self.server_interface.run(self.server_interface.join_room(room_id))
+            else:
+                self.console.print(f"Loading room {room_id}...")
+                self.server_interface.run(self.server_interface.load_room(room_id))
 
     def load_existing_rooms(self):
-        self.console.print("Loading rooms...")
-        room_names = ["Create new room"]
-        room_names.extend(self.build_name_list())
-        room_names.append("Refresh")
-        room_names.append("Quit")
-        option, index = pick(room_names, "Please choose a room: ", indicator="=>")
-        if option == "Create new room":
-            asyncio.run(self.server_interface.create_room())
-        elif option == "Quit":
-            self.console.print("Goodbye!")
-            sys.exit()
-        elif option == "Refresh":
-            self.console.print("Refreshing rooms...")
-            time.sleep(1)
-            asyncio.run(self.server_interface.get_rooms())
-            self.main()
-        else:
-            # Get the room by the index
-            room_name = list(self.server_interface.rooms)[index - 1]
-            self.console.print(f"Joining room {room_name}...")
-            asyncio.run(self.server_interface.join_room(room_name))
+        """
+        Shows the lobby, returning to it whenever the user leaves a room until they back out of it
+        :return:
+        """
+        lobby = Lobby(self.server_interface, self.console)
+        while True:
+            action, room_id = self.server_interface.run(lobby.run())
+            if action == "create":
+                self.server_interface.run(self.server_interface.create_room())
+            elif action == "join":
+                self.console.print(f"Joining room {self.server_interface.rooms[room_id]['name']}...")
+                self.server_interface.run(self.server_interface.join_room(room_id))
+            else:
+                return
+
+    def spectate_rooms(self):
+        """
+        Lets the user pick any number of rooms and watches them all on the spectator dashboard
+        :return:
+        """
+        action, room_ids = self.server_interface.run(
+            Lobby(self.server_interface, self.console, multiselect=True).run())
+        if action != "watch":
+            return
+        dashboard = SpectatorDashboard(self.server_interface, room_ids, self.console)
+        asyncio.run(dashboard.run())
 
     def multicast_discovery(self, timeout=1, port=5007, console_status=None):
         """
@@ -263,7 +269,7 @@ class Main:
         ttl = struct.pack('b', 5)
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
 
-        multicast_groups = ['224.0.0.255', '224.0.1.255', '224.0.255.255', '233.255.255.255', '234.255.255.255']
+        multicast_groups = BeaconListener.groups
 
         # create multicast message
 
@@ -312,12 +318,15 @@ class Main:
 
     def logout(self):
         self.console.print("Logging out...")
-        asyncio.run(self.server_interface.logout())
+        if self.server_pool is not None:
+            asyncio.run(self.server_pool.logout())
+        else:
+            self.server_interface.run(self.server_interface.logout())
 
 
 if __name__ == "__main__":
     # Check if this client should be ananonymous via a command line argument
-    main = Main()
+    main = Main(auto_connect="--best" in sys.argv)
     try:
         main.main()
     except KeyboardInterrupt:
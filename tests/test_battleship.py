@@ -0,0 +1,81 @@
+import io
+
+import pytest
+from rich.console import Console
+
+from game_rooms.Battleship import BattleShip
+
+
+@pytest.fixture
+def room():
+    """
+    A Battleship room with a 5 by 5 board and an unplaced fleet of a 3 and a 2, never connected to a server
+    """
+    room = BattleShip("test", "localhost", 0, Console(file=io.StringIO()))
+    room.board_size = 5
+    room.player_ships = [BattleShip.Ship(3, False), BattleShip.Ship(2, False)]
+    room.placing_ship = room.player_ships[0]
+    room.placing_ship.direction = "vertical"
+    return room
+
+
+def aim(room, x, y, direction="vertical"):
+    room.cursor = [x, y]
+    room.placing_ship.x, room.placing_ship.y, room.placing_ship.direction = x, y, direction
+
+
+def test_ship_off_the_board_is_invalid(room):
+    aim(room, 0, 3)
+    assert not room.placement_valid(room.placing_ship)
+    aim(room, 0, 2)
+    assert room.placement_valid(room.placing_ship)
+
+
+def test_place_ship_moves_on_to_the_next_ship(room):
+    aim(room, 0, 0)
+    assert not room.place_ship()  # One ship left
+    assert room.player_ships[0].placed
+    assert room.pending_placements == {0: (0, 0, "vertical")}
+    assert room.placing_ship is room.player_ships[1]
+    assert (room.placing_ship.x, room.placing_ship.y) == (0, 0)  # Picked up at the cursor
+
+
+def test_overlapping_ship_is_refused(room):
+    aim(room, 1, 1, "horizontal")
+    room.place_ship()
+    aim(room, 2, 0)  # Crosses the first ship at [2, 1]
+    assert room.occupancy() != 0
+    assert not room.place_ship()
+    assert room.placement_error is not None
+    assert not room.player_ships[1].placed
+    aim(room, 2, 2)
+    assert room.place_ship()  # The fleet is ready to send
+    assert room.placement_error is None
+    assert room.placing_ship is None
+
+
+def test_undo_picks_the_last_ship_back_up(room):
+    aim(room, 0, 0)
+    room.place_ship()
+    room.cursor = [3, 3]
+    room.undo_placement()
+    ship = room.player_ships[0]
+    assert room.placing_ship is ship
+    assert not ship.placed
+    assert (ship.x, ship.y) == (3, 3)
+    assert room.player_ships[1].x is None  # The ship that was being placed is put away
+    assert room.pending_placements == {}
+    assert room.occupancy() == 0
+
+
+def test_undo_without_local_placements_does_nothing(room):
+    room.undo_placement()
+    assert room.placing_ship is room.player_ships[0]
+
+
+def test_sync_keeps_the_ship_being_placed(room):
+    aim(room, 2, 2)
+    room.sync_ships(room.player_ships, [{"size": 3, "sunk": False, "placed": False},
+                                        {"size": 2, "sunk": False, "placed": False}], skip=room.placing_ship)
+    assert (room.player_ships[0].x, room.player_ships[0].y) == (2, 2)
+    assert room.player_ships[1].x is None
@@ -0,0 +1,199 @@
+import numpy as np
+
+from game_rooms.Battleship import BattleShip
+from game_rooms.BattleshipBoard import BoardModel, HIT, MISS, NO_SHIP, ship_bits
+
+
+def test_set_ships_marks_dict_ships():
+    model = BoardModel(5)
+    model.set_ships([{"size": 3, "x": 1, "y": 0, "direction": "horizontal"},
+                     {"size": 2, "x": 4, "y": 2, "direction": "vertical"}])
+    assert model.ship_ids[1:4, 0].tolist() == [0, 0, 0]
+    assert model.ship_ids[4, 2:4].tolist() == [1, 1]
+    assert np.count_nonzero(model.ship_mask) == 5
+    assert model.ship_sizes.tolist() == [3, 2]
+
+
+def test_set_ships_marks_ship_objects():
+    model = BoardModel(5)
+    model.set_ships([BattleShip.Ship(2, False, 0, 3, "vertical")])
+    assert model.ship_ids[0, 3:5].tolist() == [0, 0]
+    assert model.ship_positions == [(0, 3, "vertical")]
+
+
+def test_set_ships_skips_ships_without_a_position():
+    model = BoardModel(5)
+    model.set_ships([{"size": 3}, {"size": 2, "x": 0, "y": 0, "direction": "vertical"}])
+    assert model.ship_positions[0] is None
+    assert np.count_nonzero(model.ship_ids == 0) == 0
+    assert np.count_nonzero(model.ship_ids == 1) == 2
+    assert model.ship_sizes.tolist() == [3, 2]  # Still counted in the fleet
+
+
+def test_set_ships_leaves_the_skipped_ship_off_the_board():
+    model = BoardModel(5)
+    placing = BattleShip.Ship(3, False, 0, 0, "horizontal")
+    model.set_ships([placing], skip=placing)
+    assert not model.ship_mask.any()
+    assert model.ship_positions == [None]
+
+
+def test_moved_ships_clear_their_old_tiles():
+    model = BoardModel(5)
+    model.set_ships([{"size": 2, "x": 0, "y": 0, "direction": "vertical"}])
+    model.set_ships([{"size": 2, "x": 3, "y": 3, "direction": "vertical"}])
+    assert (model.ship_ids[0, 0:2] == NO_SHIP).all()
+    assert model.ship_mask[3, 3:5].all()
+    assert np.count_nonzero(model.ship_mask) == 2
+
+
+def test_unchanged_ships_keep_the_version():
+    model = BoardModel(5)
+    ships = [{"size": 2, "x": 0, "y": 0, "direction": "vertical"}]
+    model.set_ships(ships)
+    version = model.version
+    model.set_ships([dict(ship) for ship in ships])
+    assert model.version == version
+    ships[0]["x"] = 1
+    model.set_ships(ships)
+    assert model.version == version + 1
+
+
+def test_resizing_the_board_remarks_the_ships():
+    model = BoardModel(5)
+    ships = [{"size": 2, "x": 0, "y": 0, "direction": "vertical"}]
+    model.set_ships(ships)
+    model.update({"board": [[0] * 8 for _ in range(8)]})
+    model.set_ships(ships)
+    assert model.ship_mask.shape == (8, 8)
+    assert model.ship_mask[0, 0:2].all()
+
+
+def test_health_mask_clears_the_hit_segments():
+    model = BoardModel(5)
+    tiles = np.zeros((5, 5), dtype=np.uint8)
+    tiles[2, 0] = HIT  # The second segment of the horizontal ship
+    tiles[4, 4] = HIT  # Open water
+    model.update({"board": tiles.tolist()})
+    model.set_ships([{"size": 3, "x": 1, "y": 0, "direction": "horizontal"},
+                     {"size": 2, "x": 0, "y": 3, "direction": "vertical"}])
+    assert model.health_mask(0) == 0b101
+    assert model.health_mask(1) == 0b11
+
+
+def test_health_mask_of_a_sunk_ship_is_zero():
+    model = BoardModel(5)
+    tiles = np.zeros((5, 5), dtype=np.uint8)
+    tiles[0, 3:5] = HIT
+    model.update({"board": tiles.tolist()})
+    model.set_ships([{"size": 2, "x": 0, "y": 3, "direction": "vertical"}])
+    assert model.health_mask(0) == 0
+    assert model.sunk_ships().tolist() == [True]
+    assert model.remaining_tiles == 0
+
+
+def test_health_mask_of_a_hidden_ship_is_full():
+    model = BoardModel(5)
+    model.update({"board": np.full((5, 5), HIT).tolist()})
+    model.set_ships([{"size": 4}])
+    assert model.health_mask(0) == 0b1111
+
+
+def test_ship_health_follows_the_server():
+    ship = BattleShip.Ship(3, False)
+    assert ship.health_str() == "3/3"
+    ship.health = 0b101
+    ship.net_update(3, False, True, 0, 0, "vertical")
+    assert ship.health == 0b101  # Kept until the board model says otherwise
+    ship.net_update(3, True, True, 0, 0, "vertical")
+    assert ship.health_str() == "0/3"
+
+
+def test_ship_bits_vertical_ships_are_consecutive_bits():
+    assert ship_bits(0, 0, 3, "vertical", 5) == 0b111
+    assert ship_bits(1, 2, 2, "vertical", 5) == 0b11 << 7
+
+
+def test_ship_bits_horizontal_ships_step_a_whole_row():
+    assert ship_bits(0, 1, 3, "horizontal", 5) == (1 << 1) | (1 << 6) | (1 << 11)
+
+
+def test_ship_bits_match_the_board_model():
+    model = BoardModel(6)
+    model.set_ships([{"size": 4, "x": 1, "y": 2, "direction": "horizontal"}])
+    bits = ship_bits(1, 2, 4, "horizontal", 6)
+    assert bits == int("".join("1" if tile else "0" for tile in model.ship_mask.ravel()[::-1]), 2)
+
+
+def test_ship_bits_off_the_board():
+    assert ship_bits(3, 0, 3, "horizontal", 5) is None
+    assert ship_bits(0, 3, 3, "vertical", 5) is None
+    assert ship_bits(0, 5, 1, "horizontal", 5) is None
+    assert ship_bits(5, 0, 1, "vertical", 5) is None
+    assert ship_bits(-1, 0, 2, "vertical", 5) is None
+    assert ship_bits(None, 0, 2, "vertical", 5) is None
+    assert ship_bits(2, 0, 3, "horizontal", 5) is not None  # Ends on the last row
+
+
+def test_viewport_centres_on_the_cursor():
+    model = BoardModel(20)
+    assert model.viewport([10, 10], 6, 4) == (7, 13, 8, 12)
+
+
+def test_viewport_stays_inside_the_board():
+    model = BoardModel(20)
+    assert model.viewport([0, 1], 6, 4) == (0, 6, 0, 4)
+    assert model.viewport([19, 18], 6, 4) == (14, 20, 16, 20)
+
+
+def test_viewport_of_a_small_board_is_the_whole_board():
+    model = BoardModel(5)
+    assert model.viewport([4, 4], 10, 10) == (0, 5, 0, 5)
+
+
+def test_windowed_render_matches_the_full_render():
+    model = BoardModel(12)
+    tiles = np.zeros((12, 12), dtype=np.uint8)
+    tiles[5, 6], tiles[7, 7] = HIT, MISS
+    model.update({"board": tiles.tolist()})
+    model.set_ships([{"size": 3, "x": 4, "y": 6, "direction": "horizontal"}])
+    full = model.render_codes(cursor=[6, 8]).copy()
+    window = model.viewport([6, 8], 5, 5)
+    x0, x1, y0, y1 = window
+    assert (model.render_codes(cursor=[6, 8], window=window) == full[x0:x1, y0:y1]).all()
+
+
+def test_minimap_blocks_show_the_most_important_tile():
+    model = BoardModel(8)
+    tiles = np.zeros((8, 8), dtype=np.uint8)
+    tiles[0, 0] = MISS
+    tiles[0, 1] = HIT  # Same block as the miss, the hit wins
+    tiles[7, 7] = MISS
+    model.update({"board": tiles.tolist()})
+    model.set_ships([{"size": 2, "x": 4, "y": 0, "direction": "vertical"}])
+    assert model.minimap(4).plain.split("\n") == ["X···", "····", "■···", "···O"]
+
+
+def test_minimap_pads_boards_that_dont_divide_evenly():
+    model = BoardModel(5)
+    tiles = np.zeros((5, 5), dtype=np.uint8)
+    tiles[4, 4] = MISS
+    model.update({"board": tiles.tolist()})
+    assert model.minimap(2).plain.split("\n") == ["··", "·O"]
+
+
+def test_minimap_highlights_the_viewport():
+    model = BoardModel(8)
+    text = model.minimap(4, window=(0, 4, 2, 6))
+    highlighted = [span.start for span in text.spans if "on grey23" in str(span.style)]
+    # Blocks [0..1, 1..2] of each 4 block row, one newline after every row
+    assert highlighted == [1, 2, 6, 7]
+
+
+def test_minimap_is_cached_until_the_board_changes():
+    model = BoardModel(8)
+    first = model.minimap(4)
+    assert model.minimap(4) is first
+    assert model.minimap(4, window=(0, 2, 0, 2)) is not first
+    model.update({"board": [[0] * 8 for _ in range(8)]})
+    assert model.minimap(4) is not first
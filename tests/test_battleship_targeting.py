@@ -0,0 +1,87 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+from rich.console import Console
+
+from game_rooms.Battleship import BattleShip
+from game_rooms.BattleshipBoard import HIT, MISS
+from game_rooms.BattleshipTargeting import TargetingEngine
+
+
+def board(size, hits=(), misses=()):
+    tiles = np.zeros((size, size), dtype=np.uint8)
+    for x, y in hits:
+        tiles[x, y] = HIT
+    for x, y in misses:
+        tiles[x, y] = MISS
+    return tiles
+
+
+def test_empty_board_favours_the_centre():
+    density = TargetingEngine().probability_map(board(5), [BattleShip.Ship(3, False)])
+    assert density.sum() == pytest.approx(1.0)
+    assert density[2, 2] == density.max()
+    assert density[0, 0] == density.min()
+
+
+def test_shot_tiles_have_no_chance():
+    density = TargetingEngine().probability_map(board(5, hits=[(1, 1)], misses=[(3, 3)]),
+                                                [BattleShip.Ship(2, False)])
+    assert density[1, 1] == 0
+    assert density[3, 3] == 0
+
+
+def test_misses_rule_out_placements():
+    # Row 0 is cut short by the miss at [0, 2] and every column by the misses on row 1, so a 3 only fits on row 2
+    density = TargetingEngine().probability_map(board(3, misses=[(0, 2), (1, 0), (1, 1), (1, 2)]),
+                                                [BattleShip.Ship(3, False)])
+    assert density[0, 0] == 0 and density[0, 1] == 0
+    assert density[2, 0] > 0
+
+
+def test_unresolved_hits_are_finished_off():
+    engine = TargetingEngine(seed=1)
+    target = engine.choose(board(8, hits=[(4, 4)]), [BattleShip.Ship(2, False)])
+    assert target in {(3, 4), (5, 4), (4, 3), (4, 5)}
+
+
+def test_hits_of_sunk_ships_are_ignored():
+    sunk = BattleShip.Ship(2, True, 4, 4, "vertical")
+    tiles = board(8, hits=[(4, 4), (4, 5)])
+    density = TargetingEngine().probability_map(tiles, [sunk, BattleShip.Ship(2, False)])
+    # Next to the sunk ship isn't any more likely than elsewhere in the middle of the board
+    assert density[4, 3] <= density[2, 2]
+
+
+def test_choose_returns_none_once_every_tile_is_shot():
+    tiles = board(2, misses=[(0, 0), (0, 1), (1, 0), (1, 1)])
+    assert TargetingEngine().choose(tiles, [BattleShip.Ship(2, False)]) is None
+
+
+def test_choose_falls_back_to_any_unshot_tile():
+    # No afloat ship fits, yet a tile is left to shoot
+    tiles = board(3, misses=[(0, 0), (0, 1), (0, 2), (1, 0), (1, 2), (2, 0), (2, 1), (2, 2)])
+    assert TargetingEngine().choose(tiles, [BattleShip.Ship(3, False)]) == (1, 1)
+
+
+def test_bot_only_fires_on_its_own_turn():
+    room = BattleShip("test", "localhost", 0, Console(file=io.StringIO()))
+    room.username = "me"
+    room.bot_enabled = True
+    room.place_ships = False
+    room.suggested_target = (1, 2)
+    sent = []
+
+    async def send_move():
+        sent.append(room.queued_attack)
+
+    room.send_move = send_move
+    room.current_player = {"username": "them"}
+    asyncio.run(room.bot_turn())
+    assert not sent and room.bot_waiting
+    room.current_player = {"username": "me"}
+    asyncio.run(room.bot_turn())
+    asyncio.run(room.bot_turn())  # Only once per state
+    assert sent == [[1, 2]]
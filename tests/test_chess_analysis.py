@@ -0,0 +1,42 @@
+import io
+
+import chess
+import chess.variant
+from rich.console import Console
+
+from game_rooms.Chess import Chess
+from game_rooms.ChessAnalysis import evaluate
+
+
+def play(board, moves):
+    for move in moves:
+        board.push_san(move)
+    return board
+
+
+def test_three_check_rewards_the_side_that_gave_the_check():
+    moves = ["e4", "f6", "Qh5+"]
+    three_check = play(chess.variant.ThreeCheckBoard(), moves)
+    standard = play(chess.Board(), moves)
+    assert three_check.remaining_checks[chess.WHITE] == 2
+    # Black is to move, so the check White gave counts against Black
+    assert evaluate(three_check) == evaluate(standard) - 150
+
+
+def test_three_check_bonus_is_symmetric():
+    board = play(chess.variant.ThreeCheckBoard(), ["e4", "f6", "Qh5+", "g6"])
+    # Scores are from the side to move, so the mirrored position, with the colors and the turn swapped, scores the same
+    assert evaluate(board) == evaluate(board.mirror())
+
+
+def test_hint_names_the_side_that_mates():
+    room = Chess("test", "localhost", 0, Console(file=io.StringIO()))
+    try:
+        room.board = chess.Board()  # White to move
+        room.analysis.result = {"san": "e4", "mate": -2, "score": 0, "depth": 5, "nps": 1000}
+        assert "Black mates in 2" in room.hint_text()
+        room.analysis.result["mate"] = 3
+        assert "White mates in 3" in room.hint_text()
+    finally:
+        room.analysis.shutdown()
+        room.book.close()
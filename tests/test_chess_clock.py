@@ -0,0 +1,70 @@
+import types
+
+import pytest
+
+from game_rooms import Chess as chess_module
+from game_rooms.Chess import InterpolatedClock
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """
+    The monotonic time the clock sees, moved on by setting now[0]
+    """
+    now = [100.0]
+    monkeypatch.setattr(chess_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_running_timer_counts_down_between_updates(now):
+    clock = InterpolatedClock()
+    clock.sync([300, 200], 0)
+    now[0] += 5
+    assert clock.value(0) == pytest.approx(295)
+    assert clock.value(1) == pytest.approx(200)  # Stopped
+
+
+def test_timer_never_goes_below_zero(now):
+    clock = InterpolatedClock()
+    clock.sync([3, 200], 0)
+    now[0] += 10
+    assert clock.value(0) == 0.0
+
+
+def test_small_drift_is_slewed_out(now):
+    clock = InterpolatedClock()
+    clock.sync([300, 200], 0)
+    now[0] += 10  # The local clock shows 290
+    clock.sync([290.5, 200], 0)  # The server is half a second behind
+    # Straight after the update the clock still shows its own value, so it doesn't jump
+    assert clock.value(0) == pytest.approx(290)
+    now[0] += clock.slew_time / 2
+    assert clock.value(0) == pytest.approx(290.5 - clock.slew_time / 2 - 0.25)
+    now[0] += clock.slew_time / 2
+    assert clock.value(0) == pytest.approx(290.5 - clock.slew_time)  # Fully blended into the server's value
+
+
+def test_large_drift_snaps_to_the_server(now):
+    clock = InterpolatedClock()
+    clock.sync([300, 200], 0)
+    now[0] += 10
+    clock.sync([280, 200], 0)  # Ten seconds out, over the snap threshold
+    assert clock.value(0) == pytest.approx(280)
+
+
+def test_turn_change_is_applied_as_is(now):
+    clock = InterpolatedClock()
+    clock.sync([300, 200], 0)
+    now[0] += 10
+    clock.sync([300.5, 200], 1)  # White moved and got an increment, Black's clock starts
+    assert clock.correction == [0.0, 0.0]
+    assert clock.value(0) == pytest.approx(300.5)
+    now[0] += 1
+    assert clock.value(1) == pytest.approx(199)
+
+
+def test_stopped_clocks_hold_their_value(now):
+    clock = InterpolatedClock()
+    clock.sync([300, 200], None)
+    now[0] += 60
+    assert (clock.value(0), clock.value(1)) == (300, 200)
@@ -0,0 +1,113 @@
+import asyncio
+
+import chess
+
+
+def play(room, moves):
+    for move in moves:
+        room.board.push_san(move)
+
+
+async def refused(move):
+    return False
+
+
+def test_rollback_undoes_the_pending_move_and_drops_premoves(chess_room):
+    move = chess.Move.from_uci("e2e4")
+    chess_room.board.push(move)
+    chess_room.pending_move = move
+    chess_room.premoves.append(chess.Move.from_uci("g1f3"))
+    chess_room.rollback_move(move)
+    assert not chess_room.board.move_stack
+    assert chess_room.pending_move is None
+    assert not chess_room.premoves
+    assert chess_room.resync_requested
+
+
+def test_rollback_leaves_the_board_if_the_move_was_already_replaced(chess_room):
+    play(chess_room, ["d4"])
+    chess_room.pending_move = chess.Move.from_uci("d2d4")
+    chess_room.rollback_move(chess.Move.from_uci("e2e4"))  # An older move
+    assert chess_room.board.peek() == chess.Move.from_uci("d2d4")
+    assert chess_room.pending_move == chess.Move.from_uci("d2d4")
+
+
+def test_premove_waits_for_the_players_turn(chess_room):
+    chess_room.player_color = chess.WHITE
+    play(chess_room, ["e4"])
+    chess_room.premoves.append(chess.Move.from_uci("g1f3"))
+    chess_room.fire_premove()  # Black to move
+    assert chess_room.premoves
+
+
+def test_premove_waits_for_the_pending_move(chess_room):
+    chess_room.player_color = chess.WHITE
+    chess_room.pending_move = chess.Move.from_uci("e2e4")
+    chess_room.premoves.append(chess.Move.from_uci("g1f3"))
+    chess_room.fire_premove()
+    assert chess_room.premoves
+
+
+def test_legal_premove_is_played_on_the_players_turn(chess_room):
+    async def run():
+        chess_room.send_move = refused  # Never reaches a server, the send is cancelled below
+        chess_room.player_color = chess.WHITE
+        chess_room.premoves.extend([chess.Move.from_uci("g1f3"), chess.Move.from_uci("b1c3")])
+        chess_room.fire_premove()
+        chess_room.send_task.cancel()
+    asyncio.run(run())
+    assert chess_room.board.peek() == chess.Move.from_uci("g1f3")
+    assert chess_room.pending_move == chess.Move.from_uci("g1f3")
+    assert chess_room.premoves == [chess.Move.from_uci("b1c3")]
+
+
+def test_illegal_premove_clears_every_premove(chess_room):
+    chess_room.player_color = chess.WHITE
+    play(chess_room, ["e4", "e5"])
+    chess_room.premoves.extend([chess.Move.from_uci("e4e5"), chess.Move.from_uci("g1f3")])  # e5 is blocked
+    chess_room.fire_premove()
+    assert not chess_room.premoves
+    assert chess_room.pending_move is None
+    assert len(chess_room.board.move_stack) == 2
+
+
+def test_premove_board_plays_the_queued_premoves(chess_room):
+    chess_room.player_color = chess.WHITE
+    play(chess_room, ["e4"])
+    chess_room.premoves.append(chess.Move.from_uci("g1f3"))
+    board = chess_room.premove_board()
+    assert board.turn == chess.WHITE
+    assert board.piece_at(chess.F3) == chess.Piece(chess.KNIGHT, chess.WHITE)
+    # A capture of a piece that isn't there yet can still be premoved
+    assert chess_room.is_premove_candidate(board, chess.Move.from_uci("f3e5"))
+    assert not chess_room.is_premove_candidate(board, chess.Move.from_uci("f3f5"))
+
+
+class Accepted:
+    status = 200
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+def test_confirmed_move_fires_the_next_premove(chess_room):
+    sent = []
+
+    def request(method, path, **kwargs):
+        sent.append(kwargs["json"]["move"])
+        return Accepted()
+
+    async def run():
+        chess_room.request = request
+        chess_room.player_color = chess.WHITE
+        chess_room.submit_move(chess.Move.from_uci("e2e4"))
+        chess_room.board.push_san("e5")  # The reply was seen before the move was confirmed
+        chess_room.premoves.append(chess.Move.from_uci("g1f3"))
+        await chess_room.send_task  # Confirms e4, which submits the premove
+        await chess_room.send_task
+    asyncio.run(run())
+    assert sent == ["e2e4", "g1f3"]
+    assert not chess_room.premoves
@@ -0,0 +1,74 @@
+import chess
+
+from game_rooms.Chess import Chess
+
+
+def server_position(moves, board=None):
+    """
+    :return: The EPD and side to move the server would send after the moves
+    """
+    board = board or chess.Board()
+    for move in moves:
+        board.push_san(move)
+    return board.epd(), board.turn
+
+
+def test_parse_server_move_takes_uci_and_san(chess_room):
+    assert chess_room.parse_server_move("e2e4") == chess.Move.from_uci("e2e4")
+    assert chess_room.parse_server_move("Nf3") == chess.Move.from_uci("g1f3")
+
+
+def test_parse_server_move_rejects_illegal_and_missing_moves(chess_room):
+    assert chess_room.parse_server_move(None) is None
+    assert chess_room.parse_server_move("") is None
+    assert chess_room.parse_server_move("e2e5") is None
+    assert chess_room.parse_server_move("Qh5") is None
+
+
+def test_last_move_is_pushed_onto_the_move_stack(chess_room):
+    chess_room.board.push_san("e4")
+    epd, turn = server_position(["e4", "e5"])
+    assert not chess_room.apply_server_position(epd, turn, "e7e5")
+    assert [move.uci() for move in chess_room.board.move_stack] == ["e2e4", "e7e5"]
+
+
+def test_up_to_date_board_is_left_alone(chess_room):
+    chess_room.board.push_san("e4")
+    epd, turn = server_position(["e4"])
+    assert not chess_room.apply_server_position(epd, turn, "e2e4")
+    assert len(chess_room.board.move_stack) == 1
+
+
+def test_missed_moves_reload_the_position(chess_room):
+    epd, turn = server_position(["e4", "e5", "Nf3"])
+    assert chess_room.apply_server_position(epd, turn, "g1f3")
+    assert chess_room.board.epd() == epd
+    assert chess_room.board.turn == turn
+
+
+def test_move_that_doesnt_lead_to_the_server_position_reloads(chess_room):
+    epd, turn = server_position(["d4"])
+    assert chess_room.apply_server_position(epd, turn, "e2e4")  # A stale last move
+    assert chess_room.board.epd() == epd
+    assert not chess_room.board.move_stack
+
+
+def test_crazyhouse_drop_is_applied_incrementally(chess_room):
+    chess_room.switch_board_variant("Crazyhouse")
+    moves = ["e4", "d5", "exd5", "Qxd5", "Nc3"]
+    for move in moves:
+        chess_room.board.push_san(move)
+    server_board = Chess.variant_boards["Crazyhouse"][0]()
+    epd, turn = server_position(moves + ["P@e4"], server_board)
+    assert not chess_room.apply_server_position(epd, turn, "P@e4")
+    assert chess_room.board.peek() == chess.Move.from_uci("P@e4")
+    assert chess_room.board.epd() == epd  # The pockets are part of the position
+
+
+def test_crazyhouse_drop_the_board_missed_reloads_with_pockets(chess_room):
+    chess_room.switch_board_variant("Crazyhouse")
+    server_board = Chess.variant_boards["Crazyhouse"][0]()
+    epd, turn = server_position(["e4", "d5", "exd5", "Qxd5", "Nc3", "P@e4"], server_board)
+    assert chess_room.apply_server_position(epd, turn, "P@e4")
+    assert chess_room.board.epd() == epd
+    assert chess_room.board.pockets[chess.WHITE].count(chess.PAWN) == 1
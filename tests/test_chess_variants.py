@@ -0,0 +1,73 @@
+import io
+
+import chess
+import chess.variant
+import pytest
+from rich.console import Console
+
+from game_rooms.Chess import Chess
+
+VARIANTS = Chess.creation_args["chess_variant"]["options"]
+
+EXPECTED = {
+    "Standard": (chess.Board, False),
+    "Chess960": (chess.Board, True),
+    "Crazyhouse": (chess.variant.CrazyhouseBoard, False),
+    "Three Check": (chess.variant.ThreeCheckBoard, False),
+    "King of the Hill": (chess.variant.KingOfTheHillBoard, False),
+    "Antichess": (chess.variant.AntichessBoard, False),
+    "Atomic": (chess.variant.AtomicBoard, False),
+    "Horde": (chess.variant.HordeBoard, False),
+    "Racing Kings": (chess.variant.RacingKingsBoard, False),
+}
+
+
+@pytest.fixture
+def room():
+    room = Chess("test", "localhost", 0, Console(file=io.StringIO()))
+    yield room
+    room.analysis.shutdown()
+    room.book.close()
+
+
+def test_every_creation_variant_has_a_board():
+    assert len(VARIANTS) == 9
+    assert set(VARIANTS) == set(EXPECTED)
+    assert set(VARIANTS) <= set(Chess.variant_boards)
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_switch_creates_the_variant_board(room, variant):
+    board_class, chess960 = EXPECTED[variant]
+    room.variant = None  # Even Standard is switched to from here
+    assert room.switch_board_variant(variant)
+    assert room.variant == variant
+    assert type(room.board) is board_class
+    assert room.board.chess960 == chess960
+    assert room.board.uci_variant == board_class.uci_variant
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_switch_keeps_the_board_while_the_variant_is_unchanged(room, variant):
+    room.variant = None
+    room.switch_board_variant(variant)
+    board = room.board
+    board.push(next(iter(board.legal_moves)))
+    room.premoves.append(chess.Move.null())
+    assert not room.switch_board_variant(variant)
+    assert room.board is board
+    assert len(room.board.move_stack) == 1
+    assert room.premoves  # Only cleared along with the board
+
+
+def test_switch_to_another_variant_replaces_the_board(room):
+    board = room.board
+    room.premoves.append(chess.Move.null())
+    assert room.switch_board_variant("Atomic")
+    assert room.board is not board
+    assert not room.premoves
+
+
+def test_unknown_variant_falls_back_to_a_standard_board(room):
+    assert room.switch_board_variant("Something New")
+    assert type(room.board) is chess.Board
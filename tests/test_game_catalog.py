@@ -0,0 +1,119 @@
+import asyncio
+import types
+
+import pytest
+from aiohttp import web
+
+import GameCatalog as catalog_module
+from GameCatalog import GameCatalog
+from game_rooms.Chess import Chess
+
+
+@pytest.fixture
+def now(monkeypatch, tmp_path):
+    """
+    The wall clock time the catalog sees, moved on by setting now[0]. The cache is written to a temporary folder
+    """
+    monkeypatch.chdir(tmp_path)
+    now = [1000.0]
+    monkeypatch.setattr(catalog_module, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def games():
+    """
+    A /get_games endpoint that answers 304 to the ETag it last sent, with a log of the If-None-Match of each request
+    """
+    requests = []
+
+    async def get_games(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(["Chess", "Poker"], headers={"ETag": '"v1"'})
+
+    return web.get("/get_games", get_games), requests
+
+
+async def broken(request):
+    return web.Response(status=500)
+
+
+def server(transport, version="1.0"):
+    """
+    Just what the catalog uses of the ServerInterface
+    """
+    return types.SimpleNamespace(server_id="test", server_version=version, user_hash="hash",
+                                 room_handlers={"Chess": Chess}, sessions=types.SimpleNamespace(transport=transport))
+
+
+def test_compatible_games_come_first(now, serve, games):
+    async def run():
+        async with serve([games[0]]) as transport:
+            return await GameCatalog(server(transport)).get()
+
+    entries = asyncio.run(run())
+    assert [(game["type"], game["compatible"]) for game in entries] == [("Chess", True), ("Poker", False)]
+    assert entries[0]["creation_args"] is Chess.creation_args
+    assert entries[1]["label"] == "Poker, Incompatible"
+
+
+def test_cached_list_is_used_until_the_ttl_runs_out(now, serve, games):
+    route, requests = games
+
+    async def run():
+        async with serve([route]) as transport:
+            interface = server(transport)
+            await GameCatalog(interface, ttl=60).get()
+            now[0] += 30
+            cached = GameCatalog(interface, ttl=60)  # Loaded from disk, as on the next start
+            await cached.get()
+            assert requests == [None]
+            now[0] += 60
+            await cached.get()
+            return cached
+
+    cached = asyncio.run(run())
+    assert requests == [None, '"v1"']  # Revalidated, the 304 keeps the list
+    assert [game["type"] for game in cached.games] == ["Chess", "Poker"]
+    assert cached.fetched == now[0]
+
+
+def test_server_update_downloads_the_list_again(now, serve, games):
+    route, requests = games
+
+    async def run():
+        async with serve([route]) as transport:
+            await GameCatalog(server(transport, "1.0")).get()
+            updated = GameCatalog(server(transport, "2.0"))
+            await updated.get()
+            return updated
+
+    updated = asyncio.run(run())
+    assert requests == [None, None]  # Without If-None-Match, whatever the ETag
+    assert updated.server_version == "2.0"
+
+
+def test_cached_list_is_used_while_the_server_is_down(now, serve, games):
+    async def run():
+        async with serve([games[0]]) as transport:
+            await GameCatalog(server(transport)).get()
+        now[0] += 48 * 60 * 60
+        async with serve([web.get("/get_games", broken)]) as transport:
+            catalog = GameCatalog(server(transport))
+            entries = await catalog.get()
+            return catalog, entries
+
+    catalog, entries = asyncio.run(run())
+    assert catalog.stale
+    assert [game["type"] for game in entries] == ["Chess", "Poker"]
+
+
+def test_no_cache_and_no_server_raises(now, serve):
+    async def run():
+        async with serve([web.get("/get_games", broken)]) as transport:
+            await GameCatalog(server(transport)).get()
+
+    with pytest.raises(Exception, match="Failed to get games"):
+        asyncio.run(run())
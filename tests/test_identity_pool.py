@@ -0,0 +1,67 @@
+import asyncio
+import json
+import types
+
+from aiohttp import web
+
+from IdentityPool import IdentityPool
+
+
+def client(saved=None):
+    """
+    Just what the pool uses of the ServerInterface
+    """
+    servers = {"test": {"name": "Test"} if saved is None else {"name": "Test", "players": saved}}
+    return types.SimpleNamespace(server_id="test", user_name="me", servers=servers)
+
+
+def users():
+    """
+    A /create_user endpoint handing out a hash named after each user, with a log of the names asked for
+    """
+    names = []
+
+    async def create_user(request):
+        names.append(request.match_info["name"])
+        await asyncio.sleep(0.01)  # Long enough for requests sent together to overlap
+        return web.json_response({"user_id": f"hash-{request.match_info['name']}"})
+
+    return web.get("/create_user/{name}", create_user), names
+
+
+def test_free_users_are_handed_out_again(monkeypatch, tmp_path, serve):
+    monkeypatch.chdir(tmp_path)
+    route, names = users()
+
+    async def run():
+        async with serve([route]) as transport:
+            pool = IdentityPool(client(["saved-1"]), "players", "room", transport)
+            first = await pool.acquire()
+            second = await pool.acquire()
+            pool.release(first)
+            return first, second, await pool.acquire()
+
+    assert asyncio.run(run()) == ("saved-1", "hash-me-room-2", "saved-1")
+    assert names == ["me-room-2"]
+    with open(tmp_path / "servers.json") as file:
+        saved = json.load(file)
+    assert saved["test"]["players"] == ["saved-1", "hash-me-room-2"]
+
+
+def test_users_created_together_get_their_own_names(monkeypatch, tmp_path, serve):
+    monkeypatch.chdir(tmp_path)
+    route, names = users()
+
+    async def run():
+        async with serve([route]) as transport:
+            pool = IdentityPool(client(), "players", "room", transport)
+            return await asyncio.gather(pool.acquire(), pool.acquire(), pool.acquire())
+
+    hashes = asyncio.run(run())
+    assert sorted(names) == ["me-room-1", "me-room-2", "me-room-3"]
+    assert len(set(hashes)) == 3
+
+
+def test_users_saved_by_older_clients_are_kept():
+    pool = IdentityPool(client({"room-a": "old-1", "room-b": "old-2"}), "players", "room", None)
+    assert pool.saved() == ["old-1", "old-2"]
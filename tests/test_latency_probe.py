@@ -0,0 +1,81 @@
+import asyncio
+import socket
+
+from aiohttp import web
+
+from LatencyProbe import LatencyProbe
+
+
+def probe(rtts, lost=0, samples=None):
+    probe = LatencyProbe("localhost", 0, samples=samples or len(rtts) + lost)
+    probe.rtts = list(rtts)
+    probe.lost = lost
+    return probe
+
+
+def test_statistics_of_the_samples():
+    measured = probe([30.0, 10.0, 20.0, 50.0, 40.0])
+    assert (measured.min, measured.median, measured.p95) == (10.0, 30.0, 50.0)
+    assert measured.summary() == "30.0ms (min 10.0, p95 50.0)"
+
+
+def test_losses_are_shown():
+    measured = probe([10.0, 20.0], lost=2)
+    assert measured.loss == 0.5
+    assert measured.summary().endswith(" 50% loss")
+
+
+def test_servers_answering_every_request_rank_first():
+    steady = probe([40.0, 40.0, 40.0])
+    lossy = probe([5.0, 5.0], lost=1)
+    fast = probe([10.0, 10.0, 10.0])
+    spiky = probe([10.0, 10.0, 90.0, 10.0, 10.0, 10.0])
+    offline = probe([], lost=3)
+    assert sorted([offline, lossy, steady, spiky, fast], key=LatencyProbe.rank) == [fast, spiky, steady, lossy, offline]
+
+
+def test_offline_server():
+    measured = probe([], lost=5)
+    assert not measured.online
+    assert measured.median is None and measured.p95 is None
+    assert measured.summary() == "no reply"
+
+
+def test_run_times_every_sample(serve):
+    requests = []
+
+    async def get_server_id(request):
+        requests.append(request.path)
+        return web.json_response({"server_id": "test"})
+
+    async def run():
+        async with serve([web.get("/get_server_id", get_server_id)]) as transport:
+            return await LatencyProbe(transport.host, transport.port, samples=3, interval=0).run()
+
+    measured = asyncio.run(run())
+    assert len(requests) == 4  # The warm up is not timed
+    assert measured.reply == {"server_id": "test"}
+    assert len(measured.rtts) == 3 and measured.lost == 0
+
+
+def test_run_counts_error_replies_as_lost(serve):
+    replies = iter([200, 500, 200])
+
+    async def get_server_id(request):
+        return web.json_response({"server_id": "test"}, status=next(replies, 200))
+
+    async def run():
+        async with serve([web.get("/get_server_id", get_server_id)]) as transport:
+            return await LatencyProbe(transport.host, transport.port, samples=3, interval=0).run()
+
+    measured = asyncio.run(run())
+    assert (len(measured.rtts), measured.lost) == (2, 1)
+
+
+def test_run_gives_up_straight_away_if_it_cant_connect():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    measured = asyncio.run(LatencyProbe("127.0.0.1", port, samples=5, interval=10).run())
+    assert measured.lost == 5
+    assert not measured.online
@@ -0,0 +1,120 @@
+import asyncio
+import io
+import types
+
+from rich.console import Console
+
+import Lobby as lobby_module
+from Lobby import Lobby
+from RoomList import RoomList
+
+
+def room(room_id, room_type="Chess"):
+    return {"room_id": room_id, "name": f"room {room_id}", "type": room_type, "password_protected": False,
+            "joinable": True, "max_users": 2, "users": []}
+
+
+class Server:
+    """
+    Just what the lobby uses of a ServerInterface that doesn't page its room list
+    """
+
+    def __init__(self, room_ids):
+        self.rooms = RoomList()
+        self.rooms.replace([room(room_id) for room_id in room_ids])
+        self.server_name = "Test"
+        self.room_handlers = {"Chess": None, "BattleShip": None}
+        self.error = None
+
+    async def get_rooms(self):
+        if self.error is not None:
+            raise self.error
+
+    async def get_room_page(self, *args, **kwargs):
+        await self.get_rooms()
+        return None
+
+
+def lobby(room_ids, **lobby_args):
+    # 14 lines leave room for 5 rows of rooms
+    return Lobby(Server(room_ids), Console(file=io.StringIO(), height=14), **lobby_args)
+
+
+def press(lobby, *keys):
+    for key in keys:
+        asyncio.run(lobby.handle_key(key))
+
+
+def test_cursor_stays_on_its_room_when_rooms_above_it_change():
+    browser = lobby(["a", "b", "c"])
+    browser.page()
+    press(browser, b'\xe0', b'P')  # Down
+    assert browser.page()[1][browser.selected] == "b"
+    browser.server.rooms.replace([room("new"), room("a"), room("b"), room("c")])
+    browser.page()
+    assert browser.selected_id == "b"
+    browser.server.rooms.replace([room("c")])  # The room under the cursor closed
+    browser.page()
+    assert browser.selected_id == "c"
+
+
+def test_arrow_keys_move_a_page_at_a_time():
+    browser = lobby([str(index) for index in range(12)])
+    press(browser, b'\xe0', b'M')
+    offset, page_ids, total = browser.page()
+    assert (offset, len(page_ids), total) == (5, 5, 12)
+    press(browser, b'\xe0', b'M', b'\xe0', b'M')
+    assert browser.page()[0] == 10
+    assert browser.selected == 11  # Kept on the last room
+
+
+def test_typing_a_search_filters_the_rooms():
+    browser = lobby(["a", "b"])
+    press(browser, b'/', b'b', b'\r')
+    assert not browser.searching
+    assert browser.page()[1] == ["b"]
+    press(browser, b'/', b'\x08', b'\x1b')
+    assert browser.page()[1] == ["a", "b"]
+
+
+def test_letters_of_arrow_keys_are_not_typed():
+    browser = lobby(["a"])
+    press(browser, b'/', b'\xe0', b'H')
+    assert browser.query == ""
+
+
+def test_type_filter_cycles_through_the_handlers():
+    browser = lobby(["a"])
+    browser.server.rooms.merge([room("ship", "BattleShip")])
+    press(browser, b't')
+    assert browser.filters["room_type"] == "BattleShip"
+    assert browser.page()[1] == ["ship"]
+    press(browser, b't', b't')
+    assert browser.filters["room_type"] is None
+
+
+def test_enter_joins_the_room_under_the_cursor():
+    browser = lobby(["a", "b"])
+    press(browser, b'\xe0', b'P', b'\r')
+    assert browser.action == ("join", "b")
+
+
+def test_multiselect_watches_the_marked_rooms():
+    browser = lobby(["a", "b", "c"], multiselect=True)
+    press(browser, b' ', b'\xe0', b'P', b'\xe0', b'P', b' ', b'\xe0', b'H', b'\r')
+    assert browser.action == ("watch", ["a", "c"])
+
+
+def test_failed_first_load_is_shown_in_the_lobby(monkeypatch):
+    browser = lobby(["a"])
+    browser.server.error = ConnectionError()
+    shown = []
+
+    def getch():
+        shown.append(browser.last_error)  # What the lobby showed when the key was typed
+        return b'q'
+
+    monkeypatch.setattr(lobby_module, "keypress", types.SimpleNamespace(kbhit=lambda: not shown, getch=getch))
+    assert asyncio.run(browser.run()) == ("back", None)
+    assert shown == ["Failed to load rooms: ConnectionError"]
+    assert browser.paged is None  # Asked again by the refresher
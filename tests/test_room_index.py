@@ -0,0 +1,20 @@
+from RoomIndex import RoomIndex
+from RoomList import RoomList
+
+
+def make_index(names):
+    rooms = RoomList()
+    rooms.replace([{"room_id": str(index), "name": name, "type": "Chess", "password_protected": False,
+                    "joinable": True, "max_users": 2, "users": []} for index, name in enumerate(names)])
+    return RoomIndex(rooms)
+
+
+def test_prefix_matches_come_first():
+    index = make_index(["xab", "abc", "Ab", "zzz"])
+    assert index.search("ab") == ["2", "1", "0"]
+
+
+def test_prefix_match_keeps_names_with_astral_characters():
+    index = make_index(["ab\U0001F600", "ab", "abz", "b"])
+    assert sorted(index.search("ab")) == ["0", "1", "2"]
+    assert index.search("ab\U0001F600") == ["0"]
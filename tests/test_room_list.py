@@ -0,0 +1,122 @@
+import asyncio
+import types
+
+from aiohttp import web
+
+from RoomList import RoomList
+from ServerInterface import ServerInterface
+
+
+def room(room_id, name=None, users=()):
+    return {"room_id": room_id, "name": name or room_id, "users": list(users)}
+
+
+def test_replace_adds_updates_and_drops_rooms():
+    rooms = RoomList()
+    rooms.replace([room("a"), room("b")], version=1)
+    a = rooms["a"]
+    rooms.replace([room("a", users=["x"]), room("c")], version=2)
+    assert list(rooms) == ["a", "c"]
+    assert rooms["a"] is a  # Updated in place
+    assert a["users"] == ["x"]
+    assert rooms.version == 2
+
+
+def test_replace_with_the_same_rooms_changes_nothing():
+    rooms = RoomList()
+    rooms.replace([room("a"), room("b")])
+    revision, updates = rooms.revision, rooms.updates
+    rooms.replace([room("a"), room("b")])
+    assert (rooms.revision, rooms.updates) == (revision, updates)
+    assert rooms.version is None
+
+
+def test_delta_only_touches_the_rooms_it_names():
+    rooms = RoomList()
+    rooms.replace([room("a"), room("b"), room("c")], version=1)
+    revision = rooms.revision
+    rooms.apply_delta({"version": 2, "added": [room("d")], "updated": [room("b", "renamed")], "removed": ["c"]})
+    assert list(rooms) == ["a", "b", "d"]
+    assert rooms["b"]["name"] == "renamed"
+    assert rooms.version == 2
+    assert rooms.revision == revision + 1
+
+
+def test_delta_with_only_updates_keeps_the_revision():
+    rooms = RoomList()
+    rooms.replace([room("a")], version=1)
+    revision, updates = rooms.revision, rooms.updates
+    rooms.apply_delta({"version": 2, "updated": [room("a", users=["x"])]})
+    assert rooms.revision == revision  # The room order is the same
+    assert rooms.updates == updates + 1
+
+
+def test_delta_removing_an_unknown_room_is_ignored():
+    rooms = RoomList()
+    rooms.replace([room("a")], version=1)
+    revision = rooms.revision
+    rooms.apply_delta({"version": 2, "removed": ["gone"]})
+    assert list(rooms) == ["a"]
+    assert rooms.revision == revision
+
+
+def test_merge_keeps_the_other_rooms():
+    rooms = RoomList()
+    rooms.replace([room("a")])
+    rooms.merge([room("b")])
+    assert list(rooms) == ["a", "b"]
+    assert rooms.by_name("b") is rooms["b"]
+
+
+def client(transport):
+    """
+    Just what ServerInterface.get_rooms uses, so it runs without logging in
+    """
+    return types.SimpleNamespace(rooms=RoomList(), user_hash="hash",
+                                 sessions=types.SimpleNamespace(transport=transport))
+
+
+def test_unchanged_full_list_is_not_downloaded_again(serve):
+    requests = []
+
+    async def get_rooms(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"1"':
+            return web.Response(status=304)
+        return web.json_response({"rooms": [room("a")]}, headers={"ETag": '"1"'})
+
+    async def run():
+        async with serve([web.get("/get_rooms", get_rooms)]) as transport:
+            interface = client(transport)
+            await ServerInterface.get_rooms(interface)
+            a = interface.rooms["a"]
+            await ServerInterface.get_rooms(interface)
+            return interface, a
+
+    interface, a = asyncio.run(run())
+    assert requests == [None, '"1"']
+    assert interface.rooms.etag == '"1"'
+    assert interface.rooms["a"] is a
+
+
+def test_versioned_server_is_sent_the_version_for_a_delta(serve):
+    requests = []
+
+    async def get_rooms(request):
+        requests.append(request.query.get("since"))
+        if "since" not in request.query:
+            return web.json_response({"rooms": [room("a"), room("b")], "version": 5})
+        return web.json_response({"version": 6, "removed": ["a"]})
+
+    async def run():
+        async with serve([web.get("/get_rooms", get_rooms)]) as transport:
+            interface = client(transport)
+            await ServerInterface.get_rooms(interface)
+            await ServerInterface.get_rooms(interface)
+            return interface
+
+    interface = asyncio.run(run())
+    assert requests == [None, "5"]
+    assert list(interface.rooms) == ["b"]
+    assert interface.rooms.version == 6
+    assert interface.rooms.etag is None  # The server sent no ETag
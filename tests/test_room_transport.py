@@ -0,0 +1,241 @@
+import asyncio
+import socket
+import types
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from game_rooms import RoomTransport as transport_module
+from game_rooms.RoomTransport import CircuitBreaker, RoomTransport, ServerUnavailable
+from tools.pgn_export import parse_server
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """
+    The monotonic time the breaker sees, moved on by setting now[0]. Jitter is taken out, so waits are exact
+    """
+    now = [100.0]
+    monkeypatch.setattr(transport_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(transport_module, "random", types.SimpleNamespace(uniform=lambda low, high: (low + high) / 2))
+    return now
+
+
+def tripped(breaker):
+    for _ in range(breaker.threshold):
+        breaker.failure()
+    return breaker
+
+
+def test_breaker_opens_after_the_threshold(now):
+    breaker = CircuitBreaker(threshold=3, cooldown=2.0)
+    breaker.failure()
+    breaker.failure()
+    assert not breaker.open and breaker.allow()
+    breaker.failure()
+    assert breaker.open
+    assert not breaker.allow()
+    assert breaker.retry_in() == 2.0
+    assert breaker.status() == "Reconnecting, next try in 2s"
+
+
+def test_success_before_the_threshold_resets_the_count(now):
+    breaker = CircuitBreaker(threshold=3)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert not breaker.open
+
+
+def test_one_trial_is_let_through_after_the_cooldown(now):
+    breaker = tripped(CircuitBreaker(cooldown=2.0))
+    now[0] += 2
+    assert breaker.allow()
+    assert not breaker.allow()  # Only the one trial
+    assert breaker.status() == "Reconnecting..."
+    breaker.success()
+    assert not breaker.open and breaker.status() is None
+    assert breaker.cooldown == breaker.base_cooldown
+
+
+def test_failed_trial_doubles_the_cooldown(now):
+    breaker = tripped(CircuitBreaker(cooldown=2.0, max_cooldown=5.0))
+    for cooldown in [4.0, 5.0, 5.0]:
+        now[0] += breaker.retry_in()
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.cooldown == cooldown
+        assert breaker.retry_in() == cooldown
+        assert not breaker.allow()
+
+
+def test_released_trial_lets_another_through(now):
+    breaker = tripped(CircuitBreaker(cooldown=1.0))
+    now[0] += 1
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.open
+    assert breaker.allow()
+
+
+def replies(*statuses):
+    """
+    A handler answering each request with the next status, the last status is repeated
+    """
+    requests = []
+
+    async def handler(request):
+        requests.append(request.method)
+        return web.Response(status=statuses[min(len(requests), len(statuses)) - 1], text="reply")
+
+    return handler, requests
+
+
+def quick(**transport_args):
+    return {"backoff": 0.01, "max_backoff": 0.02, **transport_args}
+
+
+def test_get_is_retried_until_the_server_answers(serve):
+    handler, requests = replies(503, 502, 200)
+
+    async def run():
+        async with serve([web.get("/state", handler)], **quick()) as transport:
+            async with transport.get("/state") as response:
+                return response.status, transport.breaker.failures
+
+    assert asyncio.run(run()) == (200, 0)
+    assert len(requests) == 3
+
+
+def test_last_reply_is_returned_once_the_attempts_run_out(serve):
+    handler, requests = replies(503)
+
+    async def run():
+        async with serve([web.get("/state", handler)], **quick(attempts=2)) as transport:
+            async with transport.get("/state") as response:
+                return response.status, await response.text(), transport.breaker.failures
+
+    assert asyncio.run(run()) == (503, "reply", 1)
+    assert len(requests) == 2
+
+
+def test_post_reaching_the_server_is_sent_once(serve):
+    handler, requests = replies(503, 200)
+
+    async def run():
+        async with serve([web.post("/room/make_move", handler)], **quick()) as transport:
+            async with transport.post("/room/make_move", json={}) as response:
+                return response.status
+
+    assert asyncio.run(run()) == 503
+    assert requests == ["POST"]
+
+
+def test_post_may_be_retried_if_the_caller_says_so(serve):
+    handler, requests = replies(503, 200)
+
+    async def run():
+        async with serve([web.post("/login", handler)], **quick()) as transport:
+            async with transport.post("/login", retry=True) as response:
+                return response.status
+
+    assert asyncio.run(run()) == 200
+    assert requests == ["POST", "POST"]
+
+
+def test_retry_false_is_never_resent(serve):
+    handler, requests = replies(503, 200)
+
+    async def run():
+        async with serve([web.get("/state", handler)], **quick()) as transport:
+            async with transport.get("/state", retry=False) as response:
+                return response.status
+
+    assert asyncio.run(run()) == 503
+    assert len(requests) == 1
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_connection_errors_open_the_breaker():
+    async def run():
+        transport = RoomTransport("127.0.0.1", closed_port(), **quick(attempts=2))
+        tries = []
+        session = transport.session
+        send = session.request
+        session.request = lambda *args, **kwargs: tries.append(args[0]) or send(*args, **kwargs)
+        try:
+            for _ in range(transport.breaker.threshold):
+                # A POST that never connected didn't reach the server, so it is retried too
+                with pytest.raises(aiohttp.ClientConnectorError):
+                    async with transport.post("/room/make_move"):
+                        pass
+            assert transport.breaker.open
+            with pytest.raises(ServerUnavailable):
+                async with transport.get("/state"):
+                    pass
+            assert tries == ["POST", "POST"] * transport.breaker.threshold
+            return transport.breaker.failures
+        finally:
+            await transport.close()
+
+    assert asyncio.run(run()) == 3  # One per request, however many tries each took
+
+
+def test_retry_false_is_not_resent_after_a_connection_error():
+    async def run():
+        transport = RoomTransport("127.0.0.1", closed_port(), **quick())
+        tries = []
+        session = transport.session
+        send = session.request
+        session.request = lambda *args, **kwargs: tries.append(args[0]) or send(*args, **kwargs)
+        try:
+            with pytest.raises(aiohttp.ClientConnectorError):
+                async with transport.get("/ping", retry=False):
+                    pass
+            return tries
+        finally:
+            await transport.close()
+
+    assert asyncio.run(run()) == ["GET"]
+
+
+def test_unix_socket_address():
+    transport = RoomTransport("unix:/tmp/server.sock", None)
+    assert transport.unix_path == "/tmp/server.sock"
+    assert transport.base_url == "http://localhost"
+    assert RoomTransport("10.0.0.1", 5000).unix_path is None
+
+
+def test_requests_over_a_unix_socket(tmp_path):
+    path = str(tmp_path / "server.sock")
+
+    async def get_server_id(request):
+        return web.json_response({"server_id": "local"})
+
+    async def run():
+        app = web.Application()
+        app.add_routes([web.get("/get_server_id", get_server_id)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.UnixSite(runner, path).start()
+        transport = RoomTransport(f"unix:{path}", None)
+        try:
+            async with transport.get("/get_server_id") as response:
+                return await response.json()
+        finally:
+            await transport.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == {"server_id": "local"}
+
+
+def test_pgn_export_reaches_unix_socket_servers():
+    assert parse_server("unix:/tmp/server.sock") == ("unix:/tmp/server.sock", None)
+    assert parse_server("10.0.0.1:5000") == ("10.0.0.1", "5000")
@@ -0,0 +1,68 @@
+import json
+import types
+
+import pytest
+
+import ServerDirectory as directory_module
+from ServerDirectory import BeaconListener, ServerDirectory
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """
+    The monotonic time the directory sees, moved on by setting now[0]
+    """
+    now = [100.0]
+    monkeypatch.setattr(directory_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def server(server_id="a", host="10.0.0.1", port=5000):
+    return {"server_id": server_id, "name": server_id, "host": host, "port": port}
+
+
+def test_repeated_beacons_list_a_server_once(now):
+    directory = ServerDirectory()
+    directory.update(server())
+    version = directory.version
+    directory.update(server())
+    assert list(directory.snapshot()) == ["a"]
+    assert directory.version == version
+
+
+def test_moved_server_bumps_the_version(now):
+    directory = ServerDirectory()
+    directory.update(server())
+    version = directory.version
+    directory.update(server(port=5001))
+    assert directory.snapshot()["a"]["port"] == 5001
+    assert directory.version == version + 1
+
+
+def test_silent_servers_expire(now):
+    directory = ServerDirectory(ttl=30)
+    directory.update(server("a"))
+    now[0] += 20
+    directory.update(server("b"))
+    now[0] += 20
+    version = directory.version
+    assert list(directory.snapshot()) == ["b"]
+    assert directory.version == version + 1
+
+
+def test_beacon_takes_the_address_it_came_from():
+    data = json.dumps({"server_id": "a", "host": ["10.0.0.1", "192.168.1.5"], "port": 5000}).encode()
+    info = BeaconListener.parse(data, ("192.168.1.5", 5007))
+    assert info["host"] == "192.168.1.5"
+    assert info["name"] == "a"  # Named after its id if it has no name
+    assert info["online"]
+
+
+def test_beacon_keeps_a_single_host():
+    data = json.dumps({"server_id": "a", "name": "Home", "host": "10.0.0.1", "port": 5000}).encode()
+    assert BeaconListener.parse(data, ("192.168.1.5", 5007))["host"] == "10.0.0.1"
+
+
+@pytest.mark.parametrize("data", [b"DISCOVER_GAME_SERVER", b"\xff\xfe", b"[1, 2]", b'{"server_id": "a"}'])
+def test_other_datagrams_are_ignored(data):
+    assert BeaconListener.parse(data, ("192.168.1.5", 5007)) is None
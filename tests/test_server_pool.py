@@ -0,0 +1,99 @@
+import asyncio
+import io
+
+from aiohttp import web
+from rich.console import Console
+
+from RoomList import RoomList
+from ServerPool import ServerPool
+from game_rooms.RoomTransport import CircuitBreaker
+
+
+class Interface:
+    """
+    Just what the pool uses of a logged in ServerInterface
+    """
+
+    def __init__(self, name, room_ids):
+        self.server_name = name
+        self.rooms = RoomList()
+        self.rooms.replace([{"room_id": room_id, "name": room_id} for room_id in room_ids])
+        self.sessions = type("Sessions", (), {"transport": type("Transport", (), {"breaker": CircuitBreaker()})()})()
+        self.joined = []
+
+    async def get_rooms(self):
+        pass
+
+    async def join_room(self, room_id):
+        self.joined.append(room_id)
+
+
+def pool(**interfaces):
+    servers = ServerPool({}, Console(file=io.StringIO()))
+    servers.interfaces = interfaces
+    servers.servers = {server_id: {} for server_id in interfaces}
+    return servers
+
+
+def test_rooms_are_merged_and_keyed_by_server():
+    servers = pool(a=Interface("Alpha", ["1", "2"]), b=Interface("Beta", ["1"]))
+    servers.rtt["a"] = 12.3
+    servers.status["b"] = "not responding"
+
+    async def run():
+        await servers.get_rooms()
+        for poller in servers.pollers.values():
+            poller.cancel()
+
+    asyncio.run(run())
+    assert list(servers.rooms) == ["a/1", "a/2", "b/1"]
+    assert servers.rooms["a/1"]["server"] == "Alpha 12ms"
+    assert servers.rooms["b/1"]["server"] == "Beta (not responding)"
+    assert servers.server_name == "All servers (1/2 responding)"
+
+
+def test_rooms_of_a_server_that_left_are_dropped():
+    servers = pool(a=Interface("Alpha", ["1"]), b=Interface("Beta", ["1"]))
+
+    async def run():
+        await servers.get_rooms()
+        del servers.interfaces["b"]
+        await servers.get_rooms()
+        for poller in servers.pollers.values():
+            poller.cancel()
+
+    asyncio.run(run())
+    assert list(servers.rooms) == ["a/1"]
+
+
+def test_join_goes_to_the_rooms_server():
+    alpha, beta = Interface("Alpha", ["1"]), Interface("Beta", ["1"])
+    servers = pool(a=alpha, b=beta)
+    asyncio.run(servers.join_room("b/1"))
+    assert (alpha.joined, beta.joined) == ([], ["1"])
+
+
+def test_transport_reused_on_a_new_event_loop_closes_the_old_session(serve):
+    async def get_server_id(request):
+        return web.json_response({"server_id": "test"})
+
+    async def get(transport):
+        async with transport.get("/get_server_id") as response:
+            return response.status, transport.session
+
+    async def run():
+        async with serve([web.get("/get_server_id", get_server_id)]) as transport:
+            # Each menu runs its own event loop, the first one is stopped but not closed yet
+            loop = asyncio.new_event_loop()
+            try:
+                first_status, first = await asyncio.to_thread(loop.run_until_complete, get(transport))
+                second_status, second = await get(transport)
+                await asyncio.gather(*transport._closing)
+            finally:
+                loop.close()
+            return first_status, second_status, first, second, second.closed
+
+    first_status, second_status, first, second, second_closed = asyncio.run(run())
+    assert first_status == second_status == 200
+    assert first is not second
+    assert first.closed and not second_closed
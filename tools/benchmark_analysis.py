@@ -0,0 +1,76 @@
+"""
+Benchmarks the chess analysis engine on every variant the Chess room supports.
+Run from the repository root with: python -m tools.benchmark_analysis [--time SECONDS]
+"""
+import argparse
+import time
+
+import chess
+from rich.console import Console
+from rich.table import Table
+
+from game_rooms.Chess import Chess
+from game_rooms.ChessAnalysis import AnalysisEngine, Searcher
+
+# A few positions past the opening so captures and checks are in play, only used for the standard variant
+MIDDLEGAME_POSITIONS = [
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 0 10",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+
+def benchmark_positions():
+    positions = []
+    for variant in Chess.creation_args["chess_variant"]["options"]:
+        board_class, options = Chess.variant_boards[variant]
+        positions.append((variant, board_class(**options)))
+    for fen in MIDDLEGAME_POSITIONS:
+        positions.append(("Standard (middlegame)", chess.Board(fen)))
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--time", type=float, default=2.0, help="Search time per position in seconds")
+    args = parser.parse_args()
+
+    console = Console()
+    table = Table(title=f"Analysis benchmark ({args.time:.1f}s per position)")
+    for column in ["Position", "Best move", "Depth", "Nodes", "Nodes/s"]:
+        table.add_column(column)
+
+    total_nodes = 0
+    total_time = 0
+    for name, board in benchmark_positions():
+        result = Searcher(board, args.time).search()
+        if result is None:
+            table.add_row(name, "-", "-", "-", "-")
+            continue
+        total_nodes += result["nodes"]
+        total_time += result["time"]
+        table.add_row(name, result["san"], str(result["depth"]), str(result["nodes"]), str(result["nps"]))
+    console.print(table)
+    console.print(f"Average: {int(total_nodes / max(total_time, 1e-9))} nodes/s")
+
+    # Round trip through the worker process, including cancelling a search when the position changes
+    engine = AnalysisEngine(time_budget=args.time)
+    board = chess.Board()
+    start = time.monotonic()
+    engine.analyse(board)
+    board.push_san("e4")
+    engine.analyse(board)  # Cancels the search of the starting position
+    deadline = start + args.time * 2 + 30  # Generous, the worker process has to start first
+    while engine.poll() is None:
+        if time.monotonic() > deadline:
+            console.print("[red]The worker process didn't answer in time[/red]")
+            engine.shutdown()
+            return
+        time.sleep(0.01)
+    console.print(f"Process pool round trip: {time.monotonic() - start:.2f}s, "
+                  f"{engine.result['san']} at depth {engine.result['depth']}")
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Plays simulated Battleship games with the targeting engine and reports the shots needed to win and the time
+each decision takes. Run from the repository root with: python -m tools.benchmark_targeting [--games N]
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from game_rooms.Battleship import BattleShip
+from game_rooms.BattleshipBoard import EMPTY, HIT, MISS
+from game_rooms.BattleshipTargeting import TargetingEngine
+
+SCENARIOS = [(10, 5), (20, 7), (30, 10), (50, 5), (50, 12)]  # (board size, ship count)
+
+
+def fleet_sizes(ship_count):
+    """
+    The ship sizes for a fleet, cycling through the ship types from the carrier down
+    """
+    types = sorted(BattleShip.ship_types, reverse=True)
+    return [types[index % len(types)] for index in range(ship_count)]
+
+
+def random_fleet(size, ship_count, rng):
+    """
+    Places a fleet at random without overlaps
+    :return: The Ship objects and an array with the index of the ship on each tile (-1 for none)
+    """
+    occupied = np.full((size, size), -1, dtype=np.int16)
+    ships = []
+    for index, length in enumerate(fleet_sizes(ship_count)):
+        while True:
+            direction = "horizontal" if rng.integers(2) else "vertical"
+            x = int(rng.integers(size - length + 1 if direction == "horizontal" else size))
+            y = int(rng.integers(size if direction == "horizontal" else size - length + 1))
+            tiles = occupied[x:x + length, y] if direction == "horizontal" else occupied[x, y:y + length]
+            if (tiles == -1).all():
+                tiles[:] = index
+                ships.append(BattleShip.Ship(length, False, x, y, direction, placed=True))
+                break
+    return ships, occupied
+
+
+def play_game(engine, size, ship_count, rng):
+    """
+    :return: (shots fired, seconds spent per decision)
+    """
+    ships, occupied = random_fleet(size, ship_count, rng)
+    # What the engine sees, sunk ships reveal their position like they do on the server
+    seen = [BattleShip.Ship(ship.size, False) for ship in ships]
+    tiles = np.zeros((size, size), dtype=np.uint8)
+    hits_left = [ship.size for ship in ships]
+    decision_times = []
+    while any(hits_left):
+        start = time.perf_counter()
+        x, y = engine.choose(tiles, seen)
+        decision_times.append(time.perf_counter() - start)
+        assert tiles[x, y] == EMPTY
+        index = occupied[x, y]
+        if index == -1:
+            tiles[x, y] = MISS
+            continue
+        tiles[x, y] = HIT
+        hits_left[index] -= 1
+        if hits_left[index] == 0:
+            ship = ships[index]
+            seen[index].net_update(ship.size, True, True, ship.x, ship.y, ship.direction)
+    return len(decision_times), decision_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=50, help="Games per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    console = Console()
+    table = Table(title=f"Targeting benchmark ({args.games} games per scenario)")
+    for column in ["Board", "Ships", "Avg shots", "Shots / tiles", "Avg decision", "p95 decision"]:
+        table.add_column(column)
+    for size, ship_count in SCENARIOS:
+        rng = np.random.default_rng(args.seed)
+        engine = TargetingEngine(seed=args.seed)
+        shots = []
+        times = []
+        for _ in range(args.games):
+            game_shots, game_times = play_game(engine, size, ship_count, rng)
+            shots.append(game_shots)
+            times.extend(game_times)
+        times.sort()
+        table.add_row(f"{size}x{size}", str(ship_count), f"{statistics.mean(shots):.1f}",
+                      f"{statistics.mean(shots) / size ** 2:.1%}", f"{statistics.mean(times) * 1000:.2f}ms",
+                      f"{times[int(len(times) * 0.95)] * 1000:.2f}ms")
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
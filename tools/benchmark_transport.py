@@ -0,0 +1,122 @@
+"""
+Compares request latency and throughput to a server on the same machine over TCP loopback and over a Unix domain
+socket, both through RoomTransport's connection pool. The stand-in server runs in its own process and answers with a
+JSON body about the size of a room's state.
+Run from the repository root with: python -m tools.benchmark_transport [--requests N] [--concurrency N]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from aiohttp import web
+from rich.console import Console
+from rich.table import Table
+
+from game_rooms.RoomTransport import RoomTransport
+
+
+def serve(port, unix_path, payload_size, ready):
+    """
+    The stand-in server, listening on both the TCP port and the Unix socket
+    """
+    body = {"changed": True, "padding": "x" * payload_size}
+
+    async def state(request):
+        return web.json_response(body)
+
+    async def start():
+        app = web.Application()
+        app.router.add_get("/room/get_state", state)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        await web.UnixSite(runner, unix_path).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(start())
+
+
+async def measure_latency(transport, requests):
+    """
+    :return: Seconds taken by each request, sent one after another
+    """
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        async with transport.get("/room/get_state") as response:
+            await response.read()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+async def measure_throughput(transport, requests, concurrency):
+    """
+    :return: Requests answered per second with `concurrency` requests in flight
+    """
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            async with transport.get("/room/get_state") as response:
+                await response.read()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def run(host, port, args):
+    transport = RoomTransport(host, port, limit=args.concurrency)
+    try:
+        await measure_latency(transport, 50)  # Warm up, opening the connections
+        times = sorted(await measure_latency(transport, args.requests))
+        throughput = await measure_throughput(transport, args.requests, args.concurrency)
+    finally:
+        await transport.close()
+    return times, throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per measurement")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight for the throughput test")
+    parser.add_argument("--payload", type=int, default=2048, help="Bytes of padding in each reply")
+    parser.add_argument("--port", type=int, default=8790, help="TCP port for the stand-in server")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        unix_path = os.path.join(folder, "server.sock")
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(args.port, unix_path, args.payload, ready), daemon=True)
+        server.start()
+        try:
+            if not ready.wait(10):
+                raise Exception("The stand-in server didn't start")
+            results = {
+                "TCP loopback": asyncio.run(run("127.0.0.1", args.port, args)),
+                "Unix socket": asyncio.run(run(f"unix:{unix_path}", None, args)),
+            }
+        finally:
+            server.terminate()
+
+    table = Table(title=f"Transport benchmark ({args.requests} requests, {args.payload} byte replies, "
+                        f"{args.concurrency} in flight for throughput)")
+    for column in ["Transport", "Median", "p95", "p99", "Throughput", "vs TCP"]:
+        table.add_column(column)
+    tcp_throughput = results["TCP loopback"][1]
+    for name, (times, throughput) in results.items():
+        table.add_row(name, f"{statistics.median(times) * 1e6:.0f}µs", f"{times[int(len(times) * 0.95)] * 1e6:.0f}µs",
+                      f"{times[int(len(times) * 0.99)] * 1e6:.0f}µs", f"{throughput:.0f} req/s",
+                      f"{throughput / tcp_throughput:.2f}x")
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
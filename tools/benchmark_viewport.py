@@ -0,0 +1,87 @@
+"""
+Times drawing the Battleship UI on large boards, rendering only the visible window against rendering every tile.
+Run from the repository root with: python -m tools.benchmark_viewport [--frames N]
+"""
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from game_rooms.Battleship import BattleShip
+from tools.benchmark_targeting import random_fleet
+
+SIZES = [10, 50, 100, 200]
+
+
+def make_room(size, rng, width, height):
+    """
+    Builds a room in the middle of a game without a server, drawing into an off screen console
+    """
+    console = Console(file=io.StringIO(), width=width, height=height, color_system="truecolor")
+    room = BattleShip("benchmark", "localhost", 0, console)
+    room.board_size = size
+    room.place_ships = False
+    ship_count = max(5, size // 5)
+    room.player_ships, _ = random_fleet(size, ship_count, rng)
+    room.opponent_ships = [BattleShip.Ship(ship.size, False) for ship in room.player_ships]
+    tiles = rng.choice(np.array([0, 1, 2], dtype=np.uint8), size=(size, size), p=[0.7, 0.1, 0.2])
+    room.player_model.update({"board": tiles.tolist()})
+    room.opponent_model.update({"board": tiles.T.tolist()})
+    room.cursor = [size // 2, size // 2]
+    return room
+
+
+def time_frames(room, frames, full):
+    """
+    :param full: Renders every tile like the boards did before they were windowed
+    :return: Seconds spent on each frame, building the layout and rendering it
+    """
+    if full:
+        room.viewport_size = lambda: (room.board_size, room.board_size)
+    times = []
+    for frame in range(frames):
+        room.cursor[1] = (room.cursor[1] + (1 if frame % 2 else -1)) % room.board_size  # Move like a player would
+        start = time.perf_counter()
+        room.console.print(room.draw_ui())
+        times.append(time.perf_counter() - start)
+        room.console.file.seek(0)
+        room.console.file.truncate()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=20, help="Frames drawn per board size")
+    parser.add_argument("--width", type=int, default=200, help="Width of the off screen console")
+    parser.add_argument("--height", type=int, default=60, help="Height of the off screen console")
+    parser.add_argument("--full-limit", type=int, default=100, help="Largest board to also time without windowing")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    console = Console()
+    table = Table(title=f"Viewport benchmark ({args.frames} frames, {args.width}x{args.height} console)")
+    for column in ["Board", "Window", "Avg frame", "p95 frame", "Full board frame", "Speedup"]:
+        table.add_column(column)
+    for size in SIZES:
+        rng = np.random.default_rng(args.seed)
+        room = make_room(size, rng, args.width, args.height)
+        rows, columns = room.viewport_size()
+        times = sorted(time_frames(room, args.frames, False))
+        mean = statistics.mean(times)
+        full = "-"
+        speedup = "-"
+        if size <= args.full_limit:
+            full_mean = statistics.mean(time_frames(make_room(size, rng, args.width, args.height), args.frames, True))
+            full = f"{full_mean * 1000:.1f}ms"
+            speedup = f"{full_mean / mean:.1f}x"
+        table.add_row(f"{size}x{size}", f"{min(rows, size)}x{min(columns, size)}", f"{mean * 1000:.1f}ms",
+                      f"{times[int(len(times) * 0.95)] * 1000:.1f}ms", full, speedup)
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
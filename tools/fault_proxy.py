@@ -0,0 +1,514 @@
+"""
+A proxy that sits between the client and a server and makes the network worse on purpose: added latency and jitter,
+a bandwidth cap, lost requests and replies, and bursts of 5xx errors. HTTP goes through one port and the discovery
+datagrams through another.
+Point a client at a proxy in front of a server with:
+    python -m tools.fault_proxy serve --upstream HOST:PORT [--latency MS] [--jitter MS] [--bandwidth BYTES/S] [--loss P]
+Or measure how the client copes with each built in scenario, against a stand-in server unless --upstream is given:
+    python -m tools.fault_proxy scenarios [--rounds N]
+Run from the repository root.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import random
+import socket
+import statistics
+import time
+
+import aiohttp
+import chess
+from aiohttp import web
+from rich.console import Console
+from rich.table import Table
+
+from game_rooms.Chess import Chess
+from game_rooms.RoomTransport import RoomTransport
+
+# Headers that belong to one hop, aiohttp sets them again for the next one
+HOP_HEADERS = {"host", "connection", "keep-alive", "content-length", "transfer-encoding", "content-encoding"}
+
+
+class Faults:
+    """
+    What goes wrong on the network, and the dice that decide when
+    """
+
+    def __init__(self, latency=0, jitter=0, bandwidth=None, loss=0.0, error_rate=0.0, burst=2.0, error_status=503,
+                 hang=15.0, seed=None):
+        """
+        :param latency: Milliseconds added to every round trip
+        :param jitter: Up to this many milliseconds more or less latency, picked for each request
+        :param bandwidth: Bytes per second replies are sent at, None for no cap
+        :param loss: The chance a request or its reply is lost. HTTP runs over TCP, so a lost request hangs until the
+        client gives up, or for `hang` seconds before the connection is dropped
+        :param error_rate: The chance a request starts a burst of errors
+        :param burst: Seconds every request fails for once a burst starts, like a server that is down for a while
+        :param error_status: The status the failed requests get
+        :param hang: Seconds a lost request is held before its connection is dropped
+        :param seed: Seeds the dice so a scenario fails the same way every run
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.error_rate = error_rate
+        self.burst = burst
+        self.error_status = error_status
+        self.hang = hang
+        self.random = random.Random(seed)
+        self.errors_until = 0.0  # time.monotonic() the current burst ends
+
+    def delay(self, size=0):
+        """
+        :param size: Bytes sent, for the bandwidth cap
+        :return: Seconds to hold a request or datagram for
+        """
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)) / 1000
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        return delay
+
+    def lost(self):
+        return self.random.random() < self.loss
+
+    def error(self):
+        """
+        :return: The status to fail the request with, or None to let it through
+        """
+        now = time.monotonic()
+        if now >= self.errors_until and self.random.random() < self.error_rate:
+            self.errors_until = now + self.burst
+        return self.error_status if now < self.errors_until else None
+
+    def describe(self):
+        parts = []
+        if self.latency or self.jitter:
+            parts.append(f"{self.latency}±{self.jitter}ms")
+        if self.bandwidth:
+            parts.append(f"{self.bandwidth / 1000:g}KB/s")
+        if self.loss:
+            parts.append(f"{self.loss:.0%} loss")
+        if self.error_rate:
+            parts.append(f"{self.error_rate:.1%} chance of {self.burst:g}s of {self.error_status}s")
+        return ", ".join(parts) or "no faults"
+
+
+class HttpFaultProxy:
+    """
+    Forwards HTTP requests to the server, through the faults
+    """
+
+    def __init__(self, upstream_host, upstream_port, faults: Faults, port=0):
+        """
+        :param upstream_host: The server's host
+        :param upstream_port: The server's port
+        :param faults:
+        :param port: The port to listen on, 0 for any free port
+        """
+        self.faults = faults
+        self.port = port
+        self.transport = RoomTransport(upstream_host, upstream_port, timeout=60)
+        self.runner = None  # type: web.AppRunner or None
+        self.counts = {"forwarded": 0, "lost": 0, "errors": 0}
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+        self.port = self.runner.addresses[0][1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+        await self.transport.close()
+
+    async def drop(self, request):
+        """
+        Holds a lost request until the client gives up on it, then drops the connection
+        """
+        self.counts["lost"] += 1
+        await asyncio.sleep(self.faults.hang)
+        if request.transport is not None:  # None once the client has given up and closed the connection itself
+            request.transport.close()
+        return web.Response(status=504)  # Never arrives, the connection is already closed
+
+    async def handle(self, request: web.Request):
+        body = await request.read()
+        await asyncio.sleep(self.faults.delay(len(body)))
+        lost = self.faults.lost()
+        if lost and self.faults.random.random() < 0.5:
+            return await self.drop(request)  # The request never reached the server
+        status = self.faults.error()
+        if status is not None:
+            self.counts["errors"] += 1
+            return web.Response(status=status, text="Injected by the fault proxy")
+
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_HEADERS}
+        try:
+            async with self.transport.request(request.method, request.path_qs, headers=headers,
+                                              data=body or None) as upstream:
+                reply = await upstream.read()
+                reply_headers = {name: value for name, value in upstream.headers.items()
+                                 if name.lower() not in HOP_HEADERS}
+                reply_status = upstream.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return web.Response(status=502, text=f"Upstream failed: {str(e) or type(e).__name__}")
+        self.counts["forwarded"] += 1
+        if lost:
+            return await self.drop(request)  # The server acted on the request, but the reply never arrives
+
+        response = web.StreamResponse(status=reply_status, headers=reply_headers)
+        response.content_length = len(reply)
+        await response.prepare(request)
+        if self.faults.bandwidth:
+            # Trickled out in pieces so the client sees a slow link rather than one long pause
+            chunk = max(1, self.faults.bandwidth // 20)
+            for start in range(0, len(reply), chunk):
+                await response.write(reply[start:start + chunk])
+                await asyncio.sleep(len(reply[start:start + chunk]) / self.faults.bandwidth)
+        else:
+            await response.write(reply)
+        await response.write_eof()
+        return response
+
+
+class DatagramRelay(asyncio.DatagramProtocol):
+    def __init__(self, received):
+        self.received = received
+
+    def datagram_received(self, data, addr):
+        self.received(data, addr)
+
+
+class UdpFaultProxy:
+    """
+    Relays datagrams to the server's discovery port and its replies back, dropping and delaying them
+    """
+
+    def __init__(self, upstream_host, upstream_port, faults: Faults, port=0):
+        self.upstream = (upstream_host, upstream_port)
+        self.faults = faults
+        self.port = port
+        self.listener = None  # type: asyncio.DatagramTransport or None
+        self.relays = {}  # type: dict[tuple, asyncio.DatagramTransport] # Client address -> its socket to the server
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.listener, _ = await loop.create_datagram_endpoint(
+            lambda: DatagramRelay(self.from_client), local_addr=("127.0.0.1", self.port))
+        self.port = self.listener.get_extra_info("sockname")[1]
+
+    def stop(self):
+        for relay in self.relays.values():
+            relay.close()
+        self.listener.close()
+
+    def send_later(self, transport, data, addr):
+        if self.faults.lost():
+            return
+        asyncio.get_running_loop().call_later(self.faults.delay(len(data)), transport.sendto, data, addr)
+
+    def from_client(self, data, client):
+        relay = self.relays.get(client)
+        if relay is None:
+            asyncio.ensure_future(self.open_relay(client, data))
+        else:
+            self.send_later(relay, data, self.upstream)
+
+    async def open_relay(self, client, data):
+        relay, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: DatagramRelay(lambda reply, _: self.send_later(self.listener, reply, client)),
+            remote_addr=self.upstream)
+        self.relays[client] = relay
+        self.send_later(relay, data, None)
+
+
+def serve_stand_in(port, udp_port, ready):
+    """
+    A server with just enough of the real one's API for the scenarios: logging in, one chess room and discovery.
+    Every other poll reports the room as changed, and the moves it receives are counted
+    """
+    moves = {"count": 0}
+    polls = {"count": 0}
+    board = chess.Board()
+    state = {"variant": "Standard", "board": board.epd(), "current_player": True, "your_color": True,
+             "last_move": None, "state": "Playing", "timers_enabled": False, "taken_pieces": {"white": [], "black": []},
+             "padding": "x" * 4096}  # About the size of a full room state with its players and history
+
+    async def get_server_id(request):
+        return web.json_response({"server_id": "stand-in", "server_name": "Stand-in"})
+
+    async def login(request):
+        return web.json_response({"username": "fault-proxy"})
+
+    async def has_changed(request):
+        polls["count"] += 1
+        return web.json_response({"changed": polls["count"] % 2 == 0})
+
+    async def get_state(request):
+        return web.json_response(state)
+
+    async def make_move(request):
+        await request.json()
+        moves["count"] += 1
+        return web.json_response({"ok": True})
+
+    async def stats(request):
+        reply = {"moves": moves["count"]}
+        if "reset" in request.query:
+            moves["count"] = 0
+        return web.json_response(reply)
+
+    class Discovery(asyncio.DatagramProtocol):
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            if data == b"DISCOVER_GAME_SERVER":
+                reply = {"server_id": "stand-in", "server_name": "Stand-in", "host": ["127.0.0.1"], "port": port}
+                self.transport.sendto(json.dumps(reply).encode(), addr)
+
+    async def start():
+        app = web.Application()
+        app.router.add_get("/get_server_id", get_server_id)
+        app.router.add_get("/login/{user_hash}", login)
+        app.router.add_get("/room/has_changed", has_changed)
+        app.router.add_get("/room/get_state", get_state)
+        app.router.add_post("/room/make_move", make_move)
+        app.router.add_get("/stats", stats)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        await asyncio.get_running_loop().create_datagram_endpoint(Discovery, local_addr=("127.0.0.1", udp_port))
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(start())
+
+
+SCENARIOS = {
+    "baseline": Faults(),
+    "high latency": Faults(latency=250, jitter=50),
+    "jitter": Faults(latency=60, jitter=300),
+    "slow link": Faults(latency=80, bandwidth=8000),
+    "lossy": Faults(latency=40, loss=0.05),
+    "5xx bursts": Faults(latency=20, error_rate=0.01, burst=1.0),
+}
+
+
+class ErrorCounter(logging.Handler):
+    """
+    Counts the errors the rooms log, get_board reports its failures this way rather than to its caller
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+class Scenario:
+    """
+    Runs the client's own code for polling a chess room, sending moves, logging in and discovery through the proxy,
+    timing every call. A call taking longer than `stall` seconds counts as a stall: the room's frame loop awaits
+    get_board, so a slow poll freezes the room's screen
+    """
+
+    def __init__(self, name, faults: Faults, upstream, udp_upstream, user_hash, rounds=30, stall=0.5):
+        self.name = name
+        self.faults = faults
+        self.upstream = upstream
+        self.udp_upstream = udp_upstream
+        self.user_hash = user_hash
+        self.rounds = rounds
+        self.stall = stall
+        self.results = {}  # type: dict[str, list[tuple[float, bool]]] # Operation -> (seconds, succeeded) per call
+        self.moves_sent = 0
+        self.moves_applied = None  # Moves the stand-in server received, None for other servers
+
+    async def timed(self, operation, call, interval=0.25):
+        results = self.results[operation] = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            try:
+                succeeded = await call()
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError):
+                succeeded = False
+            results.append((time.perf_counter() - start, succeeded))
+            await asyncio.sleep(interval)
+
+    async def run(self):
+        http = HttpFaultProxy(*self.upstream, self.faults)
+        udp = UdpFaultProxy(*self.udp_upstream, self.faults)
+        await http.start()
+        await udp.start()
+        room = Chess(self.user_hash, "127.0.0.1", http.port, Console(file=io.StringIO()))
+        room.bell_enabled = False
+        login_transport = RoomTransport("127.0.0.1", http.port)
+        errors = ErrorCounter()
+        # With a handler on the root logger the errors are counted instead of printed over the table
+        root = logging.getLogger()
+        level = root.level
+        root.addHandler(errors)
+        root.setLevel(logging.ERROR)
+
+        async def get_board():
+            before = errors.count
+            await room.get_board()
+            # Skipped while the circuit breaker is open, which is quick but no more up to date
+            return errors.count == before and room.connection_status() is None
+
+        async def send_move():
+            self.moves_sent += 1
+            return await room.send_move(chess.Move.from_uci("e2e4"))
+
+        async def login():
+            # The requests ServerInterface.connect makes
+            async with login_transport.get("/get_server_id") as response:
+                if response.status != 200:
+                    return False
+                await response.json()
+            async with login_transport.get(f"/login/{self.user_hash}") as response:
+                return response.status == 200
+
+        async def discover():
+            # As main.multicast_discovery does it, waiting up to a second for a reply
+            def ask():
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.settimeout(1)
+                    sock.sendto(b"DISCOVER_GAME_SERVER", ("127.0.0.1", udp.port))
+                    try:
+                        return "server_id" in json.loads(sock.recvfrom(1024)[0].decode())
+                    except socket.timeout:
+                        return False
+            return await asyncio.get_running_loop().run_in_executor(None, ask)
+
+        try:
+            await asyncio.gather(self.timed("get_board", get_board), self.timed("send_move", send_move),
+                                 self.timed("login", login), self.timed("discovery", discover))
+            self.moves_applied = await self.server_moves()
+        finally:
+            root.removeHandler(errors)
+            root.setLevel(level)
+            await room.transport.close()
+            await login_transport.close()
+            udp.stop()
+            await http.stop()
+        return self
+
+    async def server_moves(self):
+        transport = RoomTransport(*self.upstream)
+        try:
+            async with transport.get("/stats?reset") as response:
+                return (await response.json())["moves"] if response.status == 200 else None
+        except (aiohttp.ClientError, ValueError, KeyError):
+            return None
+        finally:
+            await transport.close()
+
+    def rows(self):
+        for operation, results in self.results.items():
+            times = sorted(seconds for seconds, _ in results)
+            succeeded = sum(1 for _, ok in results if ok)
+            stalls = [seconds for seconds in times if seconds > self.stall]
+            notes = ""
+            if operation == "send_move" and self.moves_applied is not None:
+                # More applied than accepted means a move went through but the client was told it didn't
+                notes = f"{self.moves_applied} applied"
+            yield (operation, f"{succeeded}/{len(results)}", f"{statistics.median(times) * 1000:.0f}ms",
+                   f"{times[min(len(times) - 1, round(0.95 * (len(times) - 1)))] * 1000:.0f}ms",
+                   f"{times[-1] * 1000:.0f}ms", f"{len(stalls)} ({sum(stalls):.1f}s)", notes)
+
+
+async def run_scenarios(args, upstream, udp_upstream):
+    table = Table(title=f"Client under network faults ({args.rounds} calls each, stall > {args.stall * 1000:.0f}ms)")
+    for column in ["Scenario", "Operation", "OK", "Median", "p95", "Max", "Stalls", "Notes"]:
+        table.add_column(column, no_wrap=column != "Scenario", min_width=14 if column == "Scenario" else None)
+    console = Console()
+    for name, faults in SCENARIOS.items():
+        if args.only and name not in args.only:
+            continue
+        faults.random.seed(args.seed)
+        with console.status(f"[bold green]Running {name} ({faults.describe()})...[/bold green]"):
+            scenario = await Scenario(name, faults, upstream, udp_upstream, args.user_hash, args.rounds,
+                                      args.stall).run()
+        for index, row in enumerate(scenario.rows()):
+            table.add_row(f"{name}\n[dim]{faults.describe()}[/dim]" if index == 0 else "", *row,
+                          end_section=index == len(scenario.results) - 1)
+    console.print(table)
+
+
+async def serve(args, upstream, udp_upstream):
+    faults = Faults(args.latency, args.jitter, args.bandwidth, args.loss, args.error_rate, args.burst, seed=args.seed)
+    http = HttpFaultProxy(*upstream, faults, args.listen)
+    udp = UdpFaultProxy(*udp_upstream, faults, args.listen)
+    await http.start()
+    await udp.start()
+    console = Console()
+    console.print(f"Proxying 127.0.0.1:{http.port} to {upstream[0]}:{upstream[1]} with {faults.describe()}, "
+                  f"Ctrl+C to stop")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            console.print(" ".join(f"{name}: {count}" for name, count in http.counts.items()))
+    finally:
+        udp.stop()
+        await http.stop()
+
+
+def address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["serve", "scenarios"])
+    parser.add_argument("--upstream", type=address, help="HOST:PORT of the server, a stand-in is started if not given")
+    parser.add_argument("--discovery-port", type=int, default=5007, help="The server's discovery port")
+    parser.add_argument("--user-hash", default="fault-proxy", help="A user of the server to log in and play as")
+    parser.add_argument("--seed", type=int, default=1, help="Seeds the faults so runs can be compared")
+    serving = parser.add_argument_group("serve")
+    serving.add_argument("--listen", type=int, default=9000, help="The port to listen on for HTTP and discovery")
+    serving.add_argument("--latency", type=float, default=0, help="Milliseconds added to each round trip")
+    serving.add_argument("--jitter", type=float, default=0, help="Milliseconds of random latency either way")
+    serving.add_argument("--bandwidth", type=int, default=None, help="Bytes per second replies are sent at")
+    serving.add_argument("--loss", type=float, default=0.0, help="Chance a request or reply is lost")
+    serving.add_argument("--error-rate", type=float, default=0.0, help="Chance a request starts a burst of 5xx")
+    serving.add_argument("--burst", type=float, default=2.0, help="Seconds a burst of 5xx lasts")
+    scenarios = parser.add_argument_group("scenarios")
+    scenarios.add_argument("--rounds", type=int, default=30, help="Calls of each operation per scenario")
+    scenarios.add_argument("--stall", type=float, default=0.5, help="Seconds after which a call counts as a stall")
+    scenarios.add_argument("--only", nargs="*", choices=list(SCENARIOS), help="Run just these scenarios")
+    args = parser.parse_args()
+
+    stand_in = None
+    if args.upstream is None:
+        upstream, udp_upstream = ("127.0.0.1", 8791), ("127.0.0.1", 8792)
+        ready = multiprocessing.Event()
+        stand_in = multiprocessing.Process(target=serve_stand_in, args=(*upstream[1:], udp_upstream[1], ready),
+                                           daemon=True)
+        stand_in.start()
+        if not ready.wait(10):
+            raise Exception("The stand-in server didn't start")
+    else:
+        upstream, udp_upstream = args.upstream, (args.upstream[0], args.discovery_port)
+    try:
+        asyncio.run(run_scenarios(args, upstream, udp_upstream) if args.mode == "scenarios"
+                    else serve(args, upstream, udp_upstream))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stand_in is not None:
+            stand_in.terminate()
+
+
+if __name__ == "__main__":
+    main()
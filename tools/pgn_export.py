@@ -0,0 +1,313 @@
+"""
+Exports the saved games in the saves folder to a PGN archive and analyses them in parallel.
+Games are resolved from the state cache the Chess room writes next to each save, falling back to the server's
+saved game info. Games are streamed to the archive and to the analysis workers one at a time.
+Run from the repository root with: python -m tools.pgn_export [options]
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+from rich.console import Console
+from rich.table import Table
+
+from game_rooms.Chess import Chess, players_by_color
+from game_rooms.ChessAnalysis import MATE_THRESHOLD, Searcher, terminal_score
+from game_rooms.ChessBook import OpeningBook
+from game_rooms.RoomTransport import RoomTransport
+
+INACCURACY, MISTAKE, BLUNDER = 50, 100, 300  # Centipawn loss thresholds
+SCORE_CAP = 1000  # Evaluations are capped so a missed mate doesn't swamp the averages
+
+_book = None  # Opened once per worker process
+
+
+def saved_rooms(save_dir):
+    """
+    Lists the saved rooms without reading any of the games
+    :param save_dir:
+    :return: (room id, state cache path) pairs, none if nothing has been saved yet
+    """
+    if not os.path.isdir(save_dir):
+        return
+    for file in sorted(os.listdir(save_dir)):
+        if file.endswith(".room"):
+            path = os.path.join(save_dir, file)
+            with open(path, "r") as f:
+                room_id = f.read().strip()
+            yield room_id, os.path.splitext(path)[0] + ".state"
+
+
+def game_from_position(variant, fen, moves, headers):
+    """
+    Builds a PGN game from a starting position and a list of UCI moves
+    :return: The game's PGN text
+    """
+    board_class, options = Chess.variant_boards.get(variant, (chess.Board, {}))
+    board = board_class(fen, **options) if fen else board_class(**options)
+    for uci in moves:
+        board.push_uci(uci)
+    game = chess.pgn.Game.from_board(board)  # Sets the Variant, FEN and Result headers
+    game.headers.update({key: value for key, value in headers.items() if value})
+    return str(game)
+
+
+def game_from_state(state):
+    color = {"White": chess.WHITE, "Black": chess.BLACK}.get(state.get("your_color"))
+    # Older caches have no username, their players can't be told apart and are left out
+    white, black = players_by_color(state.get("players", []), state.get("username"), color)
+    date = state.get("date", "")[:10].replace("-", ".")
+    return game_from_position(state["variant"], state["fen"], state["moves"], {
+        "Event": state.get("room_name"),
+        "Site": state.get("room_id"),
+        "Date": date,
+        "White": white,
+        "Black": black,
+    })
+
+
+def game_from_save_info(room_id, info):
+    """
+    Builds a game from the server's saved game info, which only works if the server includes the position
+    :return: The game's PGN text or None
+    """
+    if info is None or info.get("room_type") != "Chess" or "board" not in info:
+        return None
+    users = [user["username"] if isinstance(user, dict) else str(user) for user in info.get("users", [])]
+    return game_from_position(info.get("variant", "Standard"), info["board"], info.get("moves", []), {
+        "Event": info.get("name"),
+        "Site": room_id,
+        "White": users[0] if len(users) > 0 else None,
+        "Black": users[1] if len(users) > 1 else None,
+    })
+
+
+def parse_server(server):
+    """
+    :param server: host:port, or unix:/path/to/socket for a server on this machine
+    :return: (host, port) as RoomTransport takes them
+    """
+    if server.startswith("unix:"):
+        return server, None
+    host, _, port = server.rpartition(":")
+    return host, port
+
+
+async def resolve_game(transport, user_hash, room_id, state_path):
+    try:
+        if os.path.exists(state_path):
+            with open(state_path, "r") as file:
+                return game_from_state(json.load(file))
+        if transport is None:
+            return None
+        async with transport.get(f"/room/get_saved_info/{room_id}", user_hash) as response:
+            if response.status != 200:
+                return None
+            return game_from_save_info(room_id, await response.json())
+    except Exception as e:
+        print(f"Error resolving {room_id}: {e}")
+        return None
+
+
+async def resolve_games(save_dir, server, user_hash, concurrency):
+    """
+    Resolves the saved rooms into PGN games, a few at a time so only a small window of games is ever held
+    :return: An async generator of PGN texts
+    """
+    # The same pooled, retrying transport the client uses, one connection per request in flight
+    transport = RoomTransport(*parse_server(server), limit=concurrency) if server else None
+    try:
+        window = []
+        for room_id, state_path in saved_rooms(save_dir):
+            window.append(asyncio.ensure_future(resolve_game(transport, user_hash, room_id, state_path)))
+            if len(window) >= concurrency:
+                for task in window:
+                    pgn = await task
+                    if pgn is not None:
+                        yield pgn
+                window = []
+        for task in window:
+            pgn = await task
+            if pgn is not None:
+                yield pgn
+    finally:
+        if transport is not None:
+            await transport.close()
+
+
+def win_percent(score):
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * score)) - 1)
+
+
+def position_score(board, depth, time_budget):
+    """
+    :return: The capped score of a position from the side to move
+    """
+    result = Searcher(board, time_budget, max_depth=depth).search()
+    score = result["score"] if result is not None else terminal_score(board, 0)
+    if abs(score) > MATE_THRESHOLD:
+        score = SCORE_CAP if score > 0 else -SCORE_CAP
+    return max(-SCORE_CAP, min(SCORE_CAP, score))
+
+
+def game_statistics(pgn, depth, time_budget):
+    """
+    Analyses one game, runs in a worker process
+    :param pgn: The game's PGN text
+    :param depth: The search depth for every position
+    :param time_budget: The most time a single position may take
+    :return: A dict of per player statistics and the game's opening
+    """
+    global _book
+    if _book is None:
+        _book = OpeningBook()
+    game = chess.pgn.read_game(io.StringIO(pgn))
+    board = game.board()
+    stats = {color: {"player": game.headers.get(color, "?"), "accuracy": [], "inaccuracies": 0, "mistakes": 0,
+                     "blunders": 0} for color in ("White", "Black")}
+    opening = game.headers.get("Opening")
+    first_moves = []
+
+    before = position_score(board, depth, time_budget)
+    for move in game.mainline_moves():
+        mover = "White" if board.turn == chess.WHITE else "Black"
+        if len(first_moves) < 4:
+            first_moves.append(board.san(move))
+        board.push(move)
+        after = -position_score(board, depth, time_budget)  # From the mover's side
+        loss = max(0, before - after)
+        accuracy = 103.1668 * math.exp(-0.04354 * max(0.0, win_percent(before) - win_percent(after))) - 3.1669
+        stats[mover]["accuracy"].append(max(0.0, min(100.0, accuracy)))
+        if loss >= BLUNDER:
+            stats[mover]["blunders"] += 1
+        elif loss >= MISTAKE:
+            stats[mover]["mistakes"] += 1
+        elif loss >= INACCURACY:
+            stats[mover]["inaccuracies"] += 1
+        if type(board) is chess.Board and _book.name_paths:
+            eco, name = _book.opening_name(board)
+            if name is not None:
+                opening = f"{eco} {name}"
+        before = -after
+
+    for color in stats.values():
+        moves = color["accuracy"]
+        color["moves"] = len(moves)
+        color["accuracy"] = sum(moves) / len(moves) if moves else None
+    return {"players": list(stats.values()), "opening": opening or " ".join(first_moves) or "(no moves)"}
+
+
+class Totals:
+    """
+    Running totals over every analysed game, so no per game results are kept
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.players = {}
+        self.openings = Counter()
+
+    def add(self, result):
+        self.games += 1
+        self.openings[result["opening"]] += 1
+        for stats in result["players"]:
+            player = self.players.setdefault(stats["player"], {"games": 0, "accuracy_sum": 0.0, "accuracy_games": 0,
+                                                              "inaccuracies": 0, "mistakes": 0, "blunders": 0})
+            player["games"] += 1
+            if stats["accuracy"] is not None:
+                player["accuracy_sum"] += stats["accuracy"]
+                player["accuracy_games"] += 1
+            for key in ("inaccuracies", "mistakes", "blunders"):
+                player[key] += stats[key]
+
+    def print(self, console, top_openings):
+        table = Table(title=f"Players ({self.games} games)")
+        for column in ["Player", "Games", "Accuracy", "Inaccuracies", "Mistakes", "Blunders"]:
+            table.add_column(column)
+        for name, player in sorted(self.players.items(), key=lambda item: item[1]["games"], reverse=True):
+            accuracy = player["accuracy_sum"] / player["accuracy_games"] if player["accuracy_games"] else None
+            table.add_row(name, str(player["games"]), f"{accuracy:.1f}%" if accuracy is not None else "-",
+                          str(player["inaccuracies"]), str(player["mistakes"]), str(player["blunders"]))
+        console.print(table)
+        table = Table(title="Openings")
+        table.add_column("Opening")
+        table.add_column("Games")
+        for opening, count in self.openings.most_common(top_openings):
+            table.add_row(opening, str(count))
+        console.print(table)
+
+
+async def export(args, console):
+    if not os.path.isdir(args.saves):
+        console.print(f"[yellow]No saved games, {args.saves} doesn't exist yet[/yellow]")
+        return
+    totals = Totals()
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(max_workers=args.workers) if args.analyse else None
+    in_flight = set()
+    exported = 0
+
+    async def collect(wait_for):
+        nonlocal in_flight
+        done, in_flight = await asyncio.wait(in_flight, return_when=wait_for)
+        for task in done:
+            try:
+                totals.add(task.result())
+            except Exception as e:
+                console.print(f"[red]Error analysing game: {e}[/red]")
+
+    try:
+        with open(args.output, "w") as archive:
+            async for pgn in resolve_games(args.saves, args.server, args.user_hash, args.concurrency):
+                archive.write(pgn + "\n\n")
+                exported += 1
+                if pool is None:
+                    continue
+                in_flight.add(loop.run_in_executor(pool, game_statistics, pgn, args.depth, args.time))
+                if len(in_flight) >= args.workers * 2:  # Keeps every worker busy without queueing every game
+                    await collect(asyncio.FIRST_COMPLETED)
+        if in_flight:
+            await collect(asyncio.ALL_COMPLETED)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    console.print(f"Exported {exported} games to {args.output}")
+    if pool is not None:
+        totals.print(console, args.top_openings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--saves", default="saves", help="The folder with the .room save files")
+    parser.add_argument("--output", default="games.pgn", help="The PGN archive to write")
+    parser.add_argument("--server", help="host:port (or unix:/path/to/socket) of the server to ask for games "
+                                         "without a state cache")
+    parser.add_argument("--user-hash", help="The user hash to use with --server, defaults to the one in servers.json")
+    parser.add_argument("--concurrency", type=int, default=8, help="Saved game info requests in flight at once")
+    parser.add_argument("--no-analysis", dest="analyse", action="store_false", help="Only export the games")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Analysis processes")
+    parser.add_argument("--depth", type=int, default=3, help="Search depth for every position")
+    parser.add_argument("--time", type=float, default=0.25, help="Most seconds spent on a single position")
+    parser.add_argument("--top-openings", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.server and not args.user_hash and os.path.exists("servers.json"):
+        host, port = parse_server(args.server)
+        with open("servers.json", "r") as file:
+            for server in json.load(file).values():
+                if server.get("host") == host and (port is None or str(server.get("port")) == port):
+                    args.user_hash = server.get("user_hash")
+
+    asyncio.run(export(args, Console()))
+
+
+if __name__ == "__main__":
+    main()